@@ -0,0 +1,116 @@
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from app.core.config import settings
+from app.core.logger import logger
+
+
+# ==================================================
+# TOKEN BUCKET
+# ==================================================
+class TokenBucket:
+    """Token bucket klasik: isi ulang `rate` token/detik sampai `burst`."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = max(0.0, float(rate))
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def has(self, n: float = 1.0) -> bool:
+        """Cek tanpa mengambil token (untuk admit atomik lintas beberapa bucket)."""
+        self._refill()
+        return self.tokens >= n
+
+    def take(self, n: float = 1.0) -> bool:
+        self._refill()
+        if self.tokens >= n:
+            self.tokens -= n
+            return True
+        return False
+
+
+# ==================================================
+# ADMISSION CONTROL (depan jalur LLM)
+# ==================================================
+_SHED_REASON: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("shed_reason", default=None)
+
+
+class AdmissionController:
+    """
+    Batas masuk request yang butuh LLM:
+    - bucket per session_id (atau IP kalau tanpa sesi), disimpan LRU
+    - bucket global untuk seluruh proses
+    Request yang ditolak tidak antri: langsung dijawab deterministik (calc/fallback).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._global = TokenBucket(settings.ADMISSION_GLOBAL_RPS, settings.ADMISSION_GLOBAL_BURST)
+        self._sessions: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.admitted = 0
+        self.shed: Dict[str, int] = {"session_rate": 0, "global_rate": 0, "queue_full": 0, "deadline": 0}
+
+    def _session_bucket(self, key: str) -> TokenBucket:
+        bucket = self._sessions.get(key)
+        if bucket is None:
+            bucket = TokenBucket(settings.ADMISSION_SESSION_RPS, settings.ADMISSION_SESSION_BURST)
+            self._sessions[key] = bucket
+            while len(self._sessions) > max(1, settings.ADMISSION_MAX_SESSIONS):
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(key)
+        return bucket
+
+    def admit(self, key: Optional[str]) -> Optional[str]:
+        """Return None kalau boleh pakai LLM, atau alasan penolakan."""
+        if not settings.ADMISSION_ENABLED:
+            return None
+        with self._lock:
+            # cek sesi dulu supaya satu klien yang cerewet tidak menghabiskan token global;
+            # token baru diambil kalau kedua bucket lolos -> request yang di-shed tidak memakan kuota apa pun
+            session = self._session_bucket(key or "anonymous")
+            if not session.has():
+                reason = "session_rate"
+            elif not self._global.has():
+                reason = "global_rate"
+            else:
+                session.take()
+                self._global.take()
+                self.admitted += 1
+                return None
+            self.shed[reason] += 1
+        logger.warning(f"Admission: request {key or 'anonymous'} di-shed ({reason}), jawab tanpa LLM.")
+        return reason
+
+    def record_shed(self, reason: str) -> None:
+        with self._lock:
+            self.shed[reason] = self.shed.get(reason, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.ADMISSION_ENABLED,
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+            "sessions_tracked": len(self._sessions),
+            "global_tokens": round(self._global.tokens, 2),
+        }
+
+
+admission = AdmissionController()
+
+
+def mark_shed(reason: str) -> None:
+    """Tandai request (task) saat ini dijawab tanpa LLM karena admission/antrian."""
+    _SHED_REASON.set(reason)
+
+
+def current_shed_reason() -> Optional[str]:
+    return _SHED_REASON.get()
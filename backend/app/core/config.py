@@ -15,12 +15,36 @@ class Settings(BaseSettings):
     # === CHROMA ===
     CHROMA_PATH: str = Field("./db", description="Folder penyimpanan ChromaDB")
     CHROMA_COLLECTION: str = Field("strava_club", description="Nama koleksi ChromaDB")
+    SCAN_PAGE_SIZE: int = Field(500, description="Jumlah dokumen per halaman saat scan/hapus seluruh koleksi")
+    REINDEX_BATCH_SIZE: int = Field(64, description="Jumlah dokumen per batch embed/upsert saat reindex")
+    REINDEX_KEEP_VERSIONS: int = Field(1, description="Versi koleksi lama yang disimpan saat GC (di luar aktif & previous)")
 
     # === GOOGLE SHEET ===
     GSHEET_NAME: str = Field("StravaClubData", description="Nama file Google Sheet")
     GSHEET_TAB: str = Field("ClubActivities", description="Nama tab di Google Sheet")
     GSHEET_CRED_FILE: str = Field("credentials.json", description="File kredensial Google API")
     GSHEET_ID: str = Field("", description="ID Google Sheet (opsional, gunakan ini untuk menghindari Drive API)")
+    SHEET_SOURCE_FILE: str = Field("", description="File lokal CSV/JSON/JSONL pengganti Google Sheet (opsional; dev/load test)")
+    SYNC_STATE_DB: str = Field("./cache/sync_state.db", description="File SQLite untuk state sinkronisasi (hash, watermark, riwayat run)")
+    SYNC_BATCH_SIZE: int = Field(32, description="Jumlah member per batch embed/upsert saat sync")
+    SYNC_RUN_STALE_SECONDS: int = Field(21600, description="Run sync 'running' tanpa pemilik yang bisa dicek (proses/host lain) dianggap terputus setelah N detik")
+
+    # === INDEX ARTIFACT (cold start) ===
+    ARTIFACT_DIR: str = Field("./artifacts", description="Folder artifact index berversi (reset_db.py --export/--import)")
+    ARTIFACT_IMPORT_ON_STARTUP: bool = Field(True, description="Saat warmup, muat artifact terbaru kalau store lokal kosong/lebih lama")
+
+    # === SYNC SCHEDULER (in-process) ===
+    SYNC_SCHEDULER_ENABLED: bool = Field(False, description="Sync sheet -> Chroma otomatis berkala di dalam proses API")
+    SYNC_INTERVAL_SECONDS: int = Field(900, description="Interval sync terjadwal (detik)")
+    SYNC_JITTER_SECONDS: int = Field(60, description="Jitter acak ± detik per tick (hindari semua worker/klub serentak)")
+    SYNC_LEADER_LEASE_SECONDS: int = Field(0, description="TTL lease leader antar worker (detik); 0 = 2x (interval + jitter)")
+    SYNC_FULL_EVERY: int = Field(12, description="Paksa sync penuh tiap N tick walau probe tidak berubah (0 = tidak pernah)")
+    SYNC_SCHEDULER_CLUBS: str = Field("", description="Daftar klub (koma) yang di-sync terjadwal; kosong = semua klub")
+    DATA_MARKER_CHECK_SECONDS: float = Field(5.0, description="Jeda minimum cek penanda data bersama per klub (sync/reindex di worker lain); 0 = hanya dari scheduler")
+
+    # === MULTI-CLUB (tenant) ===
+    TENANTS_FILE: str = Field("", description="File JSON daftar klub {club_id: {gsheet_id, gsheet_tab, gsheet_name, source_file, collection}}")
+    TENANT_CACHE_MAX: int = Field(32, description="Jumlah klub yang state-nya (handle koleksi, index, cache) disimpan di memori (LRU)")
 
     # === EMBEDDING MODEL ===
     EMBEDDING_MODEL: str = Field(
@@ -28,14 +52,84 @@ class Settings(BaseSettings):
         description="Model untuk embedding teks",
     )
 
+    # === EMBEDDING CACHE (dokumen) ===
+    EMBEDDING_CACHE_ENABLED: bool = Field(True, description="Cache embedding dokumen di disk (key = hash model + teks); sync/reindex hanya encode teks baru")
+    EMBEDDING_CACHE_DB: str = Field("./cache/embedding_cache.db", description="File SQLite cache embedding dokumen")
+    EMBEDDING_CACHE_MAX_MB: float = Field(256.0, description="Batas ukuran cache embedding (MB); lewat batas -> entri LRU dibuang")
+
+    # === RETRIEVAL ===
+    RETRIEVAL_BACKEND: str = Field("chroma", description="Backend retrieval: chroma | numpy")
+    NUMPY_INDEX_MAX_DOCS: int = Field(5000, description="Batas jumlah dokumen untuk index NumPy; di atasnya fallback ke Chroma")
+    NUMPY_INDEX_DIR: str = Field("./cache/np_index", description="Folder file index NumPy (memory-mappable)")
+    NUMPY_INDEX_QUANTIZATION: str = Field("none", description="First-pass index NumPy: none | int8 | binary (kode di RAM, rerank exact dari float32 memmap)")
+    NUMPY_INDEX_RERANK_FACTOR: int = Field(8, description="Kandidat first-pass = top_k x faktor (min 32) yang di-rerank exact")
+    DATE_PARSER_FALLBACK: bool = Field(True, description="Pakai dateparser untuk frasa tanggal di luar pola cepat (\"sejak 17 agustus\" dll)")
+
     # === APP SETTINGS ===
     PORT: int = Field(8000, description="Port FastAPI")
     HOST: str = Field("0.0.0.0", description="Host FastAPI")
+    GZIP_MIN_BYTES: int = Field(1024, description="Response di atas ukuran ini (byte) dikompres gzip")
+    COMPACT_SNIPPET_LINES: int = Field(3, description="Jumlah baris aktivitas per konteks di mode compact")
+    COMPACT_SNIPPET_MAX_CHARS: int = Field(300, description="Panjang maksimal cuplikan per konteks di mode compact")
+    WARMUP_ENABLED: bool = Field(True, description="Preload model/koleksi/index saat startup; /health/ready 503 sampai selesai")
 
     # === LLM SETTINGS ===
     LLM_PROVIDER: str = Field("none", description="Penyedia LLM: groq | openai | none")
     OPENAI_MODEL: str = Field("gpt-4o-mini", description="Model OpenAI default")
     GROQ_MODEL: str = Field("llama-3.1-8b-instant", description="Model Groq default")
+    OPENAI_BASE_URL: str = Field("", description="Base URL OpenAI-compatible (opsional, mis. stub lokal)")
+    GROQ_BASE_URL: str = Field("", description="Base URL Groq (opsional, mis. stub lokal)")
+    LLM_TIMEOUT_SECONDS: float = Field(15.0, description="Timeout per panggilan LLM (detik)")
+    LLM_MAX_RETRIES: int = Field(2, description="Jumlah retry (dengan jitter) untuk error sementara")
+    LLM_RETRY_BACKOFF_SECONDS: float = Field(0.3, description="Basis backoff retry (detik), eksponensial + jitter")
+    LLM_BREAKER_FAILURES: int = Field(5, description="Jumlah gagal beruntun sebelum circuit breaker open")
+    LLM_BREAKER_RESET_SECONDS: float = Field(30.0, description="Lama breaker open sebelum dicoba lagi (detik)")
+    LLM_HEDGE_PROVIDERS: str = Field("", description="Provider cadangan untuk hedged request, mis. 'openai' (kosong = nonaktif)")
+    LLM_HEDGE_DELAY_SECONDS: float = Field(1.0, description="Tunggu sekian detik sebelum kirim hedged request")
+    LLM_POOL_MAX_CONNECTIONS: int = Field(20, description="Maksimal koneksi HTTP keep-alive per provider")
+    LLM_CONTEXT_TOKEN_BUDGET: int = Field(1500, description="Budget token konteks di prompt LLM")
+    LLM_TOKENIZER: str = Field("o200k_base", description="Encoding tiktoken untuk menghitung token konteks")
+    TIKTOKEN_CACHE_DIR: str = Field("./cache/tiktoken", description="Folder file encoding tiktoken (isi saat build image supaya jalan offline)")
+    LLM_TOKENIZER_DOWNLOAD: bool = Field(False, description="Boleh unduh file encoding tiktoken kalau belum ada di TIKTOKEN_CACHE_DIR (butuh jaringan)")
+    LLM_BATCH_CONCURRENCY: int = Field(4, description="Maksimal panggilan LLM paralel untuk /strava/ask/batch")
+
+    # === SEMANTIC CACHE ===
+    SEMANTIC_CACHE_ENABLED: bool = Field(True, description="Aktifkan cache jawaban berbasis kemiripan embedding")
+    SEMANTIC_CACHE_THRESHOLD: float = Field(0.92, description="Minimal cosine similarity untuk cache hit")
+    SEMANTIC_CACHE_MAX_ENTRIES: int = Field(1024, description="Jumlah entri cache (LRU)")
+
+    # === REQUEST COALESCING ===
+    COALESCE_ENABLED: bool = Field(True, description="Gabungkan request identik yang sedang jalan (/ask, leaderboard) jadi satu eksekusi")
+
+    # === CONCURRENCY ===
+    CPU_WORKERS: int = Field(0, description="Thread untuk kerja CPU (embedding, regex); 0 = jumlah core")
+    IO_WORKERS: int = Field(16, description="Thread untuk I/O blocking (Chroma, gspread)")
+    LLM_MAX_CONCURRENCY: int = Field(8, description="Maksimal panggilan LLM async yang jalan bersamaan")
+    LLM_QUEUE_MAX: int = Field(32, description="Maksimal request yang antri slot LLM; lebih dari itu langsung jawab calc")
+    LLM_QUEUE_TIMEOUT_SECONDS: float = Field(5.0, description="Deadline antri slot LLM (detik) sebelum jawab calc")
+
+    # === PROFILING (opt-in) ===
+    PROFILING_ENABLED: bool = Field(False, description="Pasang middleware profiling + endpoint /admin")
+    PROFILING_TOKEN: str = Field("", description="Token admin (header X-Admin-Token); kosong = profiling selalu ditolak")
+    PROFILING_DIR: str = Field("./logs/profiles", description="Folder hasil profil (.folded) dan snapshot tracemalloc")
+    PROFILING_INTERVAL_SECONDS: float = Field(0.005, description="Interval sampling profiler (detik)")
+
+    # === OBSERVABILITY / LOAD TEST ===
+    SERVER_TIMING_ENABLED: bool = Field(True, description="Tambahkan header Server-Timing (durasi per tahap) di setiap response")
+    QUERY_LOG_ENABLED: bool = Field(False, description="Rekam log query teranonimkan (JSONL) untuk replay load test")
+    QUERY_LOG_PATH: str = Field("./logs/query_log.jsonl", description="File log query teranonimkan")
+    QUERY_LOG_SALT: str = Field("", description="Salt hash session_id/nama member di log query")
+
+    # === ADMISSION CONTROL (request with_answer) ===
+    ADMISSION_ENABLED: bool = Field(False, description="Aktifkan token bucket per sesi + global untuk jalur LLM (token dipotong per panggilan LLM)")
+    ADMISSION_GLOBAL_RPS: float = Field(20.0, description="Isi ulang bucket global (request/detik)")
+    ADMISSION_GLOBAL_BURST: int = Field(40, description="Kapasitas bucket global")
+    ADMISSION_SESSION_RPS: float = Field(0.5, description="Isi ulang bucket per session_id/IP (request/detik)")
+    ADMISSION_SESSION_BURST: int = Field(5, description="Kapasitas bucket per session_id/IP")
+    ADMISSION_MAX_SESSIONS: int = Field(10000, description="Jumlah bucket sesi yang disimpan (LRU)")
+
+    # === BATCH API ===
+    ASK_BATCH_MAX_ITEMS: int = Field(100, description="Maksimal jumlah pertanyaan per request /strava/ask/batch")
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -46,20 +140,11 @@ class Settings(BaseSettings):
 # ===========================
 # Safe initialization
 # ===========================
+# tanpa print saat import: ringkasan dicetak entry point lewat log_settings_summary()
 try:
     settings = Settings()
-    print(f"[CONFIG] Loaded successfully: {settings.PROJECT_NAME}")
-    print(f"   - Chroma Path: {settings.CHROMA_PATH}")
-    print(f"   - GSheet Name: {settings.GSHEET_NAME}")
-    print(f"   - Embedding Model: {settings.EMBEDDING_MODEL}")
-    print(f"   - LLM Provider: {settings.LLM_PROVIDER}")
-    if settings.LLM_PROVIDER.lower() == "groq":
-        print(f"   - Groq Model: {settings.GROQ_MODEL}")
-    elif settings.LLM_PROVIDER.lower() == "openai":
-        print(f"   - OpenAI Model: {settings.OPENAI_MODEL}")
-
 except Exception as e:
-    print("[CONFIG ERROR] Gagal memuat konfigurasi environment.")
+    print("[CONFIG ERROR] Gagal memuat konfigurasi environment.", file=sys.stderr)
     print(f"   Detail: {e}", file=sys.stderr)
 
     # fallback default (biar gak crash di container)
@@ -68,4 +153,22 @@ except Exception as e:
         GSHEET_NAME="StravaClubData",
         GSHEET_TAB="ClubActivities",
     )
-    print("Menggunakan fallback default configuration...")
+    print("Menggunakan fallback default configuration...", file=sys.stderr)
+
+
+def log_settings_summary() -> None:
+    """Ringkasan konfigurasi aktif (dipanggil saat startup API / CLI)."""
+    from app.core.logger import logger
+
+    lines = [
+        f"[CONFIG] Loaded successfully: {settings.PROJECT_NAME}",
+        f"   - Chroma Path: {settings.CHROMA_PATH}",
+        f"   - GSheet Name: {settings.GSHEET_NAME}",
+        f"   - Embedding Model: {settings.EMBEDDING_MODEL}",
+        f"   - LLM Provider: {settings.LLM_PROVIDER}",
+    ]
+    if settings.LLM_PROVIDER.lower() == "groq":
+        lines.append(f"   - Groq Model: {settings.GROQ_MODEL}")
+    elif settings.LLM_PROVIDER.lower() == "openai":
+        lines.append(f"   - OpenAI Model: {settings.OPENAI_MODEL}")
+    logger.info("\n".join(lines))
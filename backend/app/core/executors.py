@@ -0,0 +1,184 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Optional
+from app.core.config import settings
+from app.core.logger import logger
+
+
+# ==================================================
+# POOL TERBATAS + METRIK ANTRIAN
+# ==================================================
+class BoundedPool:
+    """
+    ThreadPoolExecutor dengan ukuran tetap dan counter antrian.
+    - queued: tugas yang sudah disubmit tapi belum mulai jalan
+    - active: tugas yang sedang jalan
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max(1, int(max_workers))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.max_queued = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"{self.name}-pool")
+        return self._executor
+
+    def _wrap(self, func: Callable, *args, **kwargs):
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Jalankan fungsi blocking di pool ini (contextvars ikut dibawa ke thread)."""
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        with self._lock:
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+        call = functools.partial(ctx.run, self._wrap, func, *args, **kwargs)
+        return await loop.run_in_executor(self._get_executor(), call)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_workers": self.max_workers,
+            "active": self.active,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# ==================================================
+# LIMITER UNTUK PANGGILAN LLM (native async)
+# ==================================================
+class LimiterRejected(Exception):
+    """Slot LLM tidak didapat: antrian penuh atau lewat deadline."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class AsyncLimiter:
+    """Semaphore async dengan counter waiting/active untuk panggilan LLM."""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = max(1, int(limit))
+        self._sem: Optional[asyncio.Semaphore] = None
+        self.waiting = 0
+        self.active = 0
+        self.completed = 0
+        self.max_waiting = 0
+        self.rejected_queue_full = 0
+        self.rejected_deadline = 0
+
+    def _get_sem(self) -> asyncio.Semaphore:
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.limit)
+        return self._sem
+
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None, max_queue: Optional[int] = None):
+        """
+        Ambil satu slot. `max_queue`: tolak langsung kalau antrian sudah sepanjang ini;
+        `timeout`: tolak kalau slot tidak didapat dalam sekian detik. Ditolak -> LimiterRejected.
+        """
+        sem = self._get_sem()
+        if max_queue is not None and sem.locked() and self.waiting >= max_queue:
+            self.rejected_queue_full += 1
+            raise LimiterRejected("queue_full")
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            if timeout is None:
+                await sem.acquire()
+            else:
+                try:
+                    await asyncio.wait_for(sem.acquire(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    self.rejected_deadline += 1
+                    raise LimiterRejected("deadline")
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.completed += 1
+            sem.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queued": self.waiting,
+            "max_queued": self.max_waiting,
+            "completed": self.completed,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_deadline": self.rejected_deadline,
+        }
+
+
+# ==================================================
+# INSTANCE GLOBAL
+# ==================================================
+cpu_pool = BoundedPool("cpu", settings.CPU_WORKERS or (os.cpu_count() or 1))
+io_pool = BoundedPool("io", settings.IO_WORKERS)
+llm_limiter = AsyncLimiter("llm", settings.LLM_MAX_CONCURRENCY)
+
+
+async def run_cpu(func: Callable, *args, **kwargs) -> Any:
+    """Kerja CPU-bound (embedding, parsing regex) -> pool seukuran jumlah core."""
+    return await cpu_pool.run(func, *args, **kwargs)
+
+
+async def run_io(func: Callable, *args, **kwargs) -> Any:
+    """Kerja I/O blocking (Chroma, gspread) -> pool I/O terpisah."""
+    return await io_pool.run(func, *args, **kwargs)
+
+
+def executor_stats() -> Dict[str, Any]:
+    return {
+        "cpu": cpu_pool.stats(),
+        "io": io_pool.stats(),
+        "llm": llm_limiter.stats(),
+    }
+
+
+def shutdown_executors() -> None:
+    for pool in (cpu_pool, io_pool):
+        pool.shutdown()
+    logger.info("Executor CPU/IO dimatikan.")
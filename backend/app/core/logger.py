@@ -4,18 +4,13 @@ import os
 from datetime import datetime
 
 # ==================================================
-# Folder logs otomatis dibuat kalau belum ada
+# Folder logs (file sink dipasang eksplisit lewat setup_file_logging)
 # ==================================================
 LOG_DIR = "./logs"
-os.makedirs(LOG_DIR, exist_ok=True)
+_FILE_SINK_ID = None
 
 # ==================================================
-# Nama file log pakai timestamp (rotasi harian)
-# ==================================================
-LOG_FILE = os.path.join(LOG_DIR, f"app_{datetime.now().strftime('%Y-%m-%d')}.log")
-
-# ==================================================
-# Konfigurasi Loguru
+# Konfigurasi Loguru (stdout saja saat import: tanpa efek samping ke disk)
 # ==================================================
 logger.remove()  # hapus handler default
 logger.add(
@@ -30,16 +25,28 @@ logger.add(
     level="INFO",
 )
 
-# simpan juga ke file
-logger.add(
-    LOG_FILE,
-    rotation="00:00",       # buat file baru tiap tengah malam
-    retention="7 days",     # simpan log selama 7 hari
-    compression="zip",      # compress log lama
-    level="INFO",
-    enqueue=True,           # thread-safe
-    format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
-)
+
+def setup_file_logging(log_dir: str = LOG_DIR) -> str:
+    """
+    Simpan juga log ke file `<log_dir>/app_YYYY-mm-dd.log` (rotasi harian).
+    Dipanggil entry point (startup API, CLI) — bukan saat import, jadi import modul
+    `app.*` dari skrip/test tidak membuat folder logs atau thread writer. Idempoten.
+    """
+    global _FILE_SINK_ID
+    log_file = os.path.join(log_dir, f"app_{datetime.now().strftime('%Y-%m-%d')}.log")
+    if _FILE_SINK_ID is not None:
+        return log_file
+    os.makedirs(log_dir, exist_ok=True)
+    _FILE_SINK_ID = logger.add(
+        log_file,
+        rotation="00:00",       # buat file baru tiap tengah malam
+        retention="7 days",     # simpan log selama 7 hari
+        compression="zip",      # compress log lama
+        level="INFO",
+        enqueue=True,           # thread-safe
+        format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
+    )
+    return log_file
 
 
 # ==================================================
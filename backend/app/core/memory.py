@@ -1,6 +1,7 @@
 from typing import Optional, Dict, Any
 from datetime import datetime, timedelta
 from app.core.logger import logger
+from app.core.tenant import DEFAULT_CLUB, current_club
 
 
 _STORE: Dict[str, Dict[str, Any]] = {}
@@ -11,8 +12,15 @@ def _now() -> datetime:
     return datetime.utcnow()
 
 
-def get_session(session_id: Optional[str]) -> Dict[str, Any]:
+def _sid(session_id: Optional[str]) -> str:
+    # sesi dipisah per klub (session_id yang sama di dua klub = dua sesi berbeda)
     sid = session_id or "default"
+    club = current_club()
+    return sid if club == DEFAULT_CLUB else f"{club}:{sid}"
+
+
+def get_session(session_id: Optional[str]) -> Dict[str, Any]:
+    sid = _sid(session_id)
     sess = _STORE.get(sid)
     if not sess or sess.get("expires_at") and sess["expires_at"] < _now():
         sess = {
@@ -28,8 +36,8 @@ def get_session(session_id: Optional[str]) -> Dict[str, Any]:
 
 
 def update_session(session_id: Optional[str], *, member: Optional[str] = None, month: Optional[int] = None, year: Optional[int] = None, last_query: Optional[str] = None) -> None:
-    sid = session_id or "default"
-    sess = get_session(sid)
+    sid = _sid(session_id)
+    sess = get_session(session_id)
     if member:
         sess["member"] = member
     if month is not None:
@@ -45,7 +53,7 @@ def update_session(session_id: Optional[str], *, member: Optional[str] = None, m
 
 
 def clear_session(session_id: Optional[str]) -> None:
-    sid = session_id or "default"
+    sid = _sid(session_id)
     if sid in _STORE:
         del _STORE[sid]
         logger.info(f"memory: cleared session {sid}")
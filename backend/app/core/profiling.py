@@ -0,0 +1,189 @@
+import hmac
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.core.logger import logger
+
+
+# ==================================================
+# SAMPLING PROFILER (semua thread: event loop + pool CPU/IO)
+# ==================================================
+class SamplingProfiler:
+    """
+    Profiler sampling sederhana: tiap `interval` detik ambil stack semua thread
+    (sys._current_frames) lalu agregasi jadi format "collapsed stacks"
+    (input flamegraph.pl / speedscope). Overhead hanya ada selama profiling jalan.
+    Catatan: request lain yang jalan bersamaan ikut tersampel.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = max(0.001, float(interval))
+        self.samples: Counter = Counter()
+        self.total = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.started = 0.0
+        self.duration = 0.0
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        parts: List[str] = []
+        while frame is not None:
+            code = frame.f_code
+            parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ";".join(reversed(parts))
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.is_set():
+            for t in threading.enumerate():
+                names[t.ident] = t.name
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                self.samples[f"{names.get(ident, ident)};{self._collapse(frame)}"] += 1
+                self.total += 1
+            self._stop.wait(self.interval)
+
+    def start(self) -> "SamplingProfiler":
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        self.duration = time.perf_counter() - self.started
+
+    def top(self, n: int = 15) -> List[Dict[str, Any]]:
+        """Fungsi paling sering di puncak stack (self time perkiraan)."""
+        leaf: Counter = Counter()
+        for stack, count in self.samples.items():
+            leaf[stack.rsplit(";", 1)[-1]] += count
+        return [{"frame": f, "samples": c} for f, c in leaf.most_common(n)]
+
+    def save(self, label: str) -> str:
+        os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+        safe = "".join(ch if ch.isalnum() else "_" for ch in label).strip("_")[:60] or "request"
+        path = os.path.join(settings.PROFILING_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}_{safe}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+def profiling_authorized(token: Optional[str]) -> bool:
+    expected = (settings.PROFILING_TOKEN or "").strip()
+    # bandingkan constant-time supaya token tidak bisa ditebak lewat timing
+    return bool(expected) and hmac.compare_digest((token or "").encode(), expected.encode())
+
+
+def profile_requested(headers, query_params) -> bool:
+    flag = headers.get("x-profile") or query_params.get("profile")
+    return str(flag or "").lower() in ("1", "true", "yes")
+
+
+async def profile_middleware(request, call_next):
+    """
+    Middleware (hanya dipasang kalau PROFILING_ENABLED=true):
+    request dengan header `X-Profile: 1` atau `?profile=1` + `X-Admin-Token` valid
+    dijalankan di bawah sampling profiler; hasil disimpan di PROFILING_DIR.
+    """
+    if not profile_requested(request.headers, request.query_params):
+        return await call_next(request)
+    if not profiling_authorized(request.headers.get("x-admin-token")):
+        logger.warning("Permintaan profiling ditolak: token admin tidak valid.")
+        return await call_next(request)
+
+    profiler = SamplingProfiler(settings.PROFILING_INTERVAL_SECONDS).start()
+    try:
+        response = await call_next(request)
+    finally:
+        profiler.stop()
+    path = profiler.save(request.url.path)
+    logger.info(f"Profil {request.url.path} ({profiler.duration * 1000:.1f} ms, {profiler.total} sampel) disimpan ke {path}")
+    response.headers["X-Profile-File"] = os.path.basename(path)
+    response.headers["X-Profile-Ms"] = f"{profiler.duration * 1000:.1f}"
+    return response
+
+
+# ==================================================
+# TRACEMALLOC SNAPSHOT / DIFF
+# ==================================================
+_SNAPSHOTS: List[tracemalloc.Snapshot] = []
+_SNAP_LOCK = threading.Lock()
+
+
+def _filtered(snapshot: tracemalloc.Snapshot) -> tracemalloc.Snapshot:
+    return snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    ))
+
+
+def _stat_dict(stat) -> Dict[str, Any]:
+    frame = stat.traceback[0]
+    out = {"where": f"{frame.filename}:{frame.lineno}", "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+    if hasattr(stat, "size_diff"):
+        out.update({"size_diff_kb": round(stat.size_diff / 1024, 1), "count_diff": stat.count_diff})
+    return out
+
+
+def tracemalloc_start(frames: int = 10) -> Dict[str, Any]:
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(max(1, int(frames)))
+        logger.warning("tracemalloc aktif (ada overhead memori/CPU sampai dihentikan).")
+    return tracemalloc_status()
+
+
+def tracemalloc_stop() -> Dict[str, Any]:
+    with _SNAP_LOCK:
+        _SNAPSHOTS.clear()
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    return tracemalloc_status()
+
+
+def tracemalloc_status() -> Dict[str, Any]:
+    current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+    return {
+        "tracing": tracemalloc.is_tracing(),
+        "snapshots": len(_SNAPSHOTS),
+        "current_kb": round(current / 1024, 1),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def tracemalloc_snapshot(top: int = 20, group_by: str = "lineno") -> Dict[str, Any]:
+    """Ambil snapshot; simpan di memori (maks 2 terakhir) dan dump ke PROFILING_DIR."""
+    if not tracemalloc.is_tracing():
+        tracemalloc_start()
+    snap = _filtered(tracemalloc.take_snapshot())
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    path = os.path.join(settings.PROFILING_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_tracemalloc.snap")
+    snap.dump(path)
+    with _SNAP_LOCK:
+        _SNAPSHOTS.append(snap)
+        del _SNAPSHOTS[:-2]
+    return {**tracemalloc_status(), "file": path, "top": [_stat_dict(s) for s in snap.statistics(group_by)[:top]]}
+
+
+def tracemalloc_diff(top: int = 20, group_by: str = "lineno") -> Dict[str, Any]:
+    """Bandingkan dua snapshot terakhir (alokasi yang tumbuh paling besar di atas)."""
+    with _SNAP_LOCK:
+        if len(_SNAPSHOTS) < 2:
+            return {**tracemalloc_status(), "error": "Butuh minimal 2 snapshot."}
+        old, new = _SNAPSHOTS[-2], _SNAPSHOTS[-1]
+    stats = new.compare_to(old, group_by)
+    return {**tracemalloc_status(), "top": [_stat_dict(s) for s in stats[:top]]}
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, Dict, Iterable, Optional
+from app.core.config import settings
+from app.core.executors import run_io
+from app.core.logger import logger
+from app.core.tenant import club_from_request, known_club, use_club
+
+
+# ==================================================
+# LOG QUERY TERANONIMKAN (untuk replay load test)
+# ==================================================
+# endpoint yang direkam -> dipakai ulang oleh loadtest.py --replay
+RECORDED_PATHS = {"/strava/ask", "/strava/leaderboard", "/strava/refresh"}
+
+_WRITE_LOCK = threading.Lock()
+_PATTERN_CACHE: Dict[str, Any] = {"names": None, "pattern": None}
+
+
+def _token(value: str, prefix: str) -> str:
+    digest = hashlib.sha256(f"{settings.QUERY_LOG_SALT}:{value.strip().lower()}".encode("utf-8")).hexdigest()
+    return f"{prefix}{digest[:10]}"
+
+
+def member_placeholder(name: str) -> str:
+    """Nama member diganti placeholder stabil `{member:<hash>}` (replay mengisinya dengan member lain)."""
+    return "{" + _token(name, "member:") + "}"
+
+
+def _name_pattern(names: Iterable[str]) -> Optional[re.Pattern]:
+    key = frozenset(n for n in names if n)
+    if _PATTERN_CACHE["names"] != key:
+        ordered = sorted(key, key=len, reverse=True)
+        _PATTERN_CACHE["pattern"] = re.compile("|".join(re.escape(n) for n in ordered), re.IGNORECASE) if ordered else None
+        _PATTERN_CACHE["names"] = key
+    return _PATTERN_CACHE["pattern"]
+
+
+def anonymize_params(params: Dict[str, str], names: Iterable[str]) -> Dict[str, str]:
+    """Hash session_id, ganti nama member (di param `member` maupun teks query) dengan placeholder."""
+    out = dict(params)
+    if out.get("session_id"):
+        out["session_id"] = _token(out["session_id"], "s_")
+    if out.get("member"):
+        out["member"] = member_placeholder(out["member"])
+    if out.get("query"):
+        pattern = _name_pattern(names)
+        if pattern is not None:
+            out["query"] = pattern.sub(lambda m: member_placeholder(m.group(0)), out["query"])
+    return out
+
+
+def _append(record: Dict[str, Any], params: Dict[str, str], club: str) -> None:
+    from app.services.rag.retriever import _collect_member_names
+    try:
+        # middleware jalan di luar dependency router -> set klub sendiri untuk daftar nama member
+        with use_club(club) if known_club(club) else nullcontext():
+            names = _collect_member_names()
+    except Exception:
+        names = set()
+    record["params"] = anonymize_params(params, names)
+    line = json.dumps(record, ensure_ascii=False)
+    with _WRITE_LOCK:
+        os.makedirs(os.path.dirname(settings.QUERY_LOG_PATH) or ".", exist_ok=True)
+        with open(settings.QUERY_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+async def query_log_middleware(request, call_next):
+    """
+    Middleware (hanya dipasang kalau QUERY_LOG_ENABLED=true): rekam method, path, parameter
+    teranonimkan, status dan latensi request ke endpoint strava ke QUERY_LOG_PATH (JSONL).
+    """
+    if request.url.path not in RECORDED_PATHS:
+        return await call_next(request)
+    ts = time.time()
+    start = time.perf_counter()
+    response = await call_next(request)
+    record = {
+        "ts": round(ts, 3),
+        "method": request.method,
+        "path": request.url.path,
+        "status": response.status_code,
+        "ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+    try:
+        await run_io(_append, record, dict(request.query_params), club_from_request(request))
+    except Exception as e:
+        logger.warning(f"Gagal menulis log query: {e}")
+    return response
@@ -0,0 +1,19 @@
+from typing import Any
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson opsional; tanpa itu pakai encoder json stdlib
+    orjson = None
+
+
+# ==================================================
+# RESPONSE JSON CEPAT (orjson)
+# ==================================================
+class ORJSONResponse(JSONResponse):
+    """JSONResponse yang diserialisasi dengan orjson (numpy scalar/array ikut didukung)."""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
@@ -0,0 +1,67 @@
+import asyncio
+import copy
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+from app.core.config import settings
+from app.core.tenant import current_club
+from app.core.timing import record_stage
+
+
+# ==================================================
+# SINGLE-FLIGHT (coalescing request identik yang sedang jalan)
+# ==================================================
+_PUNCT_TAIL = re.compile(r"[\s?!.,;:]+$")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_query_key(query: str) -> str:
+    """Bentuk query untuk key coalescing: huruf kecil, spasi dirapikan, tanda baca di akhir dibuang."""
+    return _PUNCT_TAIL.sub("", _SPACES.sub(" ", (query or "").strip().lower()))
+
+
+class SingleFlight:
+    """
+    Request dengan key sama yang datang saat request pertama masih berjalan tidak
+    menjalankan pipeline lagi: mereka menunggu future milik request pertama (leader)
+    dan memakai hasilnya (salinan). Key selalu diberi prefix klub aktif; pemanggil
+    wajib memasukkan versi data supaya hasil sebelum sync tidak dibagikan sesudahnya.
+    Pekerjaan leader jalan sebagai task terpisah, jadi klien leader yang putus
+    tidak membatalkan hasil untuk follower.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+        self.leaders: Dict[str, int] = {}
+        self.coalesced: Dict[str, int] = {}
+
+    async def do(self, kind: str, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if not settings.COALESCE_ENABLED:
+            return await fn()
+        full_key = (current_club(), kind, key)
+        task = self._inflight.get(full_key)
+        if task is None:
+            # task menyalin context (klub, stage timing, shed reason) milik leader
+            task = asyncio.ensure_future(fn())
+            self._inflight[full_key] = task
+            task.add_done_callback(lambda t, k=full_key: self._inflight.pop(k, None) if self._inflight.get(k) is t else None)
+            self.leaders[kind] = self.leaders.get(kind, 0) + 1
+            return await asyncio.shield(task)
+
+        self.coalesced[kind] = self.coalesced.get(kind, 0) + 1
+        start = time.perf_counter()
+        result = await asyncio.shield(task)
+        record_stage("coalesced", (time.perf_counter() - start) * 1000)
+        # follower dapat salinan: router/leader boleh mengubah dict hasil miliknya sendiri
+        return copy.deepcopy(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.COALESCE_ENABLED,
+            "in_flight": len(self._inflight),
+            "leaders": dict(self.leaders),
+            "coalesced": dict(self.coalesced),
+        }
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,190 @@
+import contextvars
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+from app.core.config import settings
+from app.core.logger import logger
+
+
+# ==================================================
+# KLUB AKTIF (per request / per task)
+# ==================================================
+DEFAULT_CLUB = "default"
+_CLUB_RE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,39}$")
+
+# di-set oleh dependency router; pool CPU/IO dan thread background menyalin context
+_CURRENT_CLUB: contextvars.ContextVar[str] = contextvars.ContextVar("club_id", default=DEFAULT_CLUB)
+
+
+def current_club() -> str:
+    return _CURRENT_CLUB.get()
+
+
+@contextmanager
+def use_club(club: Optional[str]):
+    """Jalankan blok kode sebagai klub tertentu (CLI, job background)."""
+    token = _CURRENT_CLUB.set(normalize_club(club))
+    try:
+        yield
+    finally:
+        _CURRENT_CLUB.reset(token)
+
+
+def normalize_club(club: Optional[str]) -> str:
+    return (club or DEFAULT_CLUB).strip().lower() or DEFAULT_CLUB
+
+
+# ==================================================
+# REGISTRY KLUB (TENANTS_FILE)
+# ==================================================
+_REGISTRY: Dict[str, Any] = {"mtime": None, "tenants": {}}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _load_registry() -> Dict[str, Dict[str, Any]]:
+    """
+    Isi TENANTS_FILE (JSON): {"<club_id>": {"gsheet_id": "...", "gsheet_tab": "...",
+    "gsheet_name": "...", "source_file": "...", "collection": "..."}, ...}.
+    Dibaca ulang kalau mtime berubah (klub baru bisa ditambah tanpa restart).
+    """
+    path = (settings.TENANTS_FILE or "").strip()
+    if not path:
+        return {}
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        logger.warning(f"TENANTS_FILE tidak ditemukan: {path}")
+        return {}
+    if _REGISTRY["mtime"] != mtime:
+        with _REGISTRY_LOCK:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    raw = json.load(f)
+                tenants = {}
+                for club, cfg in (raw or {}).items():
+                    club = normalize_club(club)
+                    if not _CLUB_RE.match(club):
+                        logger.warning(f"ID klub tidak valid di TENANTS_FILE, dilewati: {club}")
+                        continue
+                    tenants[club] = dict(cfg or {})
+                _REGISTRY.update({"mtime": mtime, "tenants": tenants})
+                logger.info(f"Registry klub dimuat: {len(tenants)} klub.")
+            except Exception as e:
+                logger.warning(f"Gagal membaca TENANTS_FILE: {e}")
+    return _REGISTRY["tenants"]
+
+
+def known_club(club: str) -> bool:
+    return club == DEFAULT_CLUB or club in _load_registry()
+
+
+def list_clubs() -> list:
+    return [DEFAULT_CLUB] + sorted(c for c in _load_registry() if c != DEFAULT_CLUB)
+
+
+def tenant_config(club: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Konfigurasi sumber data + nama koleksi dasar untuk klub.
+    Klub default memakai setting global (perilaku lama, nama koleksi tidak berubah);
+    klub lain wajib punya sumber sendiri dan koleksinya `<CHROMA_COLLECTION>__<club>`.
+    """
+    club = normalize_club(club or current_club())
+    cfg = _load_registry().get(club, {})
+    if club == DEFAULT_CLUB:
+        return {
+            "club": club,
+            "collection": cfg.get("collection") or settings.CHROMA_COLLECTION,
+            "gsheet_id": cfg.get("gsheet_id", settings.GSHEET_ID),
+            "gsheet_name": cfg.get("gsheet_name", settings.GSHEET_NAME),
+            "gsheet_tab": cfg.get("gsheet_tab", settings.GSHEET_TAB),
+            "source_file": cfg.get("source_file", settings.SHEET_SOURCE_FILE),
+        }
+    return {
+        "club": club,
+        "collection": cfg.get("collection") or f"{settings.CHROMA_COLLECTION}__{club}",
+        "gsheet_id": cfg.get("gsheet_id", ""),
+        "gsheet_name": cfg.get("gsheet_name", ""),
+        "gsheet_tab": cfg.get("gsheet_tab", settings.GSHEET_TAB),
+        "source_file": cfg.get("source_file", ""),
+    }
+
+
+def tenant_path(base: str, club: Optional[str] = None) -> str:
+    """Folder per klub di bawah `base` (klub default tetap memakai `base` apa adanya)."""
+    club = normalize_club(club or current_club())
+    return base if club == DEFAULT_CLUB else os.path.join(base, "clubs", club)
+
+
+# ==================================================
+# STATE PER KLUB (LRU: handle koleksi, index, cache)
+# ==================================================
+class TenantStates:
+    """
+    Objek per klub (index NumPy, semantic cache, cache nama member, ...) disimpan
+    dalam satu dict per klub; hanya TENANT_CACHE_MAX klub terakhir yang dipakai
+    yang dipertahankan, sisanya dibuang dan dibangun ulang saat diakses lagi.
+    Model embedding tidak termasuk: satu instance dipakai bersama semua klub.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.evictions = 0
+
+    def get(self, club: str) -> Dict[str, Any]:
+        with self._lock:
+            state = self._states.get(club)
+            if state is None:
+                state = {}
+                self._states[club] = state
+                while len(self._states) > max(1, settings.TENANT_CACHE_MAX):
+                    evicted, _ = self._states.popitem(last=False)
+                    self.evictions += 1
+                    logger.info(f"State klub '{evicted}' dikeluarkan dari cache (LRU).")
+            else:
+                self._states.move_to_end(club)
+            return state
+
+    def drop(self, club: str) -> None:
+        with self._lock:
+            self._states.pop(club, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "loaded": {club: sorted(state) for club, state in self._states.items()},
+                "max": settings.TENANT_CACHE_MAX,
+                "evictions": self.evictions,
+            }
+
+
+_STATES = TenantStates()
+
+
+def tenant_state(club: Optional[str] = None) -> Dict[str, Any]:
+    """Dict state milik klub aktif (atau `club`); isi diatur modul pemakai lewat setdefault."""
+    return _STATES.get(normalize_club(club or current_club()))
+
+
+def tenant_stats() -> Dict[str, Any]:
+    return {"clubs": list_clubs(), **_STATES.stats()}
+
+
+# ==================================================
+# KLUB DARI REQUEST (dependency FastAPI ada di router)
+# ==================================================
+def club_from_request(request) -> str:
+    return normalize_club(request.query_params.get("club") or request.headers.get("x-club-id"))
+
+
+def bind_current_club(club: Optional[str]) -> Optional[str]:
+    """Validasi klub lalu set sebagai klub aktif task ini; return None kalau tidak valid / tidak terdaftar."""
+    club = normalize_club(club)
+    if not _CLUB_RE.match(club) or not known_club(club):
+        return None
+    _CURRENT_CLUB.set(club)
+    return club
@@ -0,0 +1,51 @@
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+# ==================================================
+# STAGE TIMING PER REQUEST (-> header Server-Timing)
+# ==================================================
+# dict dibuat per request oleh middleware; pool CPU/IO menyalin context sehingga
+# tahap yang jalan di thread pool menulis ke dict yang sama
+_STAGES: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("request_stages", default=None)
+
+
+@contextmanager
+def stage(name: str):
+    """Catat durasi satu tahap (ms) ke request aktif; no-op kalau tidak ada request yang diukur."""
+    stages = _STAGES.get()
+    if stages is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[name] = stages.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+
+def record_stage(name: str, ms: float) -> None:
+    """Tambahkan durasi yang diukur sendiri (mis. waktu tunggu antrian) ke request aktif."""
+    stages = _STAGES.get()
+    if stages is not None:
+        stages[name] = stages.get(name, 0.0) + ms
+
+
+def server_timing_header(stages: Dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={ms:.1f}" for name, ms in stages.items())
+
+
+async def server_timing_middleware(request, call_next):
+    """Tambahkan header `Server-Timing` (per tahap + total) ke setiap response."""
+    stages: Dict[str, float] = {}
+    token = _STAGES.set(stages)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _STAGES.reset(token)
+    stages["total"] = (time.perf_counter() - start) * 1000
+    response.headers["Server-Timing"] = server_timing_header(stages)
+    return response
@@ -1,4 +1,5 @@
 import hashlib
+import inspect
 import json
 import re
 from datetime import datetime
@@ -73,7 +74,19 @@ def json_hash(data: dict) -> str:
 # PERFORMANCE TIMER DECORATOR
 # ==================================================
 def timer(func):
-    """Decorator buat ukur waktu eksekusi fungsi."""
+    """Decorator buat ukur waktu eksekusi fungsi (sync maupun async)."""
+
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            start = datetime.now()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                duration = (datetime.now() - start).total_seconds()
+                logger.info(f"{func.__name__} selesai dalam {duration:.2f} detik")
+
+        return async_wrapper
 
     @wraps(func)
     def wrapper(*args, **kwargs):
@@ -1,8 +1,41 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from app.core.config import log_settings_summary, settings
+from app.core.logger import setup_file_logging
+from app.core.responses import ORJSONResponse
+from app.core.executors import shutdown_executors
 from app.routers import health_router, strava_router
+from app.services.gsheet.scheduler import run_sync_scheduler
+from app.services.llm.client import close_llm_clients
+from app.services.warmup import run_warmup
 
-app = FastAPI(title="Strava RAG Chatbot API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # init eksplisit (bukan efek samping import): file log + ringkasan konfigurasi
+    setup_file_logging()
+    log_settings_summary()
+    # warmup jalan di background: server sudah listen, /health/ready 503 sampai selesai
+    warmup_task = asyncio.create_task(run_warmup())
+    # sync terjadwal (opt-in): satu leader per klub lewat lease di sync state store
+    scheduler_task = asyncio.create_task(run_sync_scheduler()) if settings.SYNC_SCHEDULER_ENABLED else None
+    yield
+    if not warmup_task.done():
+        warmup_task.cancel()
+    if scheduler_task is not None and not scheduler_task.done():
+        scheduler_task.cancel()
+        # tunggu lease dilepas sebelum pool IO dimatikan
+        await asyncio.gather(scheduler_task, return_exceptions=True)
+    # matikan pool CPU/IO dan koneksi LLM saat shutdown
+    shutdown_executors()
+    await close_llm_clients()
+
+
+# orjson: serialisasi jauh lebih cepat dari json stdlib
+app = FastAPI(title="Strava RAG Chatbot API", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # CORS (development-friendly)
 app.add_middleware(
@@ -13,6 +46,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# kompres response besar (contexts bisa puluhan KB); response kecil tidak dikompres
+app.add_middleware(GZipMiddleware, minimum_size=settings.GZIP_MIN_BYTES)
+
 # Extra safety: always append CORS headers
 @app.middleware("http")
 async def add_cors_headers(request, call_next):
@@ -25,3 +61,23 @@ async def add_cors_headers(request, call_next):
 # daftarkan router
 app.include_router(health_router.router)
 app.include_router(strava_router.router)
+
+# durasi per tahap (embed, search, llm, ...) di header Server-Timing -> dibaca loadtest.py / devtools browser
+if settings.SERVER_TIMING_ENABLED:
+    from app.core.timing import server_timing_middleware
+
+    app.middleware("http")(server_timing_middleware)
+
+# log query teranonimkan untuk replay load test (opt-in)
+if settings.QUERY_LOG_ENABLED:
+    from app.core.query_log import query_log_middleware
+
+    app.middleware("http")(query_log_middleware)
+
+# profiling on-demand: middleware + endpoint admin hanya dipasang kalau diaktifkan (nol biaya saat mati)
+if settings.PROFILING_ENABLED:
+    from app.core.profiling import profile_middleware
+    from app.routers import admin_router
+
+    app.middleware("http")(profile_middleware)
+    app.include_router(admin_router.router)
@@ -0,0 +1,79 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from app.core.logger import logger
+from app.core.utils import now_str
+from app.core.config import settings
+from app.core.executors import run_cpu
+from app.core.profiling import (
+    profiling_authorized,
+    tracemalloc_diff,
+    tracemalloc_snapshot,
+    tracemalloc_start,
+    tracemalloc_status,
+    tracemalloc_stop,
+)
+import os
+
+
+def require_admin(x_admin_token: str = Header(None, description="Token admin (PROFILING_TOKEN)")):
+    if not profiling_authorized(x_admin_token):
+        raise HTTPException(status_code=401, detail="Token admin tidak valid.")
+
+
+# router ini hanya didaftarkan kalau PROFILING_ENABLED=true
+router = APIRouter(prefix="/admin", tags=["Admin / Profiling"], dependencies=[Depends(require_admin)])
+
+
+# ==================================================
+# File profil per request
+# ==================================================
+@router.get("/profiles")
+def list_profiles(limit: int = Query(20, ge=1, le=200)):
+    """Daftar file profil (.folded / .snap) terbaru di PROFILING_DIR."""
+    try:
+        if not os.path.isdir(settings.PROFILING_DIR):
+            return {"status": "ok", "files": [], "time": now_str()}
+        files = sorted(os.listdir(settings.PROFILING_DIR), reverse=True)[:limit]
+        return {"status": "ok", "dir": settings.PROFILING_DIR, "files": files, "time": now_str()}
+    except Exception as e:
+        logger.exception(f"Gagal membaca daftar profil: {e}")
+        return {"status": "error", "message": str(e), "time": now_str()}
+
+
+# ==================================================
+# tracemalloc
+# ==================================================
+@router.get("/tracemalloc")
+def tm_status():
+    return {"status": "ok", **tracemalloc_status(), "time": now_str()}
+
+
+@router.post("/tracemalloc/start")
+def tm_start(frames: int = Query(10, ge=1, le=50, description="Kedalaman traceback per alokasi")):
+    return {"status": "ok", **tracemalloc_start(frames), "time": now_str()}
+
+
+@router.post("/tracemalloc/stop")
+def tm_stop():
+    return {"status": "ok", **tracemalloc_stop(), "time": now_str()}
+
+
+@router.post("/tracemalloc/snapshot")
+async def tm_snapshot(top: int = Query(20, ge=1, le=200), group_by: str = Query("lineno", description="lineno | filename | traceback")):
+    """Ambil snapshot alokasi (disimpan ke PROFILING_DIR) + top alokasi saat ini."""
+    try:
+        result = await run_cpu(tracemalloc_snapshot, top, group_by)
+        return {"status": "ok", **result, "time": now_str()}
+    except Exception as e:
+        logger.exception(f"Gagal snapshot tracemalloc: {e}")
+        return {"status": "error", "message": str(e), "time": now_str()}
+
+
+@router.get("/tracemalloc/diff")
+async def tm_diff(top: int = Query(20, ge=1, le=200), group_by: str = Query("lineno")):
+    """Selisih dua snapshot terakhir — cari yang tumbuh (session store, buffer hasil Chroma, cache)."""
+    try:
+        result = await run_cpu(tracemalloc_diff, top, group_by)
+        return {"status": "ok" if "error" not in result else "error", **result, "time": now_str()}
+    except Exception as e:
+        logger.exception(f"Gagal diff tracemalloc: {e}")
+        return {"status": "error", "message": str(e), "time": now_str()}
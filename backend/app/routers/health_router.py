@@ -1,7 +1,18 @@
 from fastapi import APIRouter
 from app.core.logger import logger
 from app.core.utils import now_str
+from app.core.responses import ORJSONResponse
 from app.core.config import settings
+from app.core.admission import admission
+from app.core.executors import executor_stats
+from app.core.singleflight import single_flight
+from app.core.tenant import tenant_stats
+from app.services.chroma.db_client import open_collection_handles
+from app.services.gsheet.scheduler import scheduler_status
+from app.services.llm.client import llm_stats
+from app.services.rag.semantic_cache import semantic_cache_stats
+from app.services.chroma.embedding_cache import embedding_cache_stats
+from app.services.warmup import is_ready, warmup_state
 import os
 
 
@@ -35,3 +46,33 @@ def health_check():
             "time": now_str(),
         }
 
+
+@router.get("/ready")
+def readiness():
+    """
+    Readiness untuk load balancer: 503 sampai warmup (model, koleksi, index) selesai.
+    Menyertakan durasi warmup per komponen.
+    """
+    state = warmup_state()
+    body = {"status": "ready" if is_ready() else "warming_up", "warmup": state, "time": now_str()}
+    return ORJSONResponse(status_code=200 if is_ready() else 503, content=body)
+
+
+@router.get("/metrics")
+def runtime_metrics():
+    """
+    Metrik runtime: kedalaman antrian dan jumlah tugas aktif per kelas kerja
+    (pool CPU, pool I/O, limiter LLM) dan status circuit breaker LLM.
+    """
+    return {
+        "status": "ok",
+        "executors": executor_stats(),
+        "admission": admission.stats(),
+        "llm_breakers": llm_stats(),
+        "semantic_cache": semantic_cache_stats(),
+        "embedding_cache": embedding_cache_stats(),
+        "coalescing": single_flight.stats(),
+        "tenants": {**tenant_stats(), "collection_handles": open_collection_handles()},
+        "sync_scheduler": scheduler_status(),
+        "time": now_str(),
+    }
@@ -1,18 +1,45 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from pydantic import BaseModel, Field
 from app.core.logger import logger
 from app.core.utils import timer, now_str
 from app.services.gsheet.sync import sync_gsheet_to_chroma
-from app.services.rag.retriever import retrieve_context
-from app.services.chroma.db_client import get_collection
+from app.services.rag.retriever import retrieve_context_async
+from app.services.chroma.db_client import get_collection, get_active_collection_name, get_base_collection_name
+from app.services.gsheet.state_store import get_state_store
+from app.services.chroma.manager import get_data_version
+from app.services.chroma.reindex import start_reindex_background, reindex_status, rollback_collection, gc_collections
 from app.core.config import settings
-from app.services.rag.pipeline import rag_answer
+from app.services.rag.pipeline import rag_answer_async, rag_answer_batch_async
+from app.services.rag.compact import compact_result
+from app.services.rag.date_range import DateRange, detect_date_range, resolve_date_range, scope_range
+from app.services.rag.metrics import compute_leaderboard
+from app.services.rag.member_stats import member_stats, member_timeseries
+from app.core.admission import admission
+from app.core.executors import run_cpu, run_io
+from app.core.singleflight import normalize_query_key, single_flight
+from app.core.timing import stage
+from app.core.tenant import DEFAULT_CLUB, bind_current_club, current_club
 from app.core.memory import get_session, update_session
 from typing import Optional, Dict, Any, List
 from datetime import datetime, date
-import re
 
 
-router = APIRouter(prefix="/strava", tags=["Strava Club"])
+# ==================================================
+# Klub (multi-tenant)
+# ==================================================
+async def bind_club(
+    club: Optional[str] = Query(None, description="ID klub (multi-tenant); default header X-Club-Id atau 'default'"),
+    x_club_id: Optional[str] = Header(None, description="ID klub (alternatif query `club`)"),
+) -> str:
+    """Dependency router /strava: validasi klub lalu set sebagai klub aktif request ini."""
+    bound = bind_current_club(club or x_club_id)
+    if bound is None:
+        raise HTTPException(status_code=404, detail=f"Klub '{(club or x_club_id or '').strip().lower()}' tidak terdaftar.")
+    return bound
+
+
+# semua endpoint menerima `club` (query) / X-Club-Id (header); tanpa itu -> klub default
+router = APIRouter(prefix="/strava", tags=["Strava Club"], dependencies=[Depends(bind_club)])
 
 
 # ==================================================
@@ -20,7 +47,7 @@ router = APIRouter(prefix="/strava", tags=["Strava Club"])
 # ==================================================
 @router.post("/refresh")
 @timer
-def refresh_data():
+async def refresh_data():
     """
     Sinkronisasi ulang data dari Google Sheet ke ChromaDB.
     - Hanya update entitas (member) yang berubah.
@@ -28,7 +55,8 @@ def refresh_data():
     """
     try:
         logger.info("Memulai sinkronisasi data dari Google Sheet...")
-        result = sync_gsheet_to_chroma()
+        with stage("sync"):
+            result = await run_io(sync_gsheet_to_chroma)
         if result and result.get("status") == "error":
             # propagasikan error dari fungsi sync
             logger.error(f"Gagal sinkronisasi: {result.get('message')}")
@@ -50,12 +78,85 @@ def refresh_data():
         return {"status": "error", "message": str(e), "time": now_str()}
 
 
+@router.get("/sync/history")
+async def sync_history(limit: int = Query(20, ge=1, le=200, description="Jumlah run terakhir")):
+    """Riwayat run sinkronisasi + watermark sheet koleksi aktif (klub ini saja)."""
+    try:
+        store = get_state_store()
+        runs = await run_io(store.runs, limit, get_base_collection_name())
+        meta = await run_io(store.get_meta, get_active_collection_name())
+        return {"status": "ok", "club": current_club(), "watermark": meta, "runs": runs, "time": now_str()}
+    except Exception as e:
+        logger.exception(f"Gagal membaca riwayat sync: {e}")
+        return {"status": "error", "message": str(e), "time": now_str()}
+
+
+# ==================================================
+# Reindex tanpa downtime (shadow collection + alias)
+# ==================================================
+@router.post("/reindex")
+async def reindex():
+    """
+    Bangun ulang seluruh index ke koleksi versi baru di background.
+    Koleksi aktif tetap melayani /ask sampai alias ditukar setelah validasi.
+    """
+    try:
+        result = start_reindex_background()
+        return {**result, "time": now_str()}
+    except Exception as e:
+        logger.exception(f"Gagal memulai reindex: {e}")
+        return {"status": "error", "message": str(e), "time": now_str()}
+
+
+@router.get("/reindex")
+async def reindex_progress():
+    """Status reindex terakhir + koleksi aktif/previous."""
+    try:
+        status = await run_io(reindex_status)
+        return {"status": "ok", "reindex": status, "time": now_str()}
+    except Exception as e:
+        logger.exception(f"Gagal membaca status reindex: {e}")
+        return {"status": "error", "message": str(e), "time": now_str()}
+
+
+@router.post("/reindex/rollback")
+async def reindex_rollback():
+    """Kembalikan alias ke versi koleksi sebelumnya."""
+    try:
+        result = await run_io(rollback_collection)
+        return {**result, "time": now_str()}
+    except Exception as e:
+        logger.exception(f"Gagal rollback: {e}")
+        return {"status": "error", "message": str(e), "time": now_str()}
+
+
+@router.post("/reindex/gc")
+async def reindex_gc(keep: Optional[int] = Query(None, ge=0, description="Versi lama yang disimpan (default REINDEX_KEEP_VERSIONS)")):
+    """Hapus versi koleksi lama (aktif & previous selalu disimpan)."""
+    try:
+        result = await run_io(gc_collections, keep)
+        return {**result, "time": now_str()}
+    except Exception as e:
+        logger.exception(f"Gagal GC koleksi: {e}")
+        return {"status": "error", "message": str(e), "time": now_str()}
+
+
 # ==================================================
 # Ask / Query ke Chroma (Retriever)
 # ==================================================
+def _admission_key(request: Request, session_id: Optional[str]) -> str:
+    club = current_club()
+    prefix = "" if club == DEFAULT_CLUB else f"{club}:"
+    if session_id:
+        return f"{prefix}session:{session_id}"
+    host = request.client.host if request.client else "unknown"
+    return f"{prefix}ip:{host}"
+
+
 @router.get("/ask")
 @timer
-def ask(
+async def ask(
+    request: Request,
     query: str = Query(..., description="Pertanyaan user"),
     with_answer: bool = Query(False, description="Jika true, jalankan pipeline RAG penuh"),
     member: str = Query(None, description="Nama member spesifik (opsional)"),
@@ -63,6 +164,7 @@ def ask(
     year: int = Query(None, ge=2000, le=2100, description="Tahun (YYYY), opsional"),
     top_k: int = Query(5, ge=1, le=20, description="Jumlah konteks yang diambil"),
     session_id: str = Query(None, description="ID sesi percakapan untuk memory"),
+    compact: bool = Query(False, description="Jika true, contexts berisi id + cuplikan saja (bukan dokumen utuh)"),
 ):
     try:
         # Read memory and backfill missing filters
@@ -72,40 +174,110 @@ def ask(
         eff_year = year or sess.get("year")
 
         if with_answer:
-            result = rag_answer(query, top_k=top_k, member=eff_member, month=eff_month, year=eff_year, session_id=session_id)
+            key = _admission_key(request, session_id)
+            result = await rag_answer_async(
+                query, top_k=top_k, member=eff_member, month=eff_month, year=eff_year, session_id=session_id,
+                admit=lambda: admission.admit(key),
+            )
+            if compact:
+                result = await run_cpu(compact_result, result)
             result["time"] = now_str()
             return result
         else:
-            contexts = retrieve_context(query, top_k=top_k, member=eff_member)
+            key = (normalize_query_key(query), top_k, eff_member, eff_month, eff_year, get_data_version())
+            contexts = await single_flight.do(
+                "retrieve", key, lambda: retrieve_context_async(query, top_k=top_k, member=eff_member, month=eff_month, year=eff_year)
+            )
+            date_range = resolve_date_range(query, eff_month, eff_year)
             # memory: update last query
             update_session(session_id, last_query=query)
-            return {
+            result = {
                 "status": "ok" if contexts else "not_found",
                 "query": query,
                 "contexts": contexts,
-                "filters": {"member": eff_member, "month": eff_month, "year": eff_year},
-                "time": now_str(),
+                "filters": {
+                    "member": eff_member,
+                    "month": eff_month,
+                    "year": eff_year,
+                    "period": date_range.as_dict() if date_range else None,
+                },
             }
+            if compact:
+                result = await run_cpu(compact_result, result)
+            result["time"] = now_str()
+            return result
     except Exception as e:
         logger.exception(f"/ask error: {e}")
         return {"status": "error", "message": str(e), "time": now_str()}
 
 
+# ==================================================
+# Ask Batch (banyak pertanyaan sekaligus)
+# ==================================================
+class AskBatchItem(BaseModel):
+    query: str = Field(..., description="Pertanyaan user")
+    member: Optional[str] = Field(None, description="Nama member spesifik (opsional)")
+    month: Optional[int] = Field(None, ge=1, le=12, description="Bulan (1-12), opsional")
+    year: Optional[int] = Field(None, ge=2000, le=2100, description="Tahun (YYYY), opsional")
+    top_k: int = Field(5, ge=1, le=20, description="Jumlah konteks yang diambil")
+
+
+class AskBatchRequest(BaseModel):
+    items: List[AskBatchItem] = Field(..., min_length=1, description="Daftar pertanyaan")
+    with_answer: bool = Field(False, description="Jika true, jalankan pipeline RAG penuh per item")
+    session_id: Optional[str] = Field(None, description="ID sesi (hanya untuk backfill filter)")
+    compact: bool = Field(False, description="Jika true, contexts berisi id + cuplikan saja")
+
+
+@router.post("/ask/batch")
+@timer
+async def ask_batch(payload: AskBatchRequest, request: Request):
+    """
+    Jawab banyak pertanyaan dalam satu request.
+    Embedding, pencarian vektor, dan scan nama member dilakukan sekali untuk seluruh batch.
+    """
+    try:
+        if len(payload.items) > settings.ASK_BATCH_MAX_ITEMS:
+            return {
+                "status": "error",
+                "message": f"Maksimal {settings.ASK_BATCH_MAX_ITEMS} pertanyaan per batch.",
+                "time": now_str(),
+            }
+        # admission per item yang benar-benar ke LLM: batch 100 pertanyaan tidak dihitung satu request
+        key = _admission_key(request, payload.session_id)
+        results = await rag_answer_batch_async(
+            [item.model_dump() for item in payload.items],
+            with_answer=payload.with_answer,
+            session_id=payload.session_id,
+            admit=lambda: admission.admit(key),
+        )
+        if payload.compact:
+            results = await run_cpu(lambda rs: [compact_result(r) for r in rs], results)
+        return {"status": "ok", "count": len(results), "results": results, "time": now_str()}
+    except Exception as e:
+        logger.exception(f"/ask/batch error: {e}")
+        return {"status": "error", "message": str(e), "time": now_str()}
+
+
 # ==================================================
 # Status ChromaDB
 # ==================================================
+def _collection_count() -> int:
+    return get_collection().count()
+
+
 @router.get("/status")
-def chroma_status():
+async def chroma_status():
     """
     Menampilkan status koleksi ChromaDB (jumlah dokumen dan konfigurasi dasar).
     """
     try:
-        collection = get_collection()
-        count = collection.count()
+        count = await run_io(_collection_count)
         logger.info(f"Status koleksi: {count} dokumen tersimpan.")
         return {
             "status": "ok",
-            "collection": settings.CHROMA_COLLECTION,
+            "club": current_club(),
+            "collection": get_active_collection_name(),
             "total_documents": count,
             "time": now_str(),
         }
@@ -115,14 +287,33 @@ def chroma_status():
 
 
 # ==================================================
-# Leaderboard (week / month / year)
+# Leaderboard (week / month / year / periode bebas)
 # ==================================================
+def _board_range(scope: str, year: Optional[int], month: Optional[int], week: Optional[int],
+                 period: Optional[str], since: Optional[date], until: Optional[date], today: date) -> Optional[DateRange]:
+    """`since`/`until` > `period` ("3 bulan terakhir") > scope/year/month/week."""
+    if since or until:
+        start, end = since or date(2000, 1, 1), until or today
+        if start > end:
+            raise ValueError("since harus <= until")
+        return DateRange(start, end, f"{start.isoformat()} s/d {end.isoformat()}")
+    if period:
+        rng = detect_date_range(period, today)
+        if rng is None:
+            raise ValueError(f"Periode tidak dikenali: {period!r}")
+        return rng
+    return scope_range(scope, year, month, week, today)
+
+
 @router.get("/leaderboard")
-def leaderboard(
+async def leaderboard(
     scope: str = Query("month", description="week | month | year"),
     year: Optional[int] = Query(None, description="YYYY (opsional, default: sekarang)"),
     month: Optional[int] = Query(None, ge=1, le=12, description="1-12, untuk scope=month"),
     week: Optional[int] = Query(None, ge=1, le=53, description="ISO week, untuk scope=week"),
+    period: Optional[str] = Query(None, description="Periode bebas, mis. 'minggu lalu', '3 bulan terakhir', 'sejak agustus' (menggantikan scope)"),
+    since: Optional[date] = Query(None, description="Tanggal awal YYYY-MM-DD (opsional, menggantikan scope/period)"),
+    until: Optional[date] = Query(None, description="Tanggal akhir YYYY-MM-DD (opsional, default hari ini)"),
 ) -> Dict[str, Any]:
     try:
         today = date.today()
@@ -139,60 +330,20 @@ def leaderboard(
             w = None
             iso_year = None
 
-        col = get_collection()
-        # ChromaDB no longer allows "ids" in include; ids are always returned
-        got = col.get(include=["documents", "metadatas"], limit=100000)
-        docs: List[str] = got.get("documents") or []
-        ids: List[str] = got.get("ids") or []
-        metas: List[dict] = got.get("metadatas") or []
-
-        totals: Dict[str, Dict[str, Any]] = {}
-        rx = re.compile(r"(20\d{2})-(\d{2})-(\d{2}).*?sejauh\s+([0-9]+(?:[.,][0-9]+)?)\s*km", re.IGNORECASE)
-
-        for i, text in enumerate(docs):
-            member = None
-            md = metas[i] if i < len(metas) else {}
-            if isinstance(md, dict) and md.get("member_name"):
-                member = str(md["member_name"]).strip()
-            if not member:
-                member = (ids[i] if i < len(ids) else f"member-{i}")
-
-            if not text:
-                continue
-
-            for match in rx.finditer(text):
-                yy, mm, dd, km = match.groups()
-                try:
-                    dt = date(int(yy), int(mm), int(dd))
-                    val = float(km.replace(",", "."))
-                except Exception:
-                    continue
-
-                ok = False
-                if scope == "year":
-                    ok = (dt.year == y)
-                elif scope == "month":
-                    ok = (dt.year == y and dt.month == (m or today.month))
-                elif scope == "week":
-                    iso_info = dt.isocalendar()  # (iso_year, iso_week, iso_weekday)
-                    ok = (iso_info[0] == (iso_year or y) and iso_info[1] == (w or 1))
-
-                if not ok:
-                    continue
-
-                if member not in totals:
-                    totals[member] = {"member": member, "total_km": 0.0, "activities": 0}
-                totals[member]["total_km"] += val
-                totals[member]["activities"] += 1
-
-        # sort desc by total_km
-        board = sorted(totals.values(), key=lambda x: x["total_km"], reverse=True)
+        rng = _board_range(scope, iso_year or y, m, w, period, since, until, today)
+
+        # scan koleksi + agregasi jalan bersama per halaman -> pool I/O
+        # leaderboard yang sama diminta banyak orang bersamaan -> satu scan koleksi
+        key = (rng.start, rng.end, get_data_version())
+        with stage("board"):
+            board = await single_flight.do("leaderboard", key, lambda: run_io(compute_leaderboard, date_range=rng))
         return {
             "status": "ok",
             "scope": scope,
             "year": y,
             "month": m,
             "week": w,
+            "period": rng.as_dict(),
             "leaderboard": [
                 {"rank": i + 1, **{"member": r["member"], "total_km": round(r["total_km"], 2), "activities": r["activities"]}}
                 for i, r in enumerate(board)
@@ -202,3 +353,46 @@ def leaderboard(
     except Exception as e:
         logger.exception(f"/leaderboard error: {e}")
         return {"status": "error", "message": str(e), "time": now_str()}
+
+
+# ==================================================
+# Statistik Member (rollup hasil sync: PB, seri, streak)
+# ==================================================
+def _member_not_found(name: str) -> Dict[str, Any]:
+    return {
+        "status": "not_found",
+        "message": f"Statistik member '{name}' belum ada (nama salah atau belum /strava/refresh).",
+        "time": now_str(),
+    }
+
+
+@router.get("/member/{name}/stats")
+async def member_stats_endpoint(name: str) -> Dict[str, Any]:
+    """PB per jarak, lari terjauh/tercepat, pace rata-rata & distribusinya, streak, volume mingguan."""
+    try:
+        stats = await run_io(member_stats, name)
+        if stats is None:
+            return _member_not_found(name)
+        return {"status": "ok", "member": stats["member"], "stats": stats, "time": now_str()}
+    except Exception as e:
+        logger.exception(f"/member/stats error: {e}")
+        return {"status": "error", "message": str(e), "time": now_str()}
+
+
+@router.get("/member/{name}/timeseries")
+async def member_timeseries_endpoint(
+    name: str,
+    interval: str = Query("week", description="week | month"),
+    period: Optional[str] = Query(None, description="Periode bebas, mis. '3 bulan terakhir' (opsional)"),
+    since: Optional[date] = Query(None, description="Tanggal awal YYYY-MM-DD (opsional)"),
+    until: Optional[date] = Query(None, description="Tanggal akhir YYYY-MM-DD (opsional, default hari ini)"),
+) -> Dict[str, Any]:
+    try:
+        rng = _board_range("all", None, None, None, period, since, until, date.today())
+        series = await run_io(member_timeseries, name, interval, rng)
+        if series is None:
+            return _member_not_found(name)
+        return {"status": "ok", **series, "period": rng.as_dict() if rng else None, "time": now_str()}
+    except Exception as e:
+        logger.exception(f"/member/timeseries error: {e}")
+        return {"status": "error", "message": str(e), "time": now_str()}
@@ -0,0 +1,311 @@
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta
+import hashlib
+import json
+import os
+import re
+import shutil
+import numpy as np
+from app.core.config import settings
+from app.core.logger import logger
+from app.core.tenant import current_club, list_clubs, tenant_path, use_club
+from app.core.utils import now_str, timer
+from app.services.chroma.db_client import (
+    forget_collection,
+    get_active_collection_name,
+    get_chroma_client,
+    get_collection,
+    versioned_collection_name,
+    write_alias,
+)
+from app.services.chroma.manager import bump_data_version, scan_collection
+from app.services.chroma.numpy_index import install_index
+from app.services.gsheet.state_store import get_state_store
+from app.services.gsheet.sync import sync_lock
+
+
+# ==================================================
+# ARTIFACT INDEX (cold start tanpa Google Sheet / embedding ulang)
+# ==================================================
+# <ARTIFACT_DIR>[/clubs/<club>]/<YYYYmmddHHMMSS>/
+#   manifest.json   versi format, klub, model embedding, dimensi, jumlah dokumen, sha256 tiap file
+#   embeddings.npy  float32 (n, dim), urutan sama dengan docs.jsonl -> bisa di-memory-map
+#   docs.jsonl      {"id", "document", "metadata"} per baris
+#   state.json      doc_state (hash/watermark), sync_meta, member_rollups koleksi sumber
+ARTIFACT_FORMAT = 1
+_VERSION_RX = re.compile(r"^\d{14}$")
+_FILES = ("embeddings.npy", "docs.jsonl", "state.json")
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def artifact_root(club: Optional[str] = None) -> str:
+    return tenant_path(settings.ARTIFACT_DIR, club)
+
+
+def latest_artifact(root: Optional[str] = None) -> Optional[str]:
+    """Folder versi terbaru (nama timestamp terbesar) yang punya manifest, atau None."""
+    root = root or artifact_root()
+    try:
+        versions = sorted(
+            d for d in os.listdir(root)
+            if _VERSION_RX.match(d) and os.path.isfile(os.path.join(root, d, "manifest.json"))
+        )
+    except OSError:
+        return None
+    return os.path.join(root, versions[-1]) if versions else None
+
+
+def _resolve(path: str) -> str:
+    """`path` boleh folder versi (ada manifest.json) atau folder klub (ambil versi terbaru)."""
+    if os.path.isfile(os.path.join(path, "manifest.json")):
+        return path
+    latest = latest_artifact(path)
+    if latest is None:
+        raise FileNotFoundError(f"Tidak ada artifact (manifest.json) di {path}")
+    return latest
+
+
+def read_manifest(path: str, verify: bool = True) -> Dict[str, Any]:
+    """Baca manifest; `verify` -> cek versi format + sha256 semua file (artifact rusak/terpotong ditolak)."""
+    with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != ARTIFACT_FORMAT:
+        raise ValueError(f"Format artifact {manifest.get('format')} tidak didukung (butuh {ARTIFACT_FORMAT}).")
+    if verify:
+        for name, info in (manifest.get("files") or {}).items():
+            file_path = os.path.join(path, name)
+            if not os.path.isfile(file_path) or _sha256(file_path) != info.get("sha256"):
+                raise ValueError(f"Checksum artifact tidak cocok: {name}")
+    return manifest
+
+
+# ==================================================
+# EXPORT
+# ==================================================
+@timer
+def export_artifact(out_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Tulis koleksi aktif klub ini + state sync-nya sebagai artifact versi baru.
+    Ditulis ke folder `.tmp` lalu di-rename, jadi pembaca tidak pernah melihat artifact setengah jadi.
+    """
+    collection_name = get_active_collection_name()
+    collection = get_collection(collection_name)
+    version = datetime.now().strftime("%Y%m%d%H%M%S")
+    target = os.path.join(out_dir or artifact_root(), version)
+    if os.path.exists(target):
+        # versi wajib 14 digit (latest_artifact, nama koleksi saat import) -> tidak bisa diberi suffix
+        raise RuntimeError(f"Artifact versi {version} sudah ada ({target}); ekspor lagi setelah satu detik.")
+    tmp = f"{target}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    blocks: List[np.ndarray] = []
+    count = 0
+    with open(os.path.join(tmp, "docs.jsonl"), "w", encoding="utf-8") as f:
+        # per halaman (SCAN_PAGE_SIZE): dokumen langsung ditulis, embedding dikumpulkan per blok float32
+        for page in scan_collection("full", collection=collection):
+            ids = page["ids"]
+            embs = page.get("embeddings")
+            if embs is None or len(embs) != len(ids):
+                raise RuntimeError("Halaman koleksi tanpa embedding lengkap; artifact tidak dibuat.")
+            docs = page.get("documents") or [""] * len(ids)
+            metas = page.get("metadatas") or [{}] * len(ids)
+            for doc_id, text, md in zip(ids, docs, metas):
+                f.write(json.dumps({"id": doc_id, "document": text, "metadata": md or {}}, ensure_ascii=False) + "\n")
+            blocks.append(np.asarray(embs, dtype=np.float32))
+            count += len(ids)
+    if not count:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise RuntimeError(f"Koleksi '{collection_name}' kosong; tidak ada yang diekspor.")
+    matrix = np.concatenate(blocks)
+    np.save(os.path.join(tmp, "embeddings.npy"), matrix)
+
+    store = get_state_store()
+    meta = store.get_meta(collection_name)
+    with open(os.path.join(tmp, "state.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "doc_state": store.doc_rows(collection_name),
+            "meta": meta,
+            "rollups": store.rollups(collection_name),
+        }, f, ensure_ascii=False)
+
+    manifest = {
+        "format": ARTIFACT_FORMAT,
+        "version": version,
+        "club": current_club(),
+        "collection": collection_name,
+        "model_id": settings.EMBEDDING_MODEL,
+        "dim": int(matrix.shape[1]),
+        "documents": count,
+        # penanda kesegaran data: sync terakhir koleksi sumber
+        "synced_at": meta.get("last_sync_at") or now_str(),
+        "created_at": now_str(),
+        "files": {name: {"sha256": _sha256(os.path.join(tmp, name)), "bytes": os.path.getsize(os.path.join(tmp, name))} for name in _FILES},
+    }
+    with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    try:
+        os.replace(tmp, target)
+    except OSError as e:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise RuntimeError(f"Artifact versi {version} sudah ada ({target}); ekspor lagi setelah satu detik.") from e
+    logger.info(f"Artifact diekspor: {target} ({count} dokumen, model {settings.EMBEDDING_MODEL}).")
+    return {"status": "ok", "path": target, **{k: manifest[k] for k in ("version", "club", "documents", "dim", "synced_at")}}
+
+
+# ==================================================
+# IMPORT
+# ==================================================
+def _local_state() -> Dict[str, Any]:
+    name = get_active_collection_name()
+    meta = get_state_store().get_meta(name)
+    return {"collection": name, "documents": get_collection(name).count(), "synced_at": meta.get("last_sync_at")}
+
+
+def _needs_import(manifest: Dict[str, Any], local: Dict[str, Any]) -> Optional[str]:
+    """Alasan import (store kosong / lebih lama dari artifact), atau None kalau store lokal sudah setara/lebih baru."""
+    if not local["documents"]:
+        return "empty"
+    # timestamp "YYYY-mm-dd HH:MM:SS" -> urutan string == urutan waktu
+    if local["synced_at"] and manifest.get("synced_at") and str(local["synced_at"]) < str(manifest["synced_at"]):
+        return "older"
+    return None
+
+
+def _bulk_load(name: str, path: str, manifest: Dict[str, Any]) -> Dict[str, Any]:
+    """Isi koleksi baru `name` dari artifact: embedding dibaca via memmap dan di-upsert per batch besar."""
+    matrix = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+    with open(os.path.join(path, "docs.jsonl"), "r", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    if len(rows) != matrix.shape[0] or len(rows) != manifest.get("documents"):
+        raise ValueError(f"Artifact tidak konsisten: {len(rows)} dokumen vs {matrix.shape[0]} embedding.")
+
+    collection = get_collection(name)
+    try:
+        batch = max(1, min(int(get_chroma_client().get_max_batch_size()), 5000))
+    except Exception:
+        batch = 1000
+    for start in range(0, len(rows), batch):
+        chunk = rows[start:start + batch]
+        collection.upsert(
+            ids=[r["id"] for r in chunk],
+            documents=[r["document"] for r in chunk],
+            embeddings=matrix[start:start + len(chunk)].tolist(),
+            # Chroma menolak metadata dict kosong
+            metadatas=[r["metadata"] or None for r in chunk],
+        )
+    return {"rows": rows, "matrix": matrix}
+
+
+@timer
+def import_artifact(path: Optional[str] = None, force: bool = False) -> Dict[str, Any]:
+    """
+    Muat artifact ke koleksi versi baru klub aktif lalu tukar alias (seperti reindex):
+    - checksum + versi format + model embedding harus cocok
+    - tanpa `force`, hanya jalan kalau store lokal kosong atau sync terakhirnya lebih lama
+    - state sync (hash, watermark, rollup) ikut dipulihkan -> sync inkremental berikutnya tidak embed ulang
+    - index NumPy dipasang langsung dari embeddings.npy (memmap), tanpa scan Chroma
+    """
+    path = _resolve(path or artifact_root())
+    manifest = read_manifest(path)
+    if manifest.get("model_id") != settings.EMBEDDING_MODEL:
+        raise ValueError(f"Model artifact '{manifest.get('model_id')}' berbeda dengan EMBEDDING_MODEL '{settings.EMBEDDING_MODEL}'.")
+    # lock yang sama dengan sync/reindex: upsert ke koleksi lama di tengah import akan hilang setelah swap
+    with sync_lock():
+        local = _local_state()
+        reason = "force" if force else _needs_import(manifest, local)
+        if reason is None:
+            return {"status": "skipped", "reason": "local_up_to_date", "path": path, "local": local, "artifact_synced_at": manifest.get("synced_at")}
+
+        name = _target_collection(manifest["version"])
+        try:
+            get_chroma_client().create_collection(name=name)
+            loaded = _bulk_load(name, path, manifest)
+            count = get_collection(name).count()
+            if count != manifest["documents"]:
+                raise RuntimeError(f"Validasi gagal: koleksi '{name}' berisi {count} dokumen, artifact {manifest['documents']}.")
+
+            with open(os.path.join(path, "state.json"), "r", encoding="utf-8") as f:
+                state = json.load(f)
+            store = get_state_store()
+            store.clear_collection(name)
+            store.record_docs(name, state.get("doc_state") or [])
+            store.set_meta(name, {**(state.get("meta") or {}), "artifact_version": manifest["version"], "artifact_imported_at": now_str()})
+            store.put_rollups(name, state.get("rollups") or [])
+
+            previous = local["collection"] if local["collection"] != name else None
+            write_alias(name, previous)
+        except Exception:
+            _discard_collection(name)
+            raise
+        bump_data_version()
+        rows = loaded["rows"]
+        install_index([r["id"] for r in rows], [r["document"] for r in rows], [r["metadata"] for r in rows], loaded["matrix"])
+    logger.info(f"Artifact {manifest['version']} dimuat ke '{name}' ({len(rows)} dokumen, alasan: {reason}).")
+    return {"status": "ok", "reason": reason, "path": path, "collection": name, "previous": previous, "documents": len(rows)}
+
+
+def _collection_exists(name: str) -> bool:
+    for col in get_chroma_client().list_collections():
+        if (col if isinstance(col, str) else getattr(col, "name", "")) == name:
+            return True
+    return False
+
+
+def _target_collection(version: str) -> str:
+    """
+    Koleksi baru (kosong) untuk artifact `version`. Sisa import lama dengan nama sama (mis. sudah di-rollback)
+    dibuang dulu supaya dokumen di luar artifact tidak tertinggal; kalau nama itu justru koleksi aktif
+    (re-import paksa), import masuk ke versi bertimestamp baru dan koleksi aktif tetap melayani.
+    """
+    name = versioned_collection_name(version)
+    if not _collection_exists(name):
+        return name
+    if name == get_active_collection_name():
+        stamp = datetime.now()
+        while _collection_exists(name):
+            name = versioned_collection_name(stamp.strftime("%Y%m%d%H%M%S"))
+            stamp += timedelta(seconds=1)
+        return name
+    get_chroma_client().delete_collection(name)
+    forget_collection(name)
+    get_state_store().clear_collection(name)
+    logger.info(f"Koleksi import lama '{name}' dibuang sebelum import ulang.")
+    return name
+
+
+def _discard_collection(name: str) -> None:
+    """Import gagal sebelum swap: buang koleksi setengah jadi + state-nya (koleksi aktif tidak disentuh)."""
+    try:
+        if name != get_active_collection_name():
+            get_chroma_client().delete_collection(name)
+            forget_collection(name)
+            get_state_store().clear_collection(name)
+    except Exception as e:
+        logger.warning(f"Gagal membuang koleksi import '{name}': {e}")
+
+
+def import_on_startup() -> Dict[str, Any]:
+    """Warmup: untuk tiap klub yang punya artifact, muat kalau store lokal kosong / lebih lama."""
+    if not settings.ARTIFACT_IMPORT_ON_STARTUP or not (settings.ARTIFACT_DIR or "").strip():
+        return {"enabled": False}
+    results: Dict[str, Any] = {}
+    for club in list_clubs():
+        with use_club(club):
+            latest = latest_artifact()
+            if latest is None:
+                continue
+            try:
+                out = import_artifact(latest)
+                results[club] = {k: out.get(k) for k in ("status", "reason", "documents")}
+            except Exception as e:
+                logger.exception(f"Import artifact klub '{club}' gagal: {e}")
+                results[club] = {"status": "error", "message": str(e)}
+    return {"enabled": True, "clubs": results}
@@ -1,35 +1,175 @@
 from app.core.config import settings
 from app.core.logger import logger
-import chromadb
+from app.core.utils import now_str
+from app.core.tenant import DEFAULT_CLUB, current_club, tenant_config
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import hashlib
+import json
 import os
+import threading
 
 
 # ==================================================
 # INIT CHROMA CLIENT
 # ==================================================
+_CLIENT = None
+_CLIENT_PATH = None
+_CLIENT_LOCK = threading.Lock()
+
+
 def get_chroma_client():
-    """Inisialisasi koneksi ke ChromaDB persistent client."""
+    """
+    Inisialisasi koneksi ke ChromaDB persistent client (satu instance per proses).
+    Dibuat di bawah lock: PersistentClient yang dibuat bersamaan dari beberapa thread
+    (warmup + request pertama) bisa bentrok di registry internal Chroma.
+    """
+    global _CLIENT, _CLIENT_PATH
+    if _CLIENT is not None and _CLIENT_PATH == settings.CHROMA_PATH:
+        return _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is not None and _CLIENT_PATH == settings.CHROMA_PATH:
+            return _CLIENT
+        try:
+            # import chromadb (berat) ditunda sampai client benar-benar dibutuhkan
+            import chromadb
+
+            os.makedirs(settings.CHROMA_PATH, exist_ok=True)
+            client = chromadb.PersistentClient(path=settings.CHROMA_PATH)
+            logger.info(f"Chroma client connected at {settings.CHROMA_PATH}")
+            _CLIENT, _CLIENT_PATH = client, settings.CHROMA_PATH
+            return client
+        except Exception as e:
+            logger.exception(f"Gagal konek ke ChromaDB: {e}")
+            raise e
+
+
+# ==================================================
+# ALIAS KOLEKSI (dipersist, ditukar saat reindex)
+# ==================================================
+# cache per file alias (satu file per klub): path -> {"mtime", "data"}
+_ALIAS_CACHE: Dict[str, Dict[str, Any]] = {}
+_ALIAS_LOCK = threading.Lock()
+
+
+def _alias_path() -> str:
+    club = current_club()
+    name = "collection_alias.json" if club == DEFAULT_CLUB else f"collection_alias__{club}.json"
+    return os.path.join(settings.CHROMA_PATH, name)
+
+
+def read_alias() -> Dict[str, Any]:
+    """
+    Isi file alias klub aktif: {"active": nama koleksi aktif, "previous": versi sebelumnya, ...}.
+    Dibaca ulang hanya kalau mtime file berubah.
+    """
+    path = _alias_path()
     try:
-        os.makedirs(settings.CHROMA_PATH, exist_ok=True)
-        client = chromadb.PersistentClient(path=settings.CHROMA_PATH)
-        logger.info(f"Chroma client connected at {settings.CHROMA_PATH}")
-        return client
-    except Exception as e:
-        logger.exception(f"Gagal konek ke ChromaDB: {e}")
-        raise e
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+    cached = _ALIAS_CACHE.get(path)
+    if cached is None or cached["mtime"] != mtime:
+        with _ALIAS_LOCK:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    cached = {"mtime": mtime, "data": json.load(f)}
+                _ALIAS_CACHE[path] = cached
+            except Exception as e:
+                logger.warning(f"Gagal membaca alias koleksi: {e}")
+                return dict((_ALIAS_CACHE.get(path) or {}).get("data") or {})
+    return dict(cached["data"])
+
+
+def write_alias(active: str, previous: Optional[str]) -> Dict[str, Any]:
+    """Tulis alias secara atomik (tmp + os.replace) supaya pembaca tidak pernah lihat file setengah jadi."""
+    os.makedirs(settings.CHROMA_PATH, exist_ok=True)
+    data = {"active": active, "previous": previous, "updated_at": now_str()}
+    path = _alias_path()
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+    logger.info(f"Alias koleksi -> {active} (sebelumnya: {previous})")
+    return data
+
+
+def get_base_collection_name() -> str:
+    """Nama koleksi dasar klub aktif (CHROMA_COLLECTION untuk klub default)."""
+    return tenant_config()["collection"]
+
+
+# Chroma membatasi nama koleksi 63 karakter; suffix versi "_vYYYYmmddHHMMSS" makan 16
+_MAX_COLLECTION_NAME = 63
+_VERSION_SUFFIX_LEN = len("_v20240101000000")
+
+
+def get_version_prefix() -> str:
+    """
+    Prefix nama versi koleksi klub aktif (`<base>_v`). Base yang terlalu panjang
+    (CHROMA_COLLECTION + id klub panjang) dipotong + hash pendek supaya versi tetap muat.
+    """
+    base = get_base_collection_name()
+    room = _MAX_COLLECTION_NAME - _VERSION_SUFFIX_LEN
+    if len(base) > room:
+        digest = hashlib.md5(base.encode("utf-8")).hexdigest()[:8]
+        base = f"{base[:room - len(digest) - 1]}_{digest}"
+    return f"{base}_v"
+
+
+def versioned_collection_name(version: str) -> str:
+    """Nama koleksi versi `version` (YYYYmmddHHMMSS) untuk klub aktif."""
+    return f"{get_version_prefix()}{version}"
+
+
+def get_active_collection_name() -> str:
+    """Nama koleksi yang sedang dilayani untuk klub aktif: hasil alias, default nama koleksi dasar klub."""
+    return read_alias().get("active") or get_base_collection_name()
 
 
 # ==================================================
-# INIT / GET COLLECTION
+# INIT / GET COLLECTION (handle di-cache LRU)
 # ==================================================
-def get_collection():
-    """Mengambil atau membuat koleksi default (strava_club)."""
+_HANDLES: "OrderedDict[str, Any]" = OrderedDict()
+_HANDLES_LOCK = threading.Lock()
+
+
+def _max_handles() -> int:
+    # aktif + shadow reindex per klub
+    return max(2, 2 * int(settings.TENANT_CACHE_MAX))
+
+
+def get_collection(name: Optional[str] = None):
+    """
+    Mengambil atau membuat koleksi aktif (lewat alias) atau koleksi `name` tertentu.
+    Handle disimpan LRU supaya request berikutnya tidak bolak-balik ke sysdb Chroma.
+    """
     try:
+        name = name or get_active_collection_name()
+        with _HANDLES_LOCK:
+            collection = _HANDLES.get(name)
+            if collection is not None:
+                _HANDLES.move_to_end(name)
+                return collection
         client = get_chroma_client()
-        collection = client.get_or_create_collection(name=settings.CHROMA_COLLECTION)
-        logger.info(f"Collection aktif: {settings.CHROMA_COLLECTION}")
+        collection = client.get_or_create_collection(name=name)
+        with _HANDLES_LOCK:
+            _HANDLES[name] = collection
+            while len(_HANDLES) > _max_handles():
+                _HANDLES.popitem(last=False)
+        logger.info(f"Collection aktif: {name}")
         return collection
     except Exception as e:
         logger.exception(f"Gagal membuat/mengambil koleksi: {e}")
         raise e
 
+
+def forget_collection(name: str) -> None:
+    """Buang handle yang di-cache (wajib setelah delete_collection; koleksi baru punya id berbeda)."""
+    with _HANDLES_LOCK:
+        _HANDLES.pop(name, None)
+
+
+def open_collection_handles() -> int:
+    return len(_HANDLES)
+
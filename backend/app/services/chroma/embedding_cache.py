@@ -0,0 +1,172 @@
+from typing import Any, Dict, List, Optional, Sequence
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from app.core.config import settings
+from app.core.logger import logger
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key       TEXT PRIMARY KEY,
+    model_id  TEXT NOT NULL,
+    dim       INTEGER NOT NULL,
+    vec       BLOB NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used);
+"""
+# SQLite membatasi jumlah parameter per statement
+_IN_CHUNK = 500
+
+
+def cache_key(model_id: str, text: str) -> str:
+    """Alamat konten: sha256(model id + teks persis). Teks/model beda sedikit saja -> key beda."""
+    return hashlib.sha256(f"{model_id}\0{text}".encode("utf-8")).hexdigest()
+
+
+# ==================================================
+# EMBEDDING CACHE (SQLite WAL, blob float32, eviction LRU berbasis ukuran)
+# ==================================================
+class EmbeddingCache:
+    """
+    Cache embedding dokumen lintas koleksi/klub/reindex, dialamatkan oleh hash(model + teks).
+    Reset koleksi, reindex, atau perubahan template yang hanya menyentuh sebagian member
+    cukup meng-encode teks yang belum pernah dilihat; sisanya dibaca dari disk.
+    Ukuran dibatasi `max_bytes`: entri yang paling lama tidak dipakai dibuang lebih dulu.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max(0, int(max_bytes))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+        # perkiraan ukuran berjalan: SUM(LENGTH(vec)) hanya dihitung ulang saat perkiraan lewat batas
+        self._approx_bytes = self.size_bytes()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        """{key: embedding} untuk key yang ada; waktu pakai terakhir diperbarui (LRU)."""
+        found: Dict[str, List[float]] = {}
+        conn = self._conn()
+        unique = list(dict.fromkeys(keys))
+        for start in range(0, len(unique), _IN_CHUNK):
+            chunk = unique[start:start + _IN_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            for key, dim, blob in conn.execute(f"SELECT key, dim, vec FROM embeddings WHERE key IN ({marks})", chunk):
+                vec = np.frombuffer(blob, dtype=np.float32)
+                if vec.shape[0] == dim:
+                    found[key] = vec.tolist()
+        if found:
+            now = time.time()
+            with conn:
+                conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, k) for k in found])
+        with self._lock:
+            self.hits += sum(1 for k in keys if k in found)
+            self.misses += sum(1 for k in keys if k not in found)
+        return found
+
+    def put_many(self, model_id: str, items: Dict[str, Sequence[float]]) -> int:
+        if not items:
+            return 0
+        now = time.time()
+        rows = []
+        for key, emb in items.items():
+            vec = np.asarray(emb, dtype=np.float32)
+            rows.append((key, model_id, int(vec.shape[0]), vec.tobytes(), now))
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model_id, dim, vec, last_used) VALUES (?, ?, ?, ?, ?)", rows
+            )
+        with self._lock:
+            # key yang di-replace ikut terhitung (kelebihan saja) -> dikoreksi saat _evict menghitung ulang
+            self._approx_bytes += sum(len(r[3]) for r in rows)
+            over = self.max_bytes and self._approx_bytes > self.max_bytes
+        if over:
+            self._evict()
+        return len(rows)
+
+    def size_bytes(self) -> int:
+        row = self._conn().execute("SELECT COALESCE(SUM(LENGTH(vec)), 0) FROM embeddings").fetchone()
+        return int(row[0])
+
+    def _evict(self) -> None:
+        """Lewat batas -> buang entri LRU sampai ~90% batas (histeresis supaya tidak evict tiap put)."""
+        if not self.max_bytes:
+            return
+        conn = self._conn()
+        total = self.size_bytes()
+        with self._lock:
+            self._approx_bytes = total
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        victims = []
+        for key, size in conn.execute("SELECT key, LENGTH(vec) FROM embeddings ORDER BY last_used ASC").fetchall():
+            if total <= target:
+                break
+            victims.append((key,))
+            total -= size
+        with conn:
+            conn.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+        with self._lock:
+            self.evicted += len(victims)
+            self._approx_bytes = total
+        logger.info(f"Embedding cache: {len(victims)} entri lama dibuang (ukuran {total / 1e6:.1f} MB).")
+
+    def clear(self) -> None:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM embeddings")
+        with self._lock:
+            self._approx_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        row = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(vec)), 0) FROM embeddings").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "enabled": True,
+            "entries": int(row[0]),
+            "size_mb": round(int(row[1]) / 1e6, 2),
+            "max_mb": round(self.max_bytes / 1e6, 2),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evicted": self.evicted,
+        }
+
+
+_CACHE: Optional[EmbeddingCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Cache global per proses (dibagi semua klub: teks + model sama = embedding sama); None kalau nonaktif."""
+    global _CACHE
+    if not settings.EMBEDDING_CACHE_ENABLED or not (settings.EMBEDDING_CACHE_DB or "").strip():
+        return None
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = EmbeddingCache(settings.EMBEDDING_CACHE_DB, int(settings.EMBEDDING_CACHE_MAX_MB * 1e6))
+    return _CACHE
+
+
+def embedding_cache_stats() -> Dict[str, Any]:
+    cache = get_embedding_cache()
+    return cache.stats() if cache is not None else {"enabled": False}
@@ -1,18 +1,38 @@
 from app.core.logger import logger
 from app.core.config import settings
-from sentence_transformers import SentenceTransformer
 import numpy as np
+import threading
 
 
 # ==================================================
-# LOAD MODEL SEKALI SAJA
+# LOAD MODEL SEKALI SAJA (lazy: saat encode pertama / warmup, bukan saat import)
 # ==================================================
-try:
-    logger.info(f"Memuat model embedding: {settings.EMBEDDING_MODEL}")
-    model = SentenceTransformer(settings.EMBEDDING_MODEL)
-except Exception as e:
-    logger.exception(f"Gagal memuat model embedding: {e}")
-    model = None
+_MODEL = None
+_MODEL_FAILED = False
+_MODEL_LOCK = threading.Lock()
+
+
+def get_model():
+    """
+    SentenceTransformer untuk EMBEDDING_MODEL, dimuat sekali per proses di bawah lock.
+    Import sentence_transformers (torch) ikut ditunda ke sini, jadi CLI yang tidak
+    meng-embed (reset/rollback/gc) tidak membayarnya. Gagal muat -> None (tidak dicoba ulang).
+    """
+    global _MODEL, _MODEL_FAILED
+    if _MODEL is not None or _MODEL_FAILED:
+        return _MODEL
+    with _MODEL_LOCK:
+        if _MODEL is not None or _MODEL_FAILED:
+            return _MODEL
+        try:
+            from sentence_transformers import SentenceTransformer
+
+            logger.info(f"Memuat model embedding: {settings.EMBEDDING_MODEL}")
+            _MODEL = SentenceTransformer(settings.EMBEDDING_MODEL)
+        except Exception as e:
+            logger.exception(f"Gagal memuat model embedding: {e}")
+            _MODEL_FAILED = True
+    return _MODEL
 
 
 # ==================================================
@@ -24,6 +44,7 @@ def embed_texts(texts):
     Return: list[np.ndarray]
     """
     try:
+        model = get_model()
         if not model:
             raise ValueError("Model embedding belum dimuat.")
         embeddings = model.encode(texts, show_progress_bar=False, normalize_embeddings=True)
@@ -33,3 +54,46 @@ def embed_texts(texts):
         logger.exception(f"Gagal generate embedding: {e}")
         return []
 
+
+# ==================================================
+# ENCODE DOKUMEN (lewat embedding cache persisten)
+# ==================================================
+def embed_documents(texts):
+    """
+    Seperti embed_texts, tapi untuk dokumen yang di-index (sync / reindex): embedding dicari dulu di
+    cache disk (key = hash model + teks persis) dan hanya teks yang belum pernah dilihat yang di-encode.
+    Urutan hasil sama dengan `texts`; kalau encode gagal -> [] (sama seperti embed_texts).
+    """
+    from app.services.chroma.embedding_cache import cache_key, get_embedding_cache
+
+    cache = None
+    try:
+        cache = get_embedding_cache()
+    except Exception as e:
+        logger.warning(f"Embedding cache tidak bisa dibuka, encode langsung: {e}")
+    if cache is None or not texts:
+        return embed_texts(texts)
+
+    model_id = settings.EMBEDDING_MODEL
+    keys = [cache_key(model_id, t) for t in texts]
+    try:
+        found = cache.get_many(keys)
+    except Exception as e:
+        logger.warning(f"Baca embedding cache gagal, encode langsung: {e}")
+        return embed_texts(texts)
+
+    # teks identik dalam satu batch cukup di-encode sekali
+    missing = list(dict.fromkeys(k for k in keys if k not in found))
+    if missing:
+        text_by_key = dict(zip(keys, texts))
+        fresh = embed_texts([text_by_key[k] for k in missing])
+        if len(fresh) != len(missing):
+            return []
+        new_items = dict(zip(missing, fresh))
+        found.update(new_items)
+        try:
+            cache.put_many(model_id, new_items)
+        except Exception as e:
+            logger.warning(f"Tulis embedding cache gagal: {e}")
+    logger.info(f"Embedding dokumen: {len(texts) - len(missing)} dari cache, {len(missing)} di-encode.")
+    return [found[k] for k in keys]
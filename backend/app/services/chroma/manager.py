@@ -1,6 +1,168 @@
-from app.services.chroma.db_client import get_collection, get_chroma_client
+from app.services.chroma.db_client import get_collection, get_chroma_client, get_active_collection_name, forget_collection
 from app.core.logger import logger
 from app.core.config import settings
+from app.core.tenant import current_club
+from app.services.gsheet.state_store import get_state_store
+from typing import Any, Dict, Iterator, Optional, Tuple
+import threading
+import time
+
+
+# ==================================================
+# DATA VERSION per klub (naik tiap kali isi koleksi klub berubah)
+# ==================================================
+_DATA_VERSIONS: Dict[str, int] = {}
+_VERSION_LOCK = threading.Lock()
+
+
+def get_data_version() -> int:
+    """Versi data koleksi klub aktif di proses ini; dipakai cache/index untuk deteksi stale."""
+    follow_shared_marker()
+    return _DATA_VERSIONS.get(current_club(), 0)
+
+
+def bump_data_version() -> int:
+    """Naikkan versi data klub aktif (dipanggil setelah upsert/delete/reset)."""
+    club = current_club()
+    with _VERSION_LOCK:
+        _DATA_VERSIONS[club] = _DATA_VERSIONS.get(club, 0) + 1
+        version = _DATA_VERSIONS[club]
+    # perubahan dari proses ini sendiri (swap alias sudah ditulis) bukan sinyal untuk follow
+    remember_data_marker()
+    return version
+
+
+# ==================================================
+# PENANDA DATA BERSAMA (banyak worker)
+# ==================================================
+# versi data di atas hanya milik proses ini; worker lain tahu data berubah lewat penanda
+# (koleksi aktif, data_token) di state store, dicek paling sering tiap DATA_MARKER_CHECK_SECONDS per klub
+_SEEN_MARKERS: Dict[str, Tuple[str, Optional[str]]] = {}
+_MARKER_CHECKED_AT: Dict[str, float] = {}
+
+
+def _data_marker() -> Tuple[str, Optional[str]]:
+    collection = get_active_collection_name()
+    return collection, get_state_store().get_meta(collection).get("data_token")
+
+
+def remember_data_marker() -> None:
+    """Catat penanda terbaru sebagai sudah dilihat (dipanggil setelah proses ini sendiri mengubah data)."""
+    club = current_club()
+    try:
+        marker = _data_marker()
+    except Exception as e:
+        logger.warning(f"Gagal membaca penanda data klub '{club}': {e}")
+        return
+    with _VERSION_LOCK:
+        _SEEN_MARKERS[club] = marker
+        _MARKER_CHECKED_AT[club] = time.monotonic()
+
+
+def follow_shared_marker(force: bool = False) -> bool:
+    """
+    Penanda bersama beda dari yang terakhir dilihat (sync /refresh, reindex, import di worker lain)
+    -> naikkan versi data lokal: semantic cache, index NumPy, dan cache nama member jadi stale.
+    Tanpa `force` dibatasi DATA_MARKER_CHECK_SECONDS per klub (jalur request lewat get_data_version).
+    """
+    club = current_club()
+    interval = float(settings.DATA_MARKER_CHECK_SECONDS)
+    now = time.monotonic()
+    with _VERSION_LOCK:
+        last = _MARKER_CHECKED_AT.get(club)
+        if not force and (interval <= 0 or (last is not None and now - last < interval)):
+            return False
+        # dicatat sebelum baca supaya request paralel tidak ikut membaca state store
+        _MARKER_CHECKED_AT[club] = now
+    try:
+        marker = _data_marker()
+    except Exception as e:
+        logger.warning(f"Gagal membaca penanda data klub '{club}': {e}")
+        return False
+    with _VERSION_LOCK:
+        seen = _SEEN_MARKERS.get(club)
+        _SEEN_MARKERS[club] = marker
+        if seen is None or seen == marker:
+            return False
+        _DATA_VERSIONS[club] = _DATA_VERSIONS.get(club, 0) + 1
+    logger.info(f"Data klub '{club}' diubah worker lain ({marker[0]}), versi data lokal dinaikkan.")
+    return True
+
+
+# ==================================================
+# SCAN KOLEKSI (per halaman, memori terbatas)
+# ==================================================
+# proyeksi: hanya field yang diminta yang diambil dari Chroma (ids selalu ikut)
+PROJECTIONS: Dict[str, Tuple[str, ...]] = {
+    "ids": (),
+    "metadatas": ("metadatas",),
+    "documents": ("documents", "metadatas"),
+    "embeddings": ("embeddings", "metadatas"),
+    "full": ("documents", "metadatas", "embeddings"),
+}
+
+
+def _page_size(page_size: Optional[int]) -> int:
+    return max(1, int(page_size or settings.SCAN_PAGE_SIZE))
+
+
+def scan_collection(projection: str = "metadatas", page_size: Optional[int] = None, collection=None, where: Optional[dict] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Generator halaman koleksi (`{"ids": [...], "documents"/"metadatas"/"embeddings": ...}`),
+    masing-masing maksimal `page_size` dokumen (default SCAN_PAGE_SIZE).
+    Dipakai untuk semua operasi seluruh-koleksi supaya memori terbatas dan tidak ada
+    pemotongan diam-diam di batas `limit`. Paginasi pakai offset: tulis yang terjadi
+    bersamaan bisa menggeser halaman (cukup untuk agregat/scan nama; reindex pakai koleksi baru).
+    """
+    if projection not in PROJECTIONS:
+        raise ValueError(f"Proyeksi scan tidak dikenal: {projection}")
+    collection = collection or get_collection()
+    size = _page_size(page_size)
+    include = list(PROJECTIONS[projection])
+    offset = 0
+    while True:
+        kwargs: Dict[str, Any] = {"include": include, "limit": size, "offset": offset}
+        if where:
+            kwargs["where"] = where
+        page = collection.get(**kwargs)
+        ids = page.get("ids") or []
+        if not ids:
+            return
+        yield page
+        if len(ids) < size:
+            return
+        offset += len(ids)
+
+
+def iter_documents(projection: str = "documents", page_size: Optional[int] = None, collection=None, where: Optional[dict] = None) -> Iterator[Tuple[str, Optional[str], Dict[str, Any]]]:
+    """Per dokumen: (id, teks atau None, metadata) dari scan_collection."""
+    for page in scan_collection(projection, page_size, collection, where):
+        ids = page["ids"]
+        docs = page.get("documents") or [None] * len(ids)
+        metas = page.get("metadatas") or [None] * len(ids)
+        for doc_id, text, md in zip(ids, docs, metas):
+            yield doc_id, text, md if isinstance(md, dict) else {}
+
+
+def scan_ids(page_size: Optional[int] = None, collection=None) -> Iterator[str]:
+    for page in scan_collection("ids", page_size, collection):
+        yield from page["ids"]
+
+
+def delete_all_documents(collection=None, batch_size: Optional[int] = None) -> int:
+    """Hapus seluruh dokumen per batch (ambil halaman pertama -> hapus -> ulang). Return jumlah terhapus."""
+    collection = collection or get_collection()
+    size = _page_size(batch_size)
+    deleted = 0
+    while True:
+        ids = collection.get(include=[], limit=size).get("ids") or []
+        if not ids:
+            break
+        collection.delete(ids=ids)
+        deleted += len(ids)
+    if deleted:
+        bump_data_version()
+    return deleted
 
 
 # ==================================================
@@ -16,11 +178,33 @@ def upsert_document(doc_id: str, text: str, embedding: list, metadata: dict = No
             embeddings=[embedding],
             metadatas=[metadata or {}],
         )
+        bump_data_version()
         logger.info(f"Upsert dokumen '{doc_id}' berhasil.")
     except Exception as e:
         logger.exception(f"Gagal upsert dokumen '{doc_id}': {e}")
 
 
+def upsert_documents(ids: list, texts: list, embeddings: list, metadatas: list = None, collection=None):
+    """Upsert banyak dokumen dalam satu panggilan (dipakai sync batch). Error dilempar ke pemanggil."""
+    collection = collection or get_collection()
+    collection.upsert(
+        ids=list(ids),
+        documents=list(texts),
+        embeddings=list(embeddings),
+        metadatas=list(metadatas or [{} for _ in ids]),
+    )
+    bump_data_version()
+    logger.info(f"Upsert {len(ids)} dokumen berhasil.")
+
+
+def update_metadatas(ids: list, metadatas: list, collection=None):
+    """Ganti metadata dokumen tanpa re-embed (migrasi skema metadata). Error dilempar ke pemanggil."""
+    collection = collection or get_collection()
+    collection.update(ids=list(ids), metadatas=list(metadatas))
+    bump_data_version()
+    logger.info(f"Metadata {len(ids)} dokumen diperbarui.")
+
+
 # ==================================================
 # QUERY / RETRIEVE
 # ==================================================
@@ -45,6 +229,7 @@ def delete_document(doc_id: str):
     try:
         collection = get_collection()
         collection.delete(ids=[doc_id])
+        bump_data_version()
         logger.info(f"Dokumen '{doc_id}' berhasil dihapus.")
     except Exception as e:
         logger.exception(f"Gagal hapus dokumen '{doc_id}': {e}")
@@ -54,20 +239,18 @@ def delete_document(doc_id: str):
 # RESET SEMUA
 # ==================================================
 def reset_collection():
-    """Hapus semua isi koleksi (warning!)."""
+    """Hapus semua isi koleksi aktif (warning! untuk ganti tanpa downtime pakai reindex)."""
     try:
         client = get_chroma_client()
         try:
-            client.delete_collection(settings.CHROMA_COLLECTION)
+            name = get_active_collection_name()
+            client.delete_collection(name)
+            forget_collection(name)
             logger.warning("Koleksi ChromaDB dihapus. Akan dibuat ulang saat next access.")
         except Exception:
-            # Jika delete_collection tidak tersedia/bermasalah, fallback delete by ids
-            collection = get_collection()
-            # ChromaDB: omit include; ids are always returned
-            got = collection.get(limit=100000)
-            ids = got.get("ids") or []
-            if ids:
-                collection.delete(ids=ids)
-            logger.warning("Semua dokumen di koleksi ChromaDB telah dihapus (fallback by ids).")
+            # Jika delete_collection tidak tersedia/bermasalah, fallback delete by ids (per batch)
+            deleted = delete_all_documents(get_collection())
+            logger.warning(f"Semua dokumen ({deleted}) di koleksi ChromaDB telah dihapus (fallback by ids).")
+        bump_data_version()
     except Exception as e:
         logger.exception(f"Gagal reset koleksi: {e}")
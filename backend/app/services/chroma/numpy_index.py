@@ -0,0 +1,479 @@
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.core.logger import logger
+from app.core.utils import md5_hash
+from app.services.chroma.db_client import get_active_collection_name, get_collection
+from app.services.chroma.manager import get_data_version, scan_collection
+from app.core.tenant import tenant_path, tenant_state
+from app.services.gsheet.state_store import get_state_store
+import numpy as np
+import hashlib
+import threading
+import json
+import os
+
+
+QUANTIZATIONS = ("none", "int8", "binary")
+
+# jumlah bit 1 per byte (popcount) untuk jarak Hamming kode biner (NumPy < 2.0 tanpa bitwise_count)
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+# baris per blok saat dekuantisasi int8 -> float32 (blok kecil: memori sementara tetap di cache CPU)
+_BLOCK_ROWS = 256
+
+
+# ==================================================
+# KUANTISASI (first-pass kandidat)
+# ==================================================
+def quantize_int8(matrix: np.ndarray) -> tuple:
+    """int8 per baris: kode = round(x / max|x| * 127); skor ~= (q . kode) * scale."""
+    codes = np.empty(matrix.shape, dtype=np.int8)
+    scales = np.empty(matrix.shape[0], dtype=np.float32)
+    for start in range(0, matrix.shape[0], _BLOCK_ROWS):
+        block = np.asarray(matrix[start:start + _BLOCK_ROWS], dtype=np.float32)
+        peak = np.abs(block).max(axis=1) if block.size else np.zeros(len(block), dtype=np.float32)
+        peak[peak == 0] = 1.0
+        codes[start:start + len(block)] = np.rint(block / peak[:, None] * 127.0).astype(np.int8)
+        scales[start:start + len(block)] = peak / 127.0
+    return codes, scales
+
+
+def quantize_binary(matrix: np.ndarray) -> np.ndarray:
+    """1 bit per dimensi (tanda), dipack 8 dimensi per byte."""
+    if not matrix.shape[0]:
+        return np.zeros((0, (matrix.shape[1] + 7) // 8), dtype=np.uint8)
+    return np.concatenate([
+        np.packbits(np.asarray(matrix[start:start + _BLOCK_ROWS]) > 0, axis=1)
+        for start in range(0, matrix.shape[0], _BLOCK_ROWS)
+    ])
+
+
+def _hamming(codes: np.ndarray, bits: np.ndarray) -> np.ndarray:
+    """Jarak Hamming tiap baris `codes` ke `bits` (uint8 packed)."""
+    diff = np.bitwise_xor(codes, bits)
+    if hasattr(np, "bitwise_count"):
+        if diff.shape[1] % 8 == 0:
+            # 8 byte sekaligus -> popcount 8x lebih sedikit elemen
+            diff = diff.view(np.uint64)
+        return np.bitwise_count(diff).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT[diff].sum(axis=1, dtype=np.int32)
+
+
+def _top_indices(row: np.ndarray, k: int) -> np.ndarray:
+    """Index k skor tertinggi, urut menurun."""
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(row):
+        top = np.argpartition(-row, k - 1)[:k]
+        return top[np.argsort(-row[top])]
+    return np.argsort(-row)[:k]
+
+
+# ==================================================
+# INDEX EXACT-SEARCH IN-PROCESS (NumPy)
+# ==================================================
+class NumpyIndex:
+    """
+    Index exact-search sederhana untuk koleksi kecil/menengah.
+    - matrix: float32 (n, d) C-contiguous, sudah dinormalisasi (cosine = dot product)
+    - ids/documents/metadatas: sejajar dengan baris matrix
+    - quantization int8/binary: kode kecil di RAM untuk first-pass kandidat, lalu
+      kandidat di-rerank exact dari matrix float32 (memmap; hanya baris kandidat yang dibaca)
+    Hasil query/get meniru format Chroma supaya retriever tidak perlu tahu backend-nya.
+    """
+
+    _MASK_MAX_CARDINALITY = 256
+    _MIN_CANDIDATES = 32
+
+    def __init__(self, ids: List[str], documents: List[str], metadatas: List[dict], matrix: np.ndarray,
+                 quantization: str = "none", codes: Optional[np.ndarray] = None, scales: Optional[np.ndarray] = None,
+                 rerank_factor: Optional[int] = None):
+        self.ids = list(ids)
+        self.documents = list(documents)
+        self.metadatas = [md if isinstance(md, dict) else {} for md in metadatas]
+        self.matrix = matrix
+        self.quantization = quantization if quantization in QUANTIZATIONS else "none"
+        self.rerank_factor = max(1, int(rerank_factor if rerank_factor is not None else settings.NUMPY_INDEX_RERANK_FACTOR))
+        self.codes = codes
+        self.scales = scales
+        # hash isi (id + md5 dokumen) dari meta.json kalau dimuat dari disk
+        self.content_hash: Optional[str] = None
+        if self.quantization != "none" and self.codes is None and self.size:
+            self._quantize()
+        self._row: Dict[str, int] = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        self._columns: Dict[str, np.ndarray] = {}
+        self._masks: Dict[tuple, np.ndarray] = {}
+        self._build_columns()
+
+    @property
+    def size(self) -> int:
+        return len(self.ids)
+
+    def _quantize(self) -> None:
+        if self.quantization == "int8":
+            self.codes, self.scales = quantize_int8(self.matrix)
+        else:
+            self.codes = quantize_binary(self.matrix)
+
+    def memory_bytes(self) -> Dict[str, int]:
+        """Ukuran vektor: `resident` = kode first-pass (RAM), `float32` = matrix penuh (memmap kalau dari disk)."""
+        resident = 0
+        if self.codes is not None:
+            resident += int(self.codes.nbytes) + (int(self.scales.nbytes) if self.scales is not None else 0)
+        return {"resident": resident, "float32": int(self.matrix.nbytes) if self.size else 0}
+
+    def _build_columns(self) -> None:
+        keys = set()
+        for md in self.metadatas:
+            keys.update(md.keys())
+        for key in keys:
+            col = np.array([md.get(key) for md in self.metadatas], dtype=object)
+            self._columns[key] = col
+            # precompute mask untuk kolom dengan kardinalitas kecil (filter paling sering)
+            values = set(v for v in col.tolist() if isinstance(v, (str, int, float, bool)))
+            if len(values) <= self._MASK_MAX_CARDINALITY:
+                for v in values:
+                    self._masks[(key, v)] = col == v
+
+    def _eq_mask(self, key: str, value: Any) -> np.ndarray:
+        cached = self._masks.get((key, value))
+        if cached is not None:
+            return cached
+        col = self._columns.get(key)
+        if col is None:
+            return np.zeros(self.size, dtype=bool)
+        return col == value
+
+    def _cmp_mask(self, key: str, op: str, value: Any) -> np.ndarray:
+        col = self._columns.get(key)
+        if col is None:
+            return np.zeros(self.size, dtype=bool)
+        if op == "$eq":
+            return self._eq_mask(key, value)
+        if op == "$ne":
+            return ~self._eq_mask(key, value)
+        if op == "$in":
+            mask = np.zeros(self.size, dtype=bool)
+            for v in value or []:
+                mask |= self._eq_mask(key, v)
+            return mask
+        if op == "$nin":
+            mask = np.ones(self.size, dtype=bool)
+            for v in value or []:
+                mask &= ~self._eq_mask(key, v)
+            return mask
+        # perbandingan numerik: nilai non-numerik dianggap tidak lolos
+        nums = np.array([v if isinstance(v, (int, float)) and not isinstance(v, bool) else np.nan for v in col.tolist()], dtype=np.float64)
+        with np.errstate(invalid="ignore"):
+            if op == "$gt":
+                return nums > value
+            if op == "$gte":
+                return nums >= value
+            if op == "$lt":
+                return nums < value
+            if op == "$lte":
+                return nums <= value
+        raise ValueError(f"Operator filter tidak didukung: {op}")
+
+    def mask_for(self, where: Optional[dict]) -> Optional[np.ndarray]:
+        """Terjemahkan filter gaya Chroma (`where`) jadi boolean mask. None = tanpa filter."""
+        if not where:
+            return None
+        mask = np.ones(self.size, dtype=bool)
+        for key, cond in where.items():
+            if key == "$and":
+                for sub in cond:
+                    sub_mask = self.mask_for(sub)
+                    if sub_mask is not None:
+                        mask &= sub_mask
+            elif key == "$or":
+                any_mask = np.zeros(self.size, dtype=bool)
+                for sub in cond:
+                    sub_mask = self.mask_for(sub)
+                    any_mask |= sub_mask if sub_mask is not None else True
+                mask &= any_mask
+            elif isinstance(cond, dict):
+                for op, value in cond.items():
+                    mask &= self._cmp_mask(key, op, value)
+            else:
+                mask &= self._eq_mask(key, cond)
+        return mask
+
+    def _approx_scores(self, q: np.ndarray) -> np.ndarray:
+        """Skor kasar (n_query, n_docs) dari kode terkuantisasi; query tetap float32."""
+        out = np.empty((q.shape[0], self.size), dtype=np.float32)
+        if self.quantization == "int8":
+            for start in range(0, self.size, _BLOCK_ROWS):
+                block = self.codes[start:start + _BLOCK_ROWS].astype(np.float32)
+                out[:, start:start + len(block)] = (q @ block.T) * self.scales[start:start + len(block)]
+            return out
+        # binary: skor = -jarak Hamming antar tanda
+        for i, bits in enumerate(np.packbits(q > 0, axis=1)):
+            out[i] = -_hamming(self.codes, bits)
+        return out
+
+    def query(self, query_embeddings: List[list], n_results: int = 5, where: Optional[dict] = None) -> Dict[str, Any]:
+        """Top-k vectorized untuk satu atau banyak query sekaligus (format hasil = Chroma)."""
+        out: Dict[str, Any] = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if self.size == 0 or not len(query_embeddings):
+            for key in out:
+                out[key] = [[] for _ in range(len(query_embeddings))]
+            return out
+
+        q = np.asarray(query_embeddings, dtype=np.float32)
+        if q.ndim == 1:
+            q = q[None, :]
+        two_stage = self.codes is not None
+        scores = self._approx_scores(q) if two_stage else q @ self.matrix.T  # (n_query, n_docs)
+        mask = self.mask_for(where)
+        if mask is not None:
+            scores = np.where(mask[None, :], scores, -np.inf)
+        allowed = self.size if mask is None else int(mask.sum())
+        k = max(0, min(n_results, allowed))
+        n_candidates = min(allowed, max(k * self.rerank_factor, self._MIN_CANDIDATES))
+
+        for qi, row in enumerate(scores):
+            if two_stage and k:
+                # rerank exact: baca baris float32 kandidat saja (urut index -> akses memmap berurutan)
+                candidates = np.sort(_top_indices(row, n_candidates))
+                exact = np.asarray(self.matrix[candidates], dtype=np.float32) @ q[qi]
+                order = _top_indices(exact, k)
+                top, top_scores = candidates[order], exact[order]
+            else:
+                top = _top_indices(row, k)
+                top_scores = row[top]
+            out["ids"].append([self.ids[i] for i in top])
+            out["documents"].append([self.documents[i] for i in top])
+            out["metadatas"].append([self.metadatas[i] for i in top])
+            out["distances"].append([float(1.0 - s) for s in top_scores])
+        return out
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[dict] = None, limit: Optional[int] = None) -> Dict[str, Any]:
+        """Ambil dokumen by id / filter (format hasil = Chroma)."""
+        if ids is not None:
+            rows = [self._row[i] for i in ids if i in self._row]
+        else:
+            mask = self.mask_for(where)
+            rows = list(range(self.size)) if mask is None else np.flatnonzero(mask).tolist()
+        if limit is not None:
+            rows = rows[:limit]
+        return {
+            "ids": [self.ids[i] for i in rows],
+            "documents": [self.documents[i] for i in rows],
+            "metadatas": [self.metadatas[i] for i in rows],
+        }
+
+
+# ==================================================
+# BUILD / PERSIST / LOAD
+# ==================================================
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+
+def _quantization() -> str:
+    mode = (settings.NUMPY_INDEX_QUANTIZATION or "none").lower()
+    if mode not in QUANTIZATIONS:
+        logger.warning(f"NUMPY_INDEX_QUANTIZATION tidak dikenal '{mode}', pakai 'none'.")
+        return "none"
+    return mode
+
+
+def content_hash(pairs) -> str:
+    """Sidik isi koleksi: sha256 atas (doc_id, md5 teks) terurut; sama dengan content_hash di doc_state."""
+    h = hashlib.sha256()
+    for doc_id, doc_hash in sorted(pairs):
+        h.update(f"{doc_id}\0{doc_hash}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _index_content_hash(index: NumpyIndex) -> str:
+    return content_hash((doc_id, md5_hash(doc or "")) for doc_id, doc in zip(index.ids, index.documents))
+
+
+def _save_index(index: NumpyIndex, index_dir: str) -> None:
+    os.makedirs(index_dir, exist_ok=True)
+    arrays = {"embeddings": index.matrix}
+    if index.codes is not None:
+        arrays["codes"] = index.codes
+    if index.scales is not None:
+        arrays["scales"] = index.scales
+    for name, array in arrays.items():
+        np.save(os.path.join(index_dir, f"{name}.tmp.npy"), array)
+    tmp_meta = os.path.join(index_dir, "meta.tmp.json")
+    with open(tmp_meta, "w", encoding="utf-8") as f:
+        json.dump({
+            "ids": index.ids, "documents": index.documents, "metadatas": index.metadatas, "quantization": index.quantization,
+            # penanda kecocokan saat dimuat ulang: model embedding, dimensi, dan isi dokumen
+            "model_id": settings.EMBEDDING_MODEL,
+            "dim": int(index.matrix.shape[1]) if index.size else 0,
+            "content_hash": _index_content_hash(index),
+        }, f, ensure_ascii=False)
+    for name in arrays:
+        os.replace(os.path.join(index_dir, f"{name}.tmp.npy"), os.path.join(index_dir, f"{name}.npy"))
+    os.replace(tmp_meta, os.path.join(index_dir, "meta.json"))
+
+
+def _load_saved_index(index_dir: str) -> Optional[NumpyIndex]:
+    npy_path = os.path.join(index_dir, "embeddings.npy")
+    meta_path = os.path.join(index_dir, "meta.json")
+    if not (os.path.exists(npy_path) and os.path.exists(meta_path)):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    # float32 tetap di disk (memmap); kode first-pass dimuat penuh ke RAM
+    matrix = np.load(npy_path, mmap_mode="r")
+    if matrix.shape[0] != len(meta.get("ids") or []):
+        return None
+    # index dari model lain / dimensi lain (atau format lama tanpa penanda) -> bangun ulang
+    if meta.get("model_id") != settings.EMBEDDING_MODEL or (matrix.shape[0] and meta.get("dim") != matrix.shape[1]):
+        logger.info(f"Index NumPy tersimpan tidak cocok (model {meta.get('model_id')}, dim {meta.get('dim')}); dibangun ulang.")
+        return None
+    mode = _quantization()
+    codes = scales = None
+    if mode != "none" and meta.get("quantization") == mode:
+        codes_path, scales_path = os.path.join(index_dir, "codes.npy"), os.path.join(index_dir, "scales.npy")
+        if os.path.exists(codes_path):
+            codes = np.load(codes_path)
+            scales = np.load(scales_path) if mode == "int8" and os.path.exists(scales_path) else None
+            if len(codes) != matrix.shape[0] or (mode == "int8" and scales is None):
+                codes = scales = None
+    index = NumpyIndex(meta["ids"], meta["documents"], meta["metadatas"], matrix, quantization=mode, codes=codes, scales=scales)
+    index.content_hash = meta.get("content_hash")
+    return index
+
+
+def _saved_index_matches(saved: NumpyIndex) -> bool:
+    """
+    Index tersimpan boleh dipakai kalau jumlah dokumen sama dengan koleksi aktif dan isinya
+    sama dengan doc_state koleksi itu (hash konten + model embedding per dokumen).
+    Koleksi tanpa doc_state (data lama) cukup dicek jumlahnya.
+    """
+    if saved.size != get_collection().count():
+        return False
+    states = get_state_store().doc_states(get_active_collection_name())
+    if not states:
+        return True
+    if any(model_id != settings.EMBEDDING_MODEL for _, model_id in states.values()):
+        return False
+    return saved.content_hash == content_hash((doc_id, h) for doc_id, (h, _) in states.items())
+
+
+def build_index(collection=None) -> Optional[NumpyIndex]:
+    """Bangun index dari koleksi Chroma, simpan ke disk, lalu muat ulang sebagai memmap."""
+    collection = collection or get_collection()
+    count = collection.count()
+    if count > settings.NUMPY_INDEX_MAX_DOCS:
+        logger.info(f"Index NumPy dilewati: {count} dokumen > batas {settings.NUMPY_INDEX_MAX_DOCS}.")
+        return None
+    ids: List[str] = []
+    documents: List[str] = []
+    metadatas: List[Dict[str, Any]] = []
+    blocks: List[np.ndarray] = []
+    # per halaman: embedding langsung dinormalisasi ke float32 (tanpa list-of-list seluruh koleksi)
+    for page in scan_collection("full", collection=collection):
+        page_ids = page["ids"]
+        embs = page.get("embeddings")
+        if embs is None or len(embs) != len(page_ids):
+            raise RuntimeError("Halaman koleksi tanpa embedding lengkap; index NumPy tidak dibangun.")
+        ids.extend(page_ids)
+        documents.extend(page.get("documents") or [""] * len(page_ids))
+        metadatas.extend(md if isinstance(md, dict) else {} for md in (page.get("metadatas") or [{}] * len(page_ids)))
+        blocks.append(_normalize_rows(np.asarray(embs, dtype=np.float32)))
+    matrix = np.concatenate(blocks) if blocks else np.zeros((0, 0), dtype=np.float32)
+    index = NumpyIndex(ids, documents, metadatas, matrix, quantization=_quantization())
+    try:
+        _save_index(index, tenant_path(settings.NUMPY_INDEX_DIR))
+        saved = _load_saved_index(tenant_path(settings.NUMPY_INDEX_DIR))
+        if saved is not None:
+            index = saved
+    except Exception as e:
+        logger.warning(f"Gagal menyimpan index NumPy ke disk, pakai versi in-memory: {e}")
+    logger.info(f"Index NumPy dibangun: {index.size} dokumen (kuantisasi {index.quantization}).")
+    return index
+
+
+# ==================================================
+# SINGLETON per klub (reload saat versi data berubah)
+# ==================================================
+def _enabled() -> bool:
+    return (getattr(settings, "RETRIEVAL_BACKEND", "chroma") or "chroma").lower() == "numpy"
+
+
+def _slot() -> Dict[str, Any]:
+    # {"index": NumpyIndex | None, "version": int | None, "lock"} di state klub aktif (ikut LRU klub);
+    # lock per klub: rebuild satu klub tidak menahan lookup klub lain
+    return tenant_state().setdefault("numpy_index", {"index": None, "version": None, "lock": threading.Lock()})
+
+
+def _rebuild(slot: Dict[str, Any]) -> Optional[NumpyIndex]:
+    """Dipanggil dengan slot["lock"] dipegang."""
+    version = get_data_version()
+    try:
+        slot["index"] = build_index()
+    except Exception as e:
+        logger.exception(f"Gagal membangun index NumPy: {e}")
+        slot["index"] = None
+    slot["version"] = version
+    return slot["index"]
+
+
+def reload_index() -> Optional[NumpyIndex]:
+    """Bangun ulang index klub aktif (dipanggil setelah sinkronisasi selesai)."""
+    if not _enabled():
+        return None
+    slot = _slot()
+    with slot["lock"]:
+        return _rebuild(slot)
+
+
+def get_index() -> Optional[NumpyIndex]:
+    """
+    Index aktif klub ini kalau RETRIEVAL_BACKEND=numpy dan ukuran koleksi di bawah batas.
+    Return None -> pemanggil fallback ke Chroma.
+    """
+    if not _enabled():
+        return None
+    slot = _slot()
+    if slot["version"] is None:
+        # pertama kali klub ini diakses: coba pakai file index tersimpan kalau masih cocok dengan koleksi
+        with slot["lock"]:
+            if slot["version"] is None:
+                try:
+                    saved = _load_saved_index(tenant_path(settings.NUMPY_INDEX_DIR))
+                    if saved is not None and _saved_index_matches(saved):
+                        slot["index"], slot["version"] = saved, get_data_version()
+                        logger.info(f"Index NumPy dimuat dari disk: {saved.size} dokumen.")
+                    elif saved is not None:
+                        logger.info("Index NumPy tersimpan tidak cocok dengan koleksi aktif; dibangun ulang.")
+                except Exception as e:
+                    logger.warning(f"Gagal memuat index NumPy dari disk: {e}")
+    if slot["version"] != get_data_version():
+        with slot["lock"]:
+            # pembaca lain yang antri di lock ini sudah dapat index hasil rebuild pertama
+            if slot["version"] != get_data_version():
+                _rebuild(slot)
+    index = slot["index"]
+    if index is None or index.size > settings.NUMPY_INDEX_MAX_DOCS:
+        return None
+    return index
+
+
+def install_index(ids: List[str], documents: List[str], metadatas: List[dict], matrix: np.ndarray) -> Optional[NumpyIndex]:
+    """
+    Pasang index klub aktif langsung dari embedding yang sudah ada (import artifact), tanpa scan Chroma.
+    Dipanggil setelah versi data dinaikkan; file index ditulis lalu dimuat ulang sebagai memmap.
+    """
+    if not _enabled() or len(ids) > settings.NUMPY_INDEX_MAX_DOCS:
+        return None
+    index = NumpyIndex(ids, documents, metadatas, _normalize_rows(np.asarray(matrix, dtype=np.float32)), quantization=_quantization())
+    try:
+        _save_index(index, tenant_path(settings.NUMPY_INDEX_DIR))
+        index = _load_saved_index(tenant_path(settings.NUMPY_INDEX_DIR)) or index
+    except Exception as e:
+        logger.warning(f"Gagal menyimpan index NumPy ke disk, pakai versi in-memory: {e}")
+    slot = _slot()
+    with slot["lock"]:
+        slot["index"], slot["version"] = index, get_data_version()
+    return index
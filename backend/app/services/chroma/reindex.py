@@ -0,0 +1,217 @@
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+import contextvars
+import threading
+from app.core.config import settings
+from app.core.logger import logger
+from app.core.utils import md5_hash, now_str, timer
+from app.services.chroma.db_client import (
+    forget_collection,
+    get_active_collection_name,
+    get_base_collection_name,
+    get_chroma_client,
+    get_collection,
+    get_version_prefix,
+    read_alias,
+    versioned_collection_name,
+    write_alias,
+)
+from app.core.tenant import current_club
+from app.services.chroma.embeddings import embed_documents
+from app.services.chroma.manager import bump_data_version, scan_ids
+from app.services.chroma.numpy_index import reload_index
+from app.services.gsheet.sync import build_member_texts, doc_metadata, doc_state_rows, load_sheet_records, sync_lock
+from app.services.gsheet.state_store import get_state_store
+from app.services.rag.date_range import DOC_META_VERSION
+from app.services.rag.member_stats import rollup_docs
+
+
+# ==================================================
+# STATUS REINDEX (satu reindex jalan dalam satu waktu, status per klub)
+# ==================================================
+_REINDEX_LOCK = threading.Lock()
+_STATUS_BY_CLUB: Dict[str, Dict[str, Any]] = {}
+
+
+def _status() -> Dict[str, Any]:
+    return _STATUS_BY_CLUB.setdefault(current_club(), {"state": "idle"})
+
+
+def reindex_status() -> Dict[str, Any]:
+    alias = read_alias()
+    return {
+        **_status(),
+        "club": current_club(),
+        "active": get_active_collection_name(),
+        "previous": alias.get("previous"),
+    }
+
+
+def _versioned_name() -> str:
+    return versioned_collection_name(datetime.now().strftime("%Y%m%d%H%M%S"))
+
+
+def _version_names() -> List[str]:
+    """Semua koleksi milik klub aktif (versi lama + koleksi awal tanpa suffix)."""
+    base = get_base_collection_name()
+    prefix = get_version_prefix()
+    client = get_chroma_client()
+    names = []
+    for col in client.list_collections():
+        name = col if isinstance(col, str) else getattr(col, "name", "")
+        if name == base or name.startswith(prefix):
+            names.append(name)
+    return sorted(names)
+
+
+# ==================================================
+# BUILD + VALIDASI SHADOW COLLECTION
+# ==================================================
+def _build_shadow(name: str, member_docs: List[Dict[str, str]]) -> None:
+    """Embed + upsert semua dokumen ke koleksi baru per batch (koleksi aktif tidak disentuh)."""
+    collection = get_collection(name)
+    batch = max(1, int(settings.REINDEX_BATCH_SIZE))
+    for start in range(0, len(member_docs), batch):
+        chunk = member_docs[start:start + batch]
+        embeddings = embed_documents([d["text"] for d in chunk])
+        if len(embeddings) != len(chunk):
+            raise RuntimeError(f"Embedding gagal untuk batch {start}-{start + len(chunk)}")
+        collection.upsert(
+            ids=[d["member_name"] for d in chunk],
+            documents=[d["text"] for d in chunk],
+            embeddings=embeddings,
+            metadatas=[doc_metadata(d) for d in chunk],
+        )
+        _status()["indexed"] = start + len(chunk)
+
+
+def _validate_shadow(name: str, member_docs: List[Dict[str, str]]) -> None:
+    """Jumlah dan id dokumen di koleksi baru harus sama persis dengan sumber (sheet)."""
+    collection = get_collection(name)
+    expected = {d["member_name"] for d in member_docs}
+    count = collection.count()
+    if count != len(expected):
+        raise RuntimeError(f"Validasi gagal: koleksi '{name}' berisi {count} dokumen, sumber {len(expected)} member.")
+    got = set(scan_ids(collection=collection))
+    missing = expected - got
+    if missing:
+        raise RuntimeError(f"Validasi gagal: {len(missing)} member tidak ada di koleksi '{name}'.")
+
+
+def _activate(name: str, previous: Optional[str]) -> None:
+    write_alias(name, previous)
+    bump_data_version()
+    reload_index()
+
+
+# ==================================================
+# API PUBLIK
+# ==================================================
+@timer
+def reindex_collection() -> Dict[str, Any]:
+    """
+    Reindex tanpa downtime:
+    1. baca sheet, bangun dokumen per member
+    2. embed + upsert ke koleksi versi baru (shadow), koleksi aktif tetap melayani
+    3. validasi jumlah/id dokumen vs sumber
+    4. tukar alias (atomik); versi lama disimpan sebagai `previous` untuk rollback
+    """
+    if not _REINDEX_LOCK.acquire(blocking=False):
+        return {"status": "error", "message": "Reindex lain sedang berjalan.", **reindex_status()}
+    try:
+        # sync dikunci dari baca sheet sampai swap: upsert ke koleksi lama di tengah rebuild akan hilang
+        with sync_lock():
+            return _reindex_locked()
+    finally:
+        _REINDEX_LOCK.release()
+
+
+def _reindex_locked() -> Dict[str, Any]:
+    name = _versioned_name()
+    try:
+        _status().clear()
+        _status().update({"state": "running", "collection": name, "started_at": now_str(), "indexed": 0})
+        data = load_sheet_records()
+        if not data:
+            raise RuntimeError("Tidak ada data di Google Sheet.")
+        import pandas as pd
+
+        df = pd.DataFrame(data)
+        member_docs = build_member_texts(df)
+        _status()["documents"] = len(member_docs)
+
+        _build_shadow(name, member_docs)
+        _validate_shadow(name, member_docs)
+        # state sync milik koleksi baru dicatat sebelum swap supaya sync inkremental lanjut normal
+        get_state_store().record_docs(name, doc_state_rows(member_docs, settings.EMBEDDING_MODEL))
+        get_state_store().set_meta(name, {"doc_meta_version": DOC_META_VERSION})
+        get_state_store().put_rollups(name, rollup_docs(member_docs, df, {}, md5_hash))
+
+        previous = get_active_collection_name()
+        _activate(name, previous)
+
+        _status().update({"state": "done", "finished_at": now_str()})
+        logger.info(f"Reindex selesai: {name} aktif ({len(member_docs)} dokumen), rollback ke {previous}.")
+        return {"status": "ok", **reindex_status()}
+    except Exception as e:
+        logger.exception(f"Reindex gagal: {e}")
+        _status().update({"state": "failed", "error": str(e), "finished_at": now_str()})
+        # shadow yang gagal dibuang; koleksi aktif tidak berubah
+        try:
+            if name != get_active_collection_name():
+                get_chroma_client().delete_collection(name)
+                forget_collection(name)
+                get_state_store().clear_collection(name)
+        except Exception:
+            pass
+        return {"status": "error", "message": str(e), **reindex_status()}
+
+
+def start_reindex_background() -> Dict[str, Any]:
+    """Jalankan reindex di thread terpisah; progres lewat reindex_status()."""
+    if _REINDEX_LOCK.locked():
+        return {"status": "error", "message": "Reindex lain sedang berjalan.", **reindex_status()}
+    # thread membawa context request (klub aktif)
+    ctx = contextvars.copy_context()
+    thread = threading.Thread(target=ctx.run, args=(reindex_collection,), name="reindex", daemon=True)
+    thread.start()
+    return {"status": "started", **reindex_status()}
+
+
+def rollback_collection() -> Dict[str, Any]:
+    """Kembalikan alias ke versi sebelumnya (instan, tanpa re-embed)."""
+    with _REINDEX_LOCK, sync_lock():
+        alias = read_alias()
+        previous = alias.get("previous")
+        if not previous or previous not in _version_names():
+            return {"status": "error", "message": "Tidak ada versi sebelumnya untuk rollback.", **reindex_status()}
+        # state sync tersimpan per koleksi, jadi versi lama langsung konsisten lagi
+        _activate(previous, get_active_collection_name())
+        logger.warning(f"Rollback koleksi ke {previous}.")
+        return {"status": "ok", **reindex_status()}
+
+
+def gc_collections(keep: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Hapus versi koleksi lama. Koleksi aktif dan `previous` selalu disimpan,
+    ditambah `keep` versi terbaru lainnya (default REINDEX_KEEP_VERSIONS).
+    """
+    keep = settings.REINDEX_KEEP_VERSIONS if keep is None else max(0, int(keep))
+    with _REINDEX_LOCK:
+        alias = read_alias()
+        protected = {get_active_collection_name(), alias.get("previous")}
+        candidates = [n for n in _version_names() if n not in protected]
+        # nama versi berformat _vYYYYmmddHHMMSS -> urut nama = urut waktu; koleksi awal dianggap paling lama
+        base = get_base_collection_name()
+        candidates.sort(key=lambda n: (n != base, n), reverse=True)
+        to_delete = candidates[keep:]
+        client = get_chroma_client()
+        for name in to_delete:
+            try:
+                client.delete_collection(name)
+                forget_collection(name)
+                get_state_store().clear_collection(name)
+                logger.info(f"Koleksi lama dihapus: {name}")
+            except Exception as e:
+                logger.warning(f"Gagal menghapus koleksi {name}: {e}")
+        return {"status": "ok", "deleted": to_delete, "kept": candidates[:keep], **reindex_status()}
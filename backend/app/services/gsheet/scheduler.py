@@ -0,0 +1,154 @@
+from typing import Any, Dict, List
+import asyncio
+import os
+import random
+import socket
+import time
+import uuid
+from app.core.config import settings
+from app.core.executors import run_io
+from app.core.logger import logger
+from app.core.tenant import list_clubs, normalize_club, use_club
+from app.core.utils import now_str
+from app.services.chroma.db_client import get_active_collection_name
+from app.services.chroma.manager import follow_shared_marker
+from app.services.chroma.numpy_index import reload_index
+from app.services.gsheet.state_store import get_state_store
+from app.services.gsheet.sync import probe_source, sync_gsheet_to_chroma
+
+
+# ==================================================
+# STATE SCHEDULER (per proses)
+# ==================================================
+# identitas worker ini untuk lease leader (host + pid + acak, unik per start)
+HOLDER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+_STATUS: Dict[str, Any] = {"state": "stopped", "holder": HOLDER_ID, "ticks": 0, "next_run_at": None, "clubs": {}}
+
+
+def scheduler_status() -> Dict[str, Any]:
+    return {**_STATUS, "enabled": settings.SYNC_SCHEDULER_ENABLED, "clubs": {c: dict(s) for c, s in _STATUS["clubs"].items()}}
+
+
+def _lease_ttl() -> float:
+    # default: dua kali interval maksimum -> leader yang hidup selalu sempat memperpanjang
+    if settings.SYNC_LEADER_LEASE_SECONDS > 0:
+        return float(settings.SYNC_LEADER_LEASE_SECONDS)
+    return 2.0 * (max(1.0, settings.SYNC_INTERVAL_SECONDS) + max(0.0, settings.SYNC_JITTER_SECONDS))
+
+
+def _next_delay() -> float:
+    interval = max(1.0, float(settings.SYNC_INTERVAL_SECONDS))
+    jitter = max(0.0, float(settings.SYNC_JITTER_SECONDS))
+    return max(1.0, interval + random.uniform(-jitter, jitter))
+
+
+def _scheduled_clubs() -> List[str]:
+    configured = [normalize_club(c) for c in (settings.SYNC_SCHEDULER_CLUBS or "").split(",") if c.strip()]
+    clubs = list_clubs()
+    return [c for c in configured if c in clubs] if configured else clubs
+
+
+# ==================================================
+# FOLLOWER: ikuti perubahan yang ditulis worker lain
+# ==================================================
+def _follow_shared_marker(club: str, stats: Dict[str, Any]) -> bool:
+    """
+    Cek penanda data bersama tiap tick (tanpa jeda DATA_MARKER_CHECK_SECONDS); kalau worker lain
+    mengubah data, index dibangun ulang sekarang supaya request berikutnya tidak menunggu rebuild.
+    """
+    if not follow_shared_marker(force=True):
+        return False
+    reload_index()
+    stats["followed"] += 1
+    return True
+
+
+# ==================================================
+# SATU TICK PER KLUB: lease -> probe -> sync kalau berubah
+# ==================================================
+def sync_club_if_changed(club: str, force: bool = False) -> Dict[str, Any]:
+    """
+    Sync terjadwal satu klub:
+    0. penanda data bersama berubah (sync/reindex di worker lain) -> segarkan state lokal
+    1. ambil/perpanjang lease `sync:<club>` (hanya satu worker yang jadi leader)
+    2. probe murah sumber data; fingerprint sama dengan sync terakhir -> selesai (tanpa download / embed)
+    3. berubah (atau probe gagal / jatah sync penuh SYNC_FULL_EVERY) -> sync_gsheet_to_chroma
+    """
+    with use_club(club):
+        store = get_state_store()
+        lease = f"sync:{club}"
+        stats = _STATUS["clubs"].setdefault(club, {"runs": 0, "unchanged": 0, "synced": 0, "errors": 0, "not_leader": 0, "followed": 0, "since_full": 0})
+        _follow_shared_marker(club, stats)
+        if not store.acquire_lease(lease, HOLDER_ID, _lease_ttl()):
+            stats["not_leader"] += 1
+            return {"club": club, "result": "not_leader", "leader": store.lease_holder(lease)}
+
+        start = time.perf_counter()
+        stats["runs"] += 1
+        collection = get_active_collection_name()
+        fingerprint = probe_source()
+        full_every = int(settings.SYNC_FULL_EVERY)
+        due_full = full_every > 0 and stats["since_full"] + 1 >= full_every
+        previous = store.get_meta(collection).get("source_fingerprint")
+
+        if not force and not due_full and fingerprint is not None and fingerprint == previous:
+            stats["unchanged"] += 1
+            stats["since_full"] += 1
+            store.set_meta(collection, {"last_probe_at": now_str()})
+            out = {"club": club, "result": "unchanged", "ms": round((time.perf_counter() - start) * 1000, 1)}
+            stats["last"] = {**out, "at": now_str()}
+            return out
+
+        result = sync_gsheet_to_chroma()
+        ms = round((time.perf_counter() - start) * 1000, 1)
+        if result.get("status") == "error":
+            stats["errors"] += 1
+            out = {"club": club, "result": "error", "message": result.get("message"), "ms": ms}
+        else:
+            stats["synced"] += 1
+            stats["since_full"] = 0
+            if fingerprint is not None:
+                store.set_meta(collection, {"source_fingerprint": fingerprint, "last_probe_at": now_str()})
+            out = {"club": club, "result": "synced", "updated": result.get("updated", 0), "skipped": result.get("skipped", 0), "ms": ms}
+        stats["last"] = {**out, "at": now_str()}
+        return out
+
+
+def release_leases() -> None:
+    """Lepas lease milik worker ini (shutdown) supaya worker lain bisa langsung jadi leader."""
+    store = get_state_store()
+    for club in _STATUS["clubs"]:
+        try:
+            store.release_lease(f"sync:{club}", HOLDER_ID)
+        except Exception as e:
+            logger.warning(f"Gagal melepas lease sync klub '{club}': {e}")
+
+
+# ==================================================
+# LOOP (dijalankan sebagai task di lifespan FastAPI)
+# ==================================================
+async def run_sync_scheduler() -> None:
+    """Loop scheduler: tick pertama setelah jitter acak, lalu tiap SYNC_INTERVAL_SECONDS ± SYNC_JITTER_SECONDS."""
+    if not settings.SYNC_SCHEDULER_ENABLED:
+        return
+    _STATUS["state"] = "running"
+    logger.info(f"Scheduler sync aktif (interval {settings.SYNC_INTERVAL_SECONDS}s ± {settings.SYNC_JITTER_SECONDS}s, holder {HOLDER_ID}).")
+    delay = random.uniform(0.0, max(0.0, float(settings.SYNC_JITTER_SECONDS)))
+    try:
+        while True:
+            _STATUS["next_run_at"] = round(time.time() + delay, 1)
+            await asyncio.sleep(delay)
+            _STATUS["ticks"] += 1
+            for club in _scheduled_clubs():
+                try:
+                    out = await run_io(sync_club_if_changed, club)
+                    if out["result"] in ("synced", "error"):
+                        logger.info(f"Scheduler sync: {out}")
+                except Exception as e:
+                    logger.exception(f"Scheduler sync klub '{club}' gagal: {e}")
+            delay = _next_delay()
+    except asyncio.CancelledError:
+        _STATUS["state"] = "stopped"
+        await run_io(release_leases)
+        raise
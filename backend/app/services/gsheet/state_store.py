@@ -0,0 +1,351 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from app.core.config import settings
+from app.core.logger import logger
+from app.core.utils import now_str
+
+
+LEGACY_HASH_PATH = "./cache/cache_hash.json"
+_HOST = socket.gethostname()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS doc_state (
+    collection    TEXT NOT NULL,
+    doc_id        TEXT NOT NULL,
+    content_hash  TEXT NOT NULL,
+    model_id      TEXT NOT NULL,
+    row_count     INTEGER NOT NULL DEFAULT 0,
+    last_row_date TEXT,
+    run_id        INTEGER,
+    updated_at    TEXT NOT NULL,
+    PRIMARY KEY (collection, doc_id)
+);
+CREATE TABLE IF NOT EXISTS sync_runs (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    collection  TEXT NOT NULL,
+    model_id    TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    started_at  TEXT NOT NULL,
+    finished_at TEXT,
+    total_docs  INTEGER NOT NULL DEFAULT 0,
+    updated     INTEGER NOT NULL DEFAULT 0,
+    skipped     INTEGER NOT NULL DEFAULT 0,
+    error       TEXT,
+    owner       TEXT
+);
+CREATE TABLE IF NOT EXISTS sync_meta (
+    collection TEXT NOT NULL,
+    key        TEXT NOT NULL,
+    value      TEXT,
+    PRIMARY KEY (collection, key)
+);
+CREATE TABLE IF NOT EXISTS member_rollups (
+    collection   TEXT NOT NULL,
+    member_key   TEXT NOT NULL,
+    member_name  TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    stats        TEXT NOT NULL,
+    updated_at   TEXT NOT NULL,
+    PRIMARY KEY (collection, member_key)
+);
+CREATE TABLE IF NOT EXISTS leases (
+    name       TEXT PRIMARY KEY,
+    holder     TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # proses ada, milik user lain
+    except OSError:
+        return False
+    return True
+
+
+def _run_abandoned(owner: Optional[str], started_at: str) -> bool:
+    """
+    Run 'running' dianggap terputus kalau:
+    - dimiliki proses ini sendiri (sync_lock per klub sedang kita pegang -> run itu sisa crash), atau
+    - pemiliknya proses lain di host yang sama dan pid-nya sudah mati, atau
+    - pemilik tidak bisa dicek (host lain / baris lama tanpa owner) dan umurnya > SYNC_RUN_STALE_SECONDS.
+    """
+    host, _, pid = (owner or "").rpartition(":")
+    if host == _HOST and pid.isdigit():
+        return int(pid) == os.getpid() or not _pid_alive(int(pid))
+    try:
+        started = time.mktime(time.strptime(started_at, "%Y-%m-%d %H:%M:%S"))
+    except (TypeError, ValueError):
+        return True
+    return time.time() - started > settings.SYNC_RUN_STALE_SECONDS
+
+
+# ==================================================
+# SYNC STATE STORE (SQLite WAL)
+# ==================================================
+class SyncStateStore:
+    """
+    State sinkronisasi per koleksi:
+    - doc_state: hash konten + model embedding + watermark baris per member
+    - sync_runs: riwayat run (running/ok/error/interrupted)
+    - sync_meta: watermark level sheet (jumlah baris, tanggal terakhir, fingerprint sumber)
+    - member_rollups: statistik per member (PB, seri mingguan/bulanan, streak) hasil sync
+    - leases: lock leader antar worker/proses (scheduler sync)
+    Setiap batch upsert dicatat dalam satu transaksi -> crash di tengah jalan
+    hanya mengulang batch yang belum tercatat.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+            # DB lama: sync_runs belum punya kolom owner
+            cols = {r[1] for r in conn.execute("PRAGMA table_info(sync_runs)").fetchall()}
+            if "owner" not in cols:
+                conn.execute("ALTER TABLE sync_runs ADD COLUMN owner TEXT")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ---------- dokumen ----------
+    def doc_states(self, collection: str) -> Dict[str, Tuple[str, str]]:
+        """{doc_id: (content_hash, model_id)} untuk satu koleksi."""
+        rows = self._conn().execute(
+            "SELECT doc_id, content_hash, model_id FROM doc_state WHERE collection = ?", (collection,)
+        ).fetchall()
+        return {r[0]: (r[1], r[2]) for r in rows}
+
+    def record_docs(self, collection: str, docs: Iterable[Dict[str, Any]], run_id: Optional[int] = None) -> int:
+        """Catat satu batch dokumen yang sudah di-upsert + naikkan counter run, dalam satu transaksi."""
+        now = now_str()
+        rows = [
+            (collection, d["doc_id"], d["content_hash"], d["model_id"], int(d.get("row_count") or 0), d.get("last_row_date"), run_id, now)
+            for d in docs
+        ]
+        with self._conn() as conn:
+            conn.executemany(
+                """
+                INSERT INTO doc_state (collection, doc_id, content_hash, model_id, row_count, last_row_date, run_id, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(collection, doc_id) DO UPDATE SET
+                    content_hash = excluded.content_hash,
+                    model_id = excluded.model_id,
+                    row_count = excluded.row_count,
+                    last_row_date = excluded.last_row_date,
+                    run_id = excluded.run_id,
+                    updated_at = excluded.updated_at
+                """,
+                rows,
+            )
+            if run_id is not None:
+                conn.execute("UPDATE sync_runs SET updated = updated + ? WHERE id = ?", (len(rows), run_id))
+        return len(rows)
+
+    def doc_rows(self, collection: str) -> List[Dict[str, Any]]:
+        """Baris doc_state lengkap (format record_docs) untuk ekspor artifact."""
+        rows = self._conn().execute(
+            "SELECT doc_id, content_hash, model_id, row_count, last_row_date FROM doc_state WHERE collection = ?", (collection,)
+        ).fetchall()
+        return [
+            {"doc_id": r[0], "content_hash": r[1], "model_id": r[2], "row_count": r[3], "last_row_date": r[4]}
+            for r in rows
+        ]
+
+    def delete_docs(self, collection: str, doc_ids: Iterable[str]) -> None:
+        with self._conn() as conn:
+            conn.executemany("DELETE FROM doc_state WHERE collection = ? AND doc_id = ?", [(collection, d) for d in doc_ids])
+
+    def clear_collection(self, collection: str) -> None:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM doc_state WHERE collection = ?", (collection,))
+            conn.execute("DELETE FROM sync_meta WHERE collection = ?", (collection,))
+            conn.execute("DELETE FROM member_rollups WHERE collection = ?", (collection,))
+
+    # ---------- riwayat run ----------
+    def start_run(self, collection: str, model_id: str) -> Tuple[int, List[int]]:
+        """
+        Mulai run baru; run lama yang masih 'running' ditandai 'interrupted' hanya kalau
+        pemiliknya sudah tidak ada (lihat `_run_abandoned`) -> run aktif di proses lain tidak diganggu.
+        """
+        with self._conn() as conn:
+            stale = [
+                r[0] for r in conn.execute(
+                    "SELECT id, owner, started_at FROM sync_runs WHERE collection = ? AND status = 'running'", (collection,)
+                ).fetchall()
+                if _run_abandoned(r[1], r[2])
+            ]
+            if stale:
+                conn.executemany(
+                    "UPDATE sync_runs SET status = 'interrupted', finished_at = ? WHERE id = ?",
+                    [(now_str(), rid) for rid in stale],
+                )
+            cur = conn.execute(
+                "INSERT INTO sync_runs (collection, model_id, status, started_at, owner) VALUES (?, ?, 'running', ?, ?)",
+                (collection, model_id, now_str(), f"{_HOST}:{os.getpid()}"),
+            )
+            return int(cur.lastrowid), stale
+
+    def finish_run(self, run_id: int, status: str, total_docs: int = 0, skipped: int = 0, error: Optional[str] = None) -> None:
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE sync_runs SET status = ?, finished_at = ?, total_docs = ?, skipped = ?, error = ? WHERE id = ?",
+                (status, now_str(), int(total_docs), int(skipped), error, run_id),
+            )
+
+    def runs(self, limit: int = 20, base_collection: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Riwayat run terbaru; `base_collection` -> hanya koleksi itu + versi reindex-nya (`<base>_v...`)."""
+        if base_collection:
+            escaped = base_collection.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            cur = self._conn().execute(
+                "SELECT * FROM sync_runs WHERE collection = ? OR collection LIKE ? ESCAPE '\\' ORDER BY id DESC LIMIT ?",
+                (base_collection, f"{escaped}\\_v%", int(limit)),
+            )
+        else:
+            cur = self._conn().execute("SELECT * FROM sync_runs ORDER BY id DESC LIMIT ?", (int(limit),))
+        cols = [c[0] for c in cur.description]
+        return [dict(zip(cols, r)) for r in cur.fetchall()]
+
+    # ---------- watermark sheet ----------
+    def set_meta(self, collection: str, values: Dict[str, Any]) -> None:
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT INTO sync_meta (collection, key, value) VALUES (?, ?, ?) "
+                "ON CONFLICT(collection, key) DO UPDATE SET value = excluded.value",
+                [(collection, k, json.dumps(v)) for k, v in values.items()],
+            )
+
+    def get_meta(self, collection: str) -> Dict[str, Any]:
+        rows = self._conn().execute("SELECT key, value FROM sync_meta WHERE collection = ?", (collection,)).fetchall()
+        return {k: json.loads(v) for k, v in rows}
+
+    # ---------- rollup statistik per member ----------
+    def rollup_hashes(self, collection: str) -> Dict[str, str]:
+        """{member_key: content_hash} rollup yang tersimpan (untuk hitung ulang hanya member yang berubah)."""
+        rows = self._conn().execute(
+            "SELECT member_key, content_hash FROM member_rollups WHERE collection = ?", (collection,)
+        ).fetchall()
+        return {r[0]: r[1] for r in rows}
+
+    def put_rollups(self, collection: str, rollups: Iterable[Dict[str, Any]]) -> int:
+        """Simpan rollup {member_name, content_hash, stats} dalam satu transaksi."""
+        now = now_str()
+        rows = [
+            (collection, r["member_name"].strip().lower(), r["member_name"], r["content_hash"], json.dumps(r["stats"], ensure_ascii=False), now)
+            for r in rollups
+        ]
+        with self._conn() as conn:
+            conn.executemany(
+                """
+                INSERT INTO member_rollups (collection, member_key, member_name, content_hash, stats, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(collection, member_key) DO UPDATE SET
+                    member_name = excluded.member_name,
+                    content_hash = excluded.content_hash,
+                    stats = excluded.stats,
+                    updated_at = excluded.updated_at
+                """,
+                rows,
+            )
+        return len(rows)
+
+    def get_rollup(self, collection: str, member_key: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT stats FROM member_rollups WHERE collection = ? AND member_key = ?", (collection, member_key)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def rollups(self, collection: str) -> List[Dict[str, Any]]:
+        """Semua rollup koleksi (format put_rollups) untuk ekspor artifact."""
+        rows = self._conn().execute(
+            "SELECT member_name, content_hash, stats FROM member_rollups WHERE collection = ?", (collection,)
+        ).fetchall()
+        return [{"member_name": r[0], "content_hash": r[1], "stats": json.loads(r[2])} for r in rows]
+
+    def rollup_signature(self, collection: str) -> Tuple[int, Optional[str]]:
+        """(jumlah rollup, updated_at terakhir): penanda murah untuk invalidasi cache agregat klub antar worker."""
+        row = self._conn().execute(
+            "SELECT COUNT(*), MAX(updated_at) FROM member_rollups WHERE collection = ?", (collection,)
+        ).fetchone()
+        return int(row[0]), row[1]
+
+    def rollup_members(self, collection: str) -> Dict[str, str]:
+        """{member_key: member_name} semua member yang punya rollup."""
+        rows = self._conn().execute(
+            "SELECT member_key, member_name FROM member_rollups WHERE collection = ?", (collection,)
+        ).fetchall()
+        return {r[0]: r[1] for r in rows}
+
+    # ---------- lease leader (multi-worker) ----------
+    def acquire_lease(self, name: str, holder: str, ttl_seconds: float) -> bool:
+        """
+        Ambil / perpanjang lease `name` selama `ttl_seconds`. Berhasil kalau lease kosong,
+        sudah kedaluwarsa, atau memang dipegang `holder`. Satu statement UPSERT -> atomik antar proses.
+        """
+        now = time.time()
+        with self._conn() as conn:
+            cur = conn.execute(
+                "INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at "
+                "WHERE leases.holder = excluded.holder OR leases.expires_at < ?",
+                (name, holder, now + float(ttl_seconds), now),
+            )
+            return cur.rowcount > 0
+
+    def release_lease(self, name: str, holder: str) -> None:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+
+    def lease_holder(self, name: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT holder, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+        if not row or row[1] < time.time():
+            return None
+        return {"holder": row[0], "expires_in": round(row[1] - time.time(), 1)}
+
+    # ---------- migrasi dari cache_hash.json ----------
+    def migrate_legacy_hashes(self, collection: str, model_id: str, path: str = LEGACY_HASH_PATH) -> int:
+        """Impor cache_hash.json lama sekali saja (kalau koleksi belum punya state), lalu rename file."""
+        if not os.path.exists(path) or self.doc_states(collection):
+            return 0
+        try:
+            with open(path, "r") as f:
+                legacy = json.load(f)
+            n = self.record_docs(collection, (
+                {"doc_id": name, "content_hash": h, "model_id": model_id} for name, h in legacy.items()
+            ))
+            os.replace(path, f"{path}.migrated")
+            logger.info(f"Migrasi {n} hash dari {path} ke sync state store.")
+            return n
+        except Exception as e:
+            logger.warning(f"Gagal migrasi cache hash lama: {e}")
+            return 0
+
+
+_STORE: Optional[SyncStateStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_state_store() -> SyncStateStore:
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                _STORE = SyncStateStore(settings.SYNC_STATE_DB)
+    return _STORE
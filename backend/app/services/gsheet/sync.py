@@ -1,25 +1,38 @@
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-import pandas as pd
-import os
-import json
 from pathlib import Path
 from app.core.config import settings
 from app.core.logger import logger
-from app.core.utils import md5_hash, timer
-from app.services.chroma.embeddings import embed_texts
-from app.services.chroma.manager import upsert_document
+from app.core.tenant import DEFAULT_CLUB, current_club, tenant_config
+from app.core.timing import stage
+from typing import TYPE_CHECKING, Dict, Optional
+import json
+import os
+import threading
+import uuid
+from app.core.utils import md5_hash, now_str, timer
+from app.services.chroma.db_client import get_collection, get_active_collection_name
+from app.services.chroma.embeddings import embed_documents
+from app.services.chroma.manager import remember_data_marker, update_metadatas, upsert_documents
+from app.services.chroma.numpy_index import reload_index
 from app.core.utils import clean_text
+from app.services.gsheet.state_store import get_state_store
+from app.services.rag.date_range import DOC_META_VERSION
+from app.services.rag.member_stats import rollup_docs
+import re
+
+# pandas / gspread / oauth2client diimpor di dalam fungsi: import modul ini (router, scheduler, CLI) tetap ringan
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 # ==================================================
 # Load Google Sheet Client
 # ==================================================
-def get_gsheet_client():
-    """Inisialisasi koneksi Google Sheet API."""
+def get_gsheet_client(gsheet_id: Optional[str] = None):
+    """Inisialisasi koneksi Google Sheet API (`gsheet_id` default: GSHEET_ID)."""
+    gsheet_id = settings.GSHEET_ID if gsheet_id is None else gsheet_id
     try:
         # Jika GSHEET_ID diberikan, kita bisa pakai scope spreadsheets saja (tanpa Drive API)
-        if getattr(settings, "GSHEET_ID", "").strip():
+        if (gsheet_id or "").strip():
             scope = [
                 "https://www.googleapis.com/auth/spreadsheets.readonly",
             ]
@@ -49,12 +62,15 @@ def get_gsheet_client():
                 f"File kredensial '{settings.GSHEET_CRED_FILE}' tidak ditemukan. Coba set path lengkap atau letakkan di 'backend/'."
             )
 
+        import gspread
+        from oauth2client.service_account import ServiceAccountCredentials
+
         creds = ServiceAccountCredentials.from_json_keyfile_name(str(cred_candidate), scope)
         client = gspread.authorize(creds)
-        if getattr(settings, "GSHEET_ID", "").strip():
+        if (gsheet_id or "").strip():
             logger.info("Koneksi ke Google Sheets API berhasil (mode by_key, tanpa Drive API).")
         else:
-            logger.info(f"Koneksi ke Google Sheet '{settings.GSHEET_NAME}' berhasil (requires Drive API).")
+            logger.info("Koneksi ke Google Sheet (by name) berhasil (requires Drive API).")
         return client
 
     except Exception as e:
@@ -62,10 +78,82 @@ def get_gsheet_client():
         raise e
 
 
+# ==================================================
+# Load Sheet
+# ==================================================
+def load_local_records(path: str):
+    """Baca baris aktivitas dari file lokal (.csv / .json / .jsonl) dengan kolom yang sama seperti sheet."""
+    import pandas as pd
+
+    suffix = Path(path).suffix.lower()
+    if suffix == ".csv":
+        df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    elif suffix == ".jsonl":
+        df = pd.read_json(path, lines=True, dtype=False)
+    elif suffix == ".json":
+        df = pd.read_json(path, dtype=False)
+    else:
+        raise ValueError(f"Format file sumber tidak didukung: {path}")
+    return df.to_dict("records")
+
+
+def _open_worksheet(cfg):
+    client = get_gsheet_client(cfg["gsheet_id"])
+    if (cfg["gsheet_id"] or "").strip():
+        spreadsheet = client.open_by_key(cfg["gsheet_id"])
+    else:
+        spreadsheet = client.open(cfg["gsheet_name"])
+    return spreadsheet, spreadsheet.worksheet(cfg["gsheet_tab"])
+
+
+def probe_source() -> Optional[str]:
+    """
+    Fingerprint murah sumber data klub aktif, tanpa download semua baris:
+    - file lokal: mtime + ukuran file
+    - Google Sheet: `modifiedTime` dari Drive API; kalau tidak bisa (scope by_key / Drive API mati)
+      -> jumlah baris kolom A + hash baris terakhir (edit di tengah sheet tidak terdeteksi,
+      karena itu scheduler tetap sync penuh tiap SYNC_FULL_EVERY tick)
+    Return None kalau probe gagal -> pemanggil sebaiknya sync penuh.
+    """
+    cfg = tenant_config()
+    try:
+        source = (cfg["source_file"] or "").strip()
+        if source:
+            st = os.stat(source)
+            return f"file:{st.st_mtime_ns}:{st.st_size}"
+        spreadsheet, sheet = _open_worksheet(cfg)
+        try:
+            return f"drive:{spreadsheet.get_lastUpdateTime()}"
+        except Exception:
+            pass
+        col = sheet.col_values(1)
+        last = sheet.row_values(len(col)) if col else []
+        return f"rows:{len(col)}:{md5_hash(json.dumps(last, ensure_ascii=False))}"
+    except Exception as e:
+        logger.warning(f"Probe perubahan sumber klub '{cfg['club']}' gagal: {e}")
+        return None
+
+
+def load_sheet_records():
+    """
+    Ambil semua baris dari tab Google Sheet milik klub aktif (list of dict),
+    atau dari file lokal (SHEET_SOURCE_FILE / `source_file` di TENANTS_FILE) kalau di-set.
+    """
+    cfg = tenant_config()
+    source = (cfg["source_file"] or "").strip()
+    if source:
+        logger.info(f"Memuat data klub '{cfg['club']}' dari file lokal {source}.")
+        return load_local_records(source)
+    if not (cfg["gsheet_id"] or "").strip() and not (cfg["gsheet_name"] or "").strip():
+        raise ValueError(f"Klub '{cfg['club']}' belum punya sumber data (gsheet_id / gsheet_name / source_file).")
+    _, sheet = _open_worksheet(cfg)
+    return sheet.get_all_records()
+
+
 # ==================================================
 # Build Text per Member (aggregated)
 # ==================================================
-def build_member_texts(df: pd.DataFrame):
+def build_member_texts(df: "pd.DataFrame"):
     """
     Gabungkan semua aktivitas per member jadi satu teks panjang.
     Contoh:
@@ -82,71 +170,187 @@ def build_member_texts(df: pd.DataFrame):
             for r in group.itertuples()
         )
         text = f"{name} melakukan beberapa aktivitas lari:\n{activities}"
-        docs.append({"member_name": str(name).strip(), "text": clean_text(text)})
+        dates = [str(d) for d in group["date"] if str(d).strip()] if "date" in group else []
+        keys = [k for k in (_date_key(d) for d in dates) if k]
+        docs.append({
+            "member_name": str(name).strip(),
+            "text": clean_text(text),
+            # watermark baris per member (jumlah baris + tanggal terakhir)
+            "row_count": int(len(group)),
+            "last_row_date": max(dates) if dates else None,
+            # rentang tanggal aktivitas (YYYYMMDD) -> filter rentang di retrieval/leaderboard
+            "first_date": min(keys) if keys else None,
+            "last_date": max(keys) if keys else None,
+        })
     return docs
 
 
+_DATE_RX = re.compile(r"(20\d{2})-(\d{2})-(\d{2})")
+
+
+def _date_key(value: str) -> Optional[int]:
+    m = _DATE_RX.search(value)
+    return int(m.group(1) + m.group(2) + m.group(3)) if m else None
+
+
+def doc_metadata(doc) -> Dict[str, object]:
+    """Metadata Chroma dokumen member (nilai None tidak boleh masuk metadata Chroma)."""
+    md: Dict[str, object] = {"member_name": doc["member_name"]}
+    if doc.get("first_date"):
+        md.update({"first_date": int(doc["first_date"]), "last_date": int(doc["last_date"])})
+    return md
+
+
+def _migrate_doc_metadata(collection, collection_name: str, member_docs, pending_ids) -> int:
+    """
+    Dokumen lama (sebelum metadata tanggal) yang kontennya tidak berubah tidak di-upsert ulang;
+    metadata-nya diperbarui sekali tanpa re-embed supaya filter rentang tanggal bisa dipakai.
+    """
+    store = get_state_store()
+    if int(store.get_meta(collection_name).get("doc_meta_version") or 0) >= DOC_META_VERSION:
+        return 0
+    stale = [d for d in member_docs if d["member_name"] not in pending_ids]
+    batch = max(1, int(settings.SYNC_BATCH_SIZE))
+    for start in range(0, len(stale), batch):
+        chunk = stale[start:start + batch]
+        update_metadatas([d["member_name"] for d in chunk], [doc_metadata(d) for d in chunk], collection=collection)
+    store.set_meta(collection_name, {"doc_meta_version": DOC_META_VERSION})
+    if stale:
+        logger.info(f"Metadata tanggal ditambahkan ke {len(stale)} dokumen lama.")
+    return len(stale)
+
+
+def doc_state_rows(docs, model_id: str):
+    """Baris doc_state untuk sync state store dari hasil build_member_texts."""
+    return [
+        {
+            "doc_id": d["member_name"],
+            "content_hash": md5_hash(d["text"]),
+            "model_id": model_id,
+            "row_count": d.get("row_count"),
+            "last_row_date": d.get("last_row_date"),
+        }
+        for d in docs
+    ]
+
+
 # ==================================================
 # Main Sync Function
 # ==================================================
-@timer
+# satu sync per klub dalam satu waktu (refresh manual vs scheduler, juga reindex/import artifact)
+_SYNC_LOCKS: Dict[str, threading.Lock] = {}
+_SYNC_LOCKS_GUARD = threading.Lock()
+
+
+def sync_lock() -> threading.Lock:
+    """Lock penulis koleksi klub aktif; siapa pun yang menukar alias memegangnya selama build + swap."""
+    with _SYNC_LOCKS_GUARD:
+        return _SYNC_LOCKS.setdefault(current_club(), threading.Lock())
+
+
 def sync_gsheet_to_chroma():
+    """Sinkronisasi klub aktif; kalau sync lain untuk klub yang sama sedang jalan, tunggu selesai dulu."""
+    with sync_lock():
+        return _sync_gsheet_to_chroma()
+
+
+@timer
+def _sync_gsheet_to_chroma():
     """
     Sinkronisasi data dari Google Sheet ke ChromaDB.
-    - Update per member_name (entitas)
-    - Skip kalau data member belum berubah
+    - Update per member_name (entitas), embed + upsert per batch (SYNC_BATCH_SIZE)
+    - Skip kalau hash konten dan model embedding member belum berubah
+    - State (hash, watermark, riwayat run) di SQLite; tiap batch dicatat setelah upsert
+      sehingga sync yang crash bisa dilanjutkan tanpa re-embed member yang sudah selesai
     """
+    store = get_state_store()
+    collection_name = get_active_collection_name()
+    model_id = settings.EMBEDDING_MODEL
+    run_id = None
     try:
-        client = get_gsheet_client()
-        if getattr(settings, "GSHEET_ID", "").strip():
-            sheet = client.open_by_key(settings.GSHEET_ID).worksheet(settings.GSHEET_TAB)
-        else:
-            sheet = client.open(settings.GSHEET_NAME).worksheet(settings.GSHEET_TAB)
-        data = sheet.get_all_records()
+        # cache_hash.json lama hanya pernah ada untuk deployment satu klub
+        if current_club() == DEFAULT_CLUB:
+            store.migrate_legacy_hashes(collection_name, model_id)
+        run_id, interrupted = store.start_run(collection_name, model_id)
+        if interrupted:
+            logger.warning(f"Run sync sebelumnya terputus ({interrupted}), melanjutkan dari state terakhir.")
+
+        with stage("sheet_load"):
+            data = load_sheet_records()
 
         if not data:
             logger.warning("Tidak ada data di Google Sheet.")
+            store.finish_run(run_id, "ok")
             return {"updated": 0, "skipped": 0}
 
+        import pandas as pd
+
         df = pd.DataFrame(data)
         member_docs = build_member_texts(df)
+        rows = doc_state_rows(member_docs, model_id)
 
-        # cache hash buat deteksi perubahan
-        CACHE_PATH = "./cache/cache_hash.json"
-        os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
-        if os.path.exists(CACHE_PATH):
-            with open(CACHE_PATH, "r") as f:
-                cache_hash = json.load(f)
-        else:
-            cache_hash = {}
-
-        updated, skipped = 0, 0
-
-        # loop tiap member
-        for doc in member_docs:
-            text_hash = md5_hash(doc["text"])
-            name = doc["member_name"]
-
-            if cache_hash.get(name) != text_hash:
-                embeddings = embed_texts([doc["text"]])
-                if embeddings:
-                    upsert_document(
-                        doc_id=name,
-                        text=doc["text"],
-                        embedding=embeddings[0],
-                        metadata={"member_name": name},
-                    )
-                    cache_hash[name] = text_hash
-                    updated += 1
-            else:
-                skipped += 1
-
-        with open(CACHE_PATH, "w") as f:
-            json.dump(cache_hash, f, indent=2)
+        # deteksi perubahan: hash konten + model embedding
+        known = store.doc_states(collection_name)
+        pending = [
+            (doc, row) for doc, row in zip(member_docs, rows)
+            if known.get(row["doc_id"]) != (row["content_hash"], model_id)
+        ]
+        skipped = len(member_docs) - len(pending)
+        updated = 0
+
+        # rollup statistik (PB, seri, streak) untuk member yang berubah / belum punya rollup,
+        # disimpan sebelum upsert supaya versi data yang baru langsung melihat rollup terbaru
+        with stage("rollups"):
+            rollups = rollup_docs(member_docs, df, store.rollup_hashes(collection_name), md5_hash)
+            if rollups:
+                store.put_rollups(collection_name, rollups)
+
+        collection = get_collection(collection_name)
+        batch = max(1, int(settings.SYNC_BATCH_SIZE))
+        for start in range(0, len(pending), batch):
+            chunk = pending[start:start + batch]
+            with stage("embed"):
+                embeddings = embed_documents([doc["text"] for doc, _ in chunk])
+            if len(embeddings) != len(chunk):
+                raise RuntimeError(f"Embedding gagal untuk batch {start}-{start + len(chunk)}")
+            with stage("upsert"):
+                upsert_documents(
+                    ids=[doc["member_name"] for doc, _ in chunk],
+                    texts=[doc["text"] for doc, _ in chunk],
+                    embeddings=embeddings,
+                    metadatas=[doc_metadata(doc) for doc, _ in chunk],
+                    collection=collection,
+                )
+                updated += store.record_docs(collection_name, [row for _, row in chunk], run_id)
+
+        migrated = _migrate_doc_metadata(collection, collection_name, member_docs, {doc["member_name"] for doc, _ in pending})
+
+        meta = {
+            "sheet_rows": len(data),
+            "members": len(member_docs),
+            "last_row_date": max((d["last_row_date"] for d in member_docs if d.get("last_row_date")), default=None),
+            "last_sync_at": now_str(),
+        }
+        if updated or migrated:
+            # penanda bersama untuk worker lain (scheduler follower): data koleksi ini berubah
+            meta["data_token"] = uuid.uuid4().hex
+        store.set_meta(collection_name, meta)
+        if "data_token" in meta:
+            remember_data_marker()
+        store.finish_run(run_id, "ok", total_docs=len(member_docs), skipped=skipped)
+
+        # index in-process (kalau aktif) dimuat ulang setelah data berubah
+        if updated or migrated:
+            reload_index()
 
         logger.info(f"Sinkronisasi selesai - updated: {updated}, skipped: {skipped}")
         return {"updated": updated, "skipped": skipped}
 
     except Exception as e:
         logger.exception(f"Gagal sinkronisasi: {e}")
+        if run_id is not None:
+            try:
+                store.finish_run(run_id, "error", error=str(e))
+            except Exception:
+                pass
         return {"status": "error", "message": str(e)}
@@ -0,0 +1,391 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.core.logger import logger
+
+
+# ==================================================
+# CIRCUIT BREAKER
+# ==================================================
+class CircuitBreaker:
+    """
+    Breaker sederhana per provider:
+    - closed: panggilan jalan normal
+    - open: setelah N gagal beruntun, semua panggilan langsung ditolak (-> fallback calc)
+    - half_open: setelah reset timeout, satu panggilan percobaan diizinkan
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = float(reset_timeout)
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != "closed":
+                logger.info(f"LLM breaker '{self.name}' kembali closed.")
+            self.state = "closed"
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def release_trial(self) -> None:
+        """Panggilan selesai tanpa vonis (dibatalkan / error di sisi kita): slot percobaan half_open dilepas."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(f"LLM breaker '{self.name}' open setelah {self.failures} kegagalan.")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures, "rejected": self.rejected}
+
+
+class EmptyCompletion(Exception):
+    """Provider membalas sukses tapi tanpa isi jawaban."""
+
+
+# error transport/timeout SDK (openai & groq punya nama kelas yang sama) dan httpx, dicek lewat MRO
+# supaya SDK tidak perlu diimpor di sini
+_TRANSPORT_ERRORS = {"APIConnectionError", "APITimeoutError", "TransportError", "TimeoutException"}
+
+
+def _is_transport_error(e: Exception) -> bool:
+    if isinstance(e, (TimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    return any(cls.__name__ in _TRANSPORT_ERRORS for cls in type(e).__mro__)
+
+
+def _is_provider_error(e: Exception) -> bool:
+    """Kegagalan di sisi provider/jaringan (dihitung breaker); selain itu = bug/parsing di sisi kita."""
+    return getattr(e, "status_code", None) is not None or _is_transport_error(e) or isinstance(e, EmptyCompletion)
+
+
+def _is_retriable(e: Exception) -> bool:
+    """Timeout/koneksi/jawaban kosong/429/5xx boleh diulang; 4xx lain (auth, request salah) dan error kode tidak."""
+    status = getattr(e, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return _is_transport_error(e) or isinstance(e, EmptyCompletion)
+
+
+def _completion_text(resp) -> str:
+    text = (resp.choices[0].message.content or "").strip()
+    if not text:
+        raise EmptyCompletion("jawaban kosong")
+    return text
+
+
+def _backoff(attempt: int) -> float:
+    # exponential backoff dengan full jitter
+    base = float(settings.LLM_RETRY_BACKOFF_SECONDS)
+    return random.uniform(0, base * (2 ** attempt))
+
+
+# ==================================================
+# CLIENT PER PROVIDER (long-lived, pooled)
+# ==================================================
+class ProviderClient:
+    """Client SDK yang dibuat sekali dan dipakai ulang (keep-alive + TLS session)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.breaker = CircuitBreaker(name, settings.LLM_BREAKER_FAILURES, settings.LLM_BREAKER_RESET_SECONDS)
+        self._sync_client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self) -> str:
+        if self.name == "groq":
+            return getattr(settings, "GROQ_MODEL", "llama-3.1-8b-instant")
+        return getattr(settings, "OPENAI_MODEL", "gpt-4o-mini")
+
+    @property
+    def api_key(self) -> Optional[str]:
+        return os.getenv("GROQ_API_KEY" if self.name == "groq" else "OPENAI_API_KEY")
+
+    @property
+    def label(self) -> str:
+        return f"{self.name}:{self.model}"
+
+    def _client_kwargs(self, http_client) -> Dict[str, Any]:
+        base_url = (settings.GROQ_BASE_URL if self.name == "groq" else settings.OPENAI_BASE_URL).strip()
+        kwargs: Dict[str, Any] = {
+            "api_key": self.api_key,
+            "timeout": float(settings.LLM_TIMEOUT_SECONDS),
+            "max_retries": 0,  # retry diatur di layer ini (dengan jitter + breaker)
+            "http_client": http_client,
+        }
+        if base_url:
+            kwargs["base_url"] = base_url
+        return kwargs
+
+    def _limits(self):
+        import httpx
+        return httpx.Limits(
+            max_connections=settings.LLM_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_POOL_MAX_CONNECTIONS,
+        )
+
+    def sync_client(self):
+        if self._sync_client is None:
+            with self._lock:
+                if self._sync_client is None:
+                    import httpx
+                    http_client = httpx.Client(limits=self._limits(), timeout=float(settings.LLM_TIMEOUT_SECONDS))
+                    if self.name == "groq":
+                        from groq import Groq
+                        self._sync_client = Groq(**self._client_kwargs(http_client))
+                    else:
+                        from openai import OpenAI
+                        self._sync_client = OpenAI(**self._client_kwargs(http_client))
+        return self._sync_client
+
+    def async_client(self):
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    import httpx
+                    http_client = httpx.AsyncClient(limits=self._limits(), timeout=float(settings.LLM_TIMEOUT_SECONDS))
+                    if self.name == "groq":
+                        from groq import AsyncGroq
+                        self._async_client = AsyncGroq(**self._client_kwargs(http_client))
+                    else:
+                        from openai import AsyncOpenAI
+                        self._async_client = AsyncOpenAI(**self._client_kwargs(http_client))
+        return self._async_client
+
+    def available(self) -> bool:
+        """Punya API key dan breaker tidak sedang open (atau sudah waktunya dicoba lagi)."""
+        if not self.api_key:
+            return False
+        if self.breaker.state != "open":
+            return True
+        return time.monotonic() - self.breaker.opened_at >= self.breaker.reset_timeout
+
+    @staticmethod
+    def _messages(prompt: Tuple[str, str]) -> List[Dict[str, str]]:
+        return [{"role": "system", "content": prompt[0]}, {"role": "user", "content": prompt[1]}]
+
+    def complete(self, prompt: Tuple[str, str]) -> Optional[str]:
+        if not self.api_key or not self.breaker.allow():
+            return None
+        attempts = max(0, int(settings.LLM_MAX_RETRIES)) + 1
+        for attempt in range(attempts):
+            try:
+                resp = self.sync_client().chat.completions.create(
+                    model=self.model,
+                    messages=self._messages(prompt),
+                    temperature=0.2,
+                )
+                text = _completion_text(resp)
+                self.breaker.record_success()
+                return text
+            except Exception as e:
+                if not _is_provider_error(e):
+                    # bug / format response tak terduga: tidak diulang dan tidak dihitung breaker
+                    logger.exception(f"{self.name} call error tak terduga: {e}")
+                    self.breaker.release_trial()
+                    return None
+                logger.warning(f"{self.name} call failed (percobaan {attempt + 1}/{attempts}): {e}")
+                if attempt + 1 >= attempts or not _is_retriable(e):
+                    break
+                time.sleep(_backoff(attempt))
+        self.breaker.record_failure()
+        return None
+
+    async def acomplete(self, prompt: Tuple[str, str]) -> Optional[str]:
+        if not self.api_key or not self.breaker.allow():
+            return None
+        attempts = max(0, int(settings.LLM_MAX_RETRIES)) + 1
+        try:
+            for attempt in range(attempts):
+                try:
+                    resp = await self.async_client().chat.completions.create(
+                        model=self.model,
+                        messages=self._messages(prompt),
+                        temperature=0.2,
+                    )
+                    text = _completion_text(resp)
+                    self.breaker.record_success()
+                    return text
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if not _is_provider_error(e):
+                        logger.exception(f"{self.name} call error tak terduga: {e}")
+                        self.breaker.release_trial()
+                        return None
+                    logger.warning(f"{self.name} call failed (percobaan {attempt + 1}/{attempts}): {e}")
+                    if attempt + 1 >= attempts or not _is_retriable(e):
+                        break
+                    await asyncio.sleep(_backoff(attempt))
+        except asyncio.CancelledError:
+            # dibatalkan karena kalah hedging: jangan hitung sebagai kegagalan provider
+            self.breaker.release_trial()
+            raise
+        self.breaker.record_failure()
+        return None
+
+    def close(self) -> None:
+        if self._sync_client is not None:
+            try:
+                self._sync_client.close()
+            except Exception:
+                pass
+            self._sync_client = None
+
+    async def aclose(self) -> None:
+        if self._async_client is not None:
+            try:
+                await self._async_client.close()
+            except Exception:
+                pass
+            self._async_client = None
+
+
+# ==================================================
+# REGISTRY + API PUBLIK
+# ==================================================
+_CLIENTS: Dict[str, ProviderClient] = {}
+_CLIENTS_LOCK = threading.Lock()
+_HEDGE_POOL: Optional[ThreadPoolExecutor] = None
+
+
+def get_provider_client(name: str) -> ProviderClient:
+    name = (name or "").lower()
+    if name not in _CLIENTS:
+        with _CLIENTS_LOCK:
+            if name not in _CLIENTS:
+                _CLIENTS[name] = ProviderClient(name)
+    return _CLIENTS[name]
+
+
+def _provider_chain(provider: str) -> List[ProviderClient]:
+    """Provider utama + provider hedge (LLM_HEDGE_PROVIDERS) yang punya API key."""
+    chain = [get_provider_client(provider)]
+    hedge = [p.strip().lower() for p in (settings.LLM_HEDGE_PROVIDERS or "").split(",") if p.strip()]
+    for name in hedge:
+        if name in ("groq", "openai") and name != provider:
+            client = get_provider_client(name)
+            if client.api_key:
+                chain.append(client)
+    return chain
+
+
+def llm_available(provider: str) -> bool:
+    """False kalau semua provider dalam rantai tidak punya key / breaker open -> langsung fallback."""
+    return any(c.available() for c in _provider_chain(provider))
+
+
+def _get_hedge_pool() -> ThreadPoolExecutor:
+    global _HEDGE_POOL
+    if _HEDGE_POOL is None:
+        with _CLIENTS_LOCK:
+            if _HEDGE_POOL is None:
+                _HEDGE_POOL = ThreadPoolExecutor(max_workers=max(2, settings.LLM_MAX_CONCURRENCY * 2), thread_name_prefix="llm-hedge")
+    return _HEDGE_POOL
+
+
+def complete_chat(prompt: Tuple[str, str], provider: str) -> Optional[Tuple[str, str]]:
+    """
+    Panggil LLM (sync). Kalau hedging aktif dan provider utama belum menjawab
+    setelah LLM_HEDGE_DELAY_SECONDS, provider berikutnya ikut dipanggil; yang duluan sukses menang.
+    Return: (answer, "provider:model") atau None.
+    """
+    chain = [c for c in _provider_chain(provider) if c.available()]
+    if not chain:
+        return None
+    if len(chain) == 1:
+        out = chain[0].complete(prompt)
+        return (out, chain[0].label) if out else None
+
+    pool = _get_hedge_pool()
+    pending = {}
+    for i, client in enumerate(chain):
+        pending[pool.submit(client.complete, prompt)] = client
+        deadline = float(settings.LLM_HEDGE_DELAY_SECONDS) if i + 1 < len(chain) else None
+        while pending:
+            done, _ = wait(list(pending), timeout=deadline, return_when=FIRST_COMPLETED)
+            if not done:
+                break  # lewat hedge delay -> mulai provider berikutnya
+            for fut in done:
+                c = pending.pop(fut)
+                out = fut.result()
+                if out:
+                    return (out, c.label)
+            if deadline is not None:
+                break
+    return None
+
+
+async def acomplete_chat(prompt: Tuple[str, str], provider: str) -> Optional[Tuple[str, str]]:
+    """Versi async complete_chat (hedging via asyncio task)."""
+    chain = [c for c in _provider_chain(provider) if c.available()]
+    if not chain:
+        return None
+    if len(chain) == 1:
+        out = await chain[0].acomplete(prompt)
+        return (out, chain[0].label) if out else None
+
+    pending: Dict[asyncio.Task, ProviderClient] = {}
+    try:
+        for i, client in enumerate(chain):
+            pending[asyncio.ensure_future(client.acomplete(prompt))] = client
+            deadline = float(settings.LLM_HEDGE_DELAY_SECONDS) if i + 1 < len(chain) else None
+            while pending:
+                done, _ = await asyncio.wait(list(pending), timeout=deadline, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break  # lewat hedge delay -> mulai provider berikutnya
+                for task in done:
+                    c = pending.pop(task)
+                    out = task.result()
+                    if out:
+                        return (out, c.label)
+                if deadline is not None:
+                    break
+        return None
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def llm_stats() -> Dict[str, Any]:
+    return {name: client.breaker.stats() for name, client in _CLIENTS.items()}
+
+
+async def close_llm_clients() -> None:
+    for client in list(_CLIENTS.values()):
+        client.close()
+        await client.aclose()
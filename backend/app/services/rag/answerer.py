@@ -1,23 +1,21 @@
-from typing import List, Optional, Tuple, Dict, Any
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
 from app.core.logger import logger
 from app.core.config import settings
 import re
+import time
 from datetime import date
 from app.services.rag.metrics import compute_leaderboard
+from app.core.admission import admission, mark_shed
+from app.core.executors import LimiterRejected, llm_limiter, run_cpu, run_io
+from app.core.timing import record_stage, stage
+from app.services.llm.client import acomplete_chat, complete_chat, llm_available
+from app.services.rag.context_packer import activity_lines, pack_context
+from app.services.rag.date_range import MONTHS_ID as _MONTHS_ID, DateRange, detect_date_range, month_in_text
+from app.services.rag.member_stats import club_aggregate, format_duration, member_stats
 
 
 # ===== Helpers & constants =====
-
-_MONTHS_ID = {
-    1: "januari", 2: "februari", 3: "maret", 4: "april",
-    5: "mei", 6: "juni", 7: "juli", 8: "agustus",
-    9: "september", 10: "oktober", 11: "november", 12: "desember",
-}
-_MONTHS_REV = {v: k for k, v in _MONTHS_ID.items()}
-_MONTHS_REV.update({
-    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "mei": 5, "jun": 6, "jul": 7,
-    "agu": 8, "sep": 9, "sept": 9, "okt": 10, "nov": 11, "des": 12,
-})
+_LINE_DATE = re.compile(r"(20\d{2})-(\d{2})-(\d{2})\s*:\s*")
 
 
 def _detect_month(query: str) -> Optional[int]:
@@ -25,10 +23,8 @@ def _detect_month(query: str) -> Optional[int]:
     m = re.search(r"\b(bulan|bln)\s*(1[0-2]|0?[1-9])\b", q)
     if m:
         return int(m.group(2))
-    for name, num in _MONTHS_REV.items():
-        if re.search(rf"\b{name}\b", q):
-            return num
-    return None
+    found = month_in_text(q)
+    return found[0] if found else None
 
 
 def _detect_year(query: str) -> Optional[int]:
@@ -104,17 +100,52 @@ def _detect_two_members_from_query(query: str, ctxs: List[str]) -> Optional[List
     return picks[:2] if picks else None
 
 
-def _sum_km_from_ctx_text(text: str, month: Optional[int] = None) -> Tuple[float, int]:
+def _member_mentions(query: str, names: Iterable[str]) -> Dict[str, Set[str]]:
+    """{nama: token query yang cocok} untuk semua member yang disebut (nama lengkap atau bagian nama >= 3 huruf)."""
+    q = re.sub(r"\s+", " ", (query or "").lower()).strip()
+    tokens = {t for t in re.split(r"[^a-z0-9]+", q) if len(t) >= 3}
+    out: Dict[str, Set[str]] = {}
+    for name in names:
+        low = name.lower()
+        parts = {p for p in low.split() if len(p) >= 3}
+        hit = parts & tokens
+        if low in q:
+            hit = parts or {low}
+        if hit:
+            out[name] = hit
+    return out
+
+
+def _mentions_several_members(query: str, names: Iterable[str]) -> bool:
+    """
+    Query menyebut >= 2 member berbeda ("Yoga vs Budi", "Yoga dan Budi")?
+    Dua member dengan nama depan sama yang cocok lewat token yang sama ("Budi") tetap dihitung satu sebutan.
+    """
+    hits = list(_member_mentions(query, names).values())
+    return any(not (a & b) for i, a in enumerate(hits) for b in hits[i + 1:])
+
+
+def _line_in_period(line: str, month: Optional[int] = None, date_range: Optional[DateRange] = None) -> bool:
+    """Baris aktivitas masuk filter? `date_range` (rentang tanggal) didahulukan dari `month`."""
+    dm = _LINE_DATE.search(line)
+    if date_range is not None:
+        if not dm:
+            return False
+        try:
+            return date_range.contains(date(int(dm.group(1)), int(dm.group(2)), int(dm.group(3))))
+        except ValueError:
+            return False
+    if dm:
+        return not (month and int(dm.group(2)) != month)
+    # if month filtering but no date found on the line, skip
+    return month is None
+
+
+def _sum_km_from_ctx_text(text: str, month: Optional[int] = None, date_range: Optional[DateRange] = None) -> Tuple[float, int]:
     total = 0.0
     count = 0
-    for line in text.split(" - "):
-        dm = re.search(r"(20\d{2})-(\d{2})-(\d{2})\s*:\s*", line)
-        if dm:
-            mm = int(dm.group(2))
-            if month and mm != month:
-                continue
-        elif month is not None:
-            # if month filtering but no date found on the line, skip
+    for line in activity_lines(text):
+        if not _line_in_period(line, month, date_range):
             continue
         m = re.search(r"sejauh\s+([0-9]+(?:[.,][0-9]+)?)\s*km", line, flags=re.IGNORECASE)
         if m:
@@ -135,14 +166,9 @@ def _detect_threshold_km(query: str) -> Optional[float]:
     return None
 
 
-def _any_run_ge_km(text: str, km: float, month: Optional[int] = None) -> Tuple[bool, Optional[str]]:
-    for line in text.split(" - "):
-        dm = re.search(r"(20\d{2})-(\d{2})-(\d{2})\s*:\s*", line)
-        if dm:
-            mm = int(dm.group(2))
-            if month and mm != month:
-                continue
-        elif month is not None:
+def _any_run_ge_km(text: str, km: float, month: Optional[int] = None, date_range: Optional[DateRange] = None) -> Tuple[bool, Optional[str]]:
+    for line in activity_lines(text):
+        if not _line_in_period(line, month, date_range):
             continue
         m = re.search(r"sejauh\s+([0-9]+(?:[.,][0-9]+)?)\s*km", line, flags=re.IGNORECASE)
         if m:
@@ -164,17 +190,247 @@ def _detect_intent(query: str) -> str:
     return "generic"
 
 
-def _join_context(ctxs: List[str], max_chars: int = 6000) -> str:
-    if not ctxs:
-        return ""
-    joined, total = [], 0
-    for i, c in enumerate(ctxs, start=1):
-        line = f"[{i}] {c}"
-        if total + len(line) > max_chars:
-            break
-        joined.append(line)
-        total += len(line)
-    return "\n".join(joined)
+# ===== Intent statistik member (dijawab dari rollup, tanpa retrieval/LLM) =====
+_STATS_KINDS: List[Tuple[str, "re.Pattern[str]"]] = [
+    ("pb", re.compile(r"\b(pb|personal\s+best|rekor|best\s+time|waktu\s+terbaik|tercepat)\b")),
+    ("streak", re.compile(r"\b(streak|beruntun|berturut(?:-turut)?)\b")),
+    ("weekly", re.compile(r"\b(per\s+minggu|per\s+pekan|mingguan|weekly|volume)\b")),
+    ("pace", re.compile(r"\b(?:rata-?rata|rata2|average|avg)\s+pace\b|\bpace\s+(?:rata-?rata|rata2|average|avg)\b")),
+    ("longest", re.compile(r"\b(terjauh|terpanjang|paling\s+jauh|longest)\b")),
+]
+_STATS_BAND = re.compile(r"\b(5|10|21|42)\s*(?:k|km)\b|\b(half|hm|full|fm|marathon)\b")
+_CLUB_WIDE = re.compile(r"\b(siapa|who|member\s+mana)\b")
+
+
+def _detect_stats_kind(query: str) -> Optional[str]:
+    """'pb' | 'streak' | 'weekly' | 'pace' | 'longest' kalau pertanyaan statistik personal, selain itu None."""
+    q = (query or "").lower()
+    if _CLUB_WIDE.search(q):
+        # "siapa paling jauh" = perbandingan antar member, bukan statistik satu orang
+        return None
+    for kind, rx in _STATS_KINDS:
+        if rx.search(q):
+            return kind
+    return None
+
+
+def _stats_band(query: str) -> Optional[str]:
+    m = _STATS_BAND.search((query or "").lower())
+    if not m:
+        return None
+    if m.group(1):
+        return {"5": "5k", "10": "10k", "21": "21k", "42": "42k"}[m.group(1)]
+    return "21k" if m.group(2) in ("half", "hm") else "42k"
+
+
+def _format_stats_answer(kind: str, query: str, st: Dict[str, Any]) -> Optional[str]:
+    name = st["member"]
+    if not st.get("activities"):
+        return f"{name} belum punya aktivitas tercatat."
+    if kind == "pb":
+        band = _stats_band(query)
+        if band:
+            pb = st["pbs"].get(band)
+            if not pb:
+                return f"{name} belum pernah lari sejauh {band} atau lebih, jadi belum ada PB {band}."
+            return (f"PB {band} {name}: pace {pb['pace']} (estimasi {pb['est_time']}) saat {pb['activity']} "
+                    f"{pb['km']:.2f} km tanggal {pb['date']}.")
+        parts = [f"{b} {pb['pace']} (~{pb['est_time']}, {pb['date']})" for b, pb in st["pbs"].items()]
+        fastest = st.get("fastest")
+        head = f"Pace tercepat {name}: {fastest['pace']} ({fastest['km']:.2f} km, {fastest['date']})." if fastest else f"PB {name}:"
+        return head + (" PB per jarak: " + "; ".join(parts) + "." if parts else "")
+    if kind == "longest":
+        lo = st["longest"]
+        pace = f", pace {lo['pace']}" if lo.get("pace") else ""
+        return f"Lari terjauh {name}: {lo['km']:.2f} km ({lo['activity']}, {lo['date']}{pace})."
+    if kind == "pace":
+        dist = st.get("pace_distribution") or {}
+        return (f"Pace rata-rata {name}: {st['avg_pace']} dari {st['activities']} aktivitas ({st['total_km']:.2f} km); "
+                f"median {dist.get('p50')}, 10% tercepat <= {dist.get('p10')}.")
+    if kind == "streak":
+        d, w = st["streaks"]["days"], st["streaks"]["weeks"]
+        return (f"Streak {name}: {d['current']} hari beruntun saat ini (terpanjang {d['longest']} hari), "
+                f"{w['current']} minggu beruntun (terpanjang {w['longest']} minggu). Aktivitas terakhir {d['last_active']}.")
+    if kind == "weekly":
+        vol = st["weekly_volume"]
+        best = vol.get("best_week")
+        best_txt = f"; minggu terbaik {best['week']} dengan {best['km']:.2f} km" if best else ""
+        return (f"Volume mingguan {name}: minggu ini {vol['this_week_km']:.2f} km, "
+                f"rata-rata 4 minggu terakhir {vol['avg_km_last_4_weeks']:.2f} km/minggu{best_txt}.")
+    return None
+
+
+def answer_member_stats(query: str, member: Optional[str], explicit: bool = True) -> Optional[Tuple[str, str]]:
+    """
+    Jawab pertanyaan statistik personal (PB, terjauh, pace rata-rata, streak, volume mingguan)
+    langsung dari rollup sync. None -> bukan pertanyaan statistik / tanpa member / ada periode
+    spesifik di query (rollup = all-time, jadi biarkan jalur retrieval + filter tanggal).
+    `explicit=False` (member dari memori sesi): "terjauh" tanpa nama tetap ke jalur biasa.
+    """
+    kind = _detect_stats_kind(query)
+    if not kind or not member or (kind == "longest" and not explicit):
+        return None
+    if kind != "streak" and detect_date_range(query) is not None:
+        return None
+    st = member_stats(member)
+    if st is None:
+        return None
+    text = _format_stats_answer(kind, query, st)
+    return (text, "stats") if text else None
+
+
+# ===== Intent analitik (agregat member x periode dari rollup, tanpa retrieval/LLM) =====
+_AGG_METRICS: List[Tuple[str, "re.Pattern[str]"]] = [
+    ("elev_m", re.compile(r"\b(elevasi|elevation|elev|tanjakan|nanjak|menanjak)\b")),
+    ("pace", re.compile(r"\b(pace|tercepat|paling\s+(?:cepat|kencang))\b")),
+    ("time_s", re.compile(r"\b(durasi|moving\s+time|waktu\s+(?:lari|tempuh|gerak)|jam\s+lari|berapa\s+(?:lama|jam)|paling\s+lama|terlama)\b")),
+    ("runs", re.compile(r"\b(berapa\s+kali|kali\s+lari|jumlah\s+(?:aktivitas|lari|sesi)|aktivitas\s+terbanyak|paling\s+(?:rajin|sering)|terajin|tersering|frekuensi)\b")),
+]
+_AGG_COUNT = re.compile(r"\bberapa\s+(?:orang|member|anggota|runner|pelari)\b")
+_AGG_TOP = re.compile(r"\btop\s*-?\s*(\d{1,2})?\b|\b(\d{1,2})\s+(?:besar|teratas)\b|\b(peringkat|ranking|klasemen|leaderboard)\b")
+_AGG_LEADER = re.compile(r"\b(paling|terbanyak|tertinggi|terjauh|tercepat|terajin|tersering|terlama)\b")
+_AGG_SUBJECT = re.compile(r"\b(member|anggota|pelari|runner)\s+(?:yang\s+)?(?:paling|ter[a-z]+)\b")
+_AGG_AVG = re.compile(r"\b(rata-?rata|rata2|average|avg)\b")
+_AGG_SUM = re.compile(r"\b(total|jumlah|akumulasi)\b|\bberapa\s+(?:km|kilometer|jauh|kali|aktivitas|elevasi|jam|lama|banyak)\b")
+_AGG_PER_UNIT = re.compile(r"\bper\s+(?:hari|minggu|pekan|bulan)\b")
+_CLUB_SCOPE = re.compile(r"\b(klub|club|semua|seluruh|kita|komunitas|gabungan)\b")
+_METRIC_LABEL = {"km": "jarak", "runs": "jumlah aktivitas", "time_s": "waktu lari", "elev_m": "elevasi", "pace": "pace"}
+_LEADER_LABEL = {"km": "Paling jauh", "runs": "Paling rajin", "time_s": "Paling lama berlari", "elev_m": "Paling banyak elevasi", "pace": "Pace tercepat"}
+
+
+def _detect_aggregate(query: str) -> Optional[Dict[str, Any]]:
+    """
+    Bentuk pertanyaan agregat -> {"op": count|top|avg|sum, "metric", "n", "club"}; None kalau bukan.
+    Perbandingan dua nama, threshold ("pernah > 10 km"), dan rata-rata per minggu/bulan tetap ke jalur lama.
+    """
+    q = (query or "").lower()
+    intent = _detect_intent(q)
+    if intent == "threshold":
+        return None
+    club_wide = bool(_CLUB_WIDE.search(q) or _AGG_SUBJECT.search(q))
+    top = _AGG_TOP.search(q)
+    if _AGG_COUNT.search(q):
+        op, n = "count", None
+    elif top:
+        op, n = "top", int(top.group(1) or top.group(2) or 5)
+    elif club_wide and _AGG_LEADER.search(q):
+        op, n = "top", 1
+    elif intent == "compare":
+        return None
+    elif _AGG_AVG.search(q) and not _AGG_PER_UNIT.search(q):
+        op, n = "avg", None
+    elif _AGG_SUM.search(q):
+        op, n = "sum", None
+    else:
+        return None
+    metric = next((m for m, rx in _AGG_METRICS if rx.search(q)), "km")
+    return {"op": op, "metric": metric, "n": max(1, min(n, 50)) if n else None, "club": op in ("count", "top") or bool(_CLUB_SCOPE.search(q))}
+
+
+def _fmt_metric(metric: str, row: Dict[str, Any]) -> str:
+    if metric == "runs":
+        return f"{row['runs']} aktivitas"
+    if metric == "time_s":
+        return format_duration(row["time_s"]) or "0:00"
+    if metric == "elev_m":
+        return f"{row['elev_m']:.0f} m"
+    if metric == "pace":
+        return row["pace"] or "-"
+    return f"{row['km']:.2f} km"
+
+
+def _fmt_extra(metric: str, row: Dict[str, Any]) -> str:
+    return f" ({row['km']:.2f} km)" if metric in ("pace", "runs") else f" ({row['runs']} aktivitas)"
+
+
+def _format_aggregate_answer(plan: Dict[str, Any], agg: Dict[str, Any], period: str) -> str:
+    op, metric = plan["op"], plan["metric"]
+    label = _METRIC_LABEL[metric]
+    totals, ranking = agg["totals"], agg["ranking"]
+    if op == "count":
+        return (f"{agg['members_active']} dari {agg['members_total']} member aktif pada {period} "
+                f"(total {totals['km']:.2f} km, {totals['runs']} aktivitas).")
+    if not agg["members_active"]:
+        return f"Belum ada aktivitas tercatat pada {period}."
+    if op == "top":
+        if not ranking:
+            return f"Belum ada member dengan volume cukup untuk peringkat {label} pada {period}."
+        if plan["n"] == 1:
+            lead = ranking[0]
+            runner = f" Berikutnya: {ranking[1]['member']} {_fmt_metric(metric, ranking[1])}." if len(ranking) > 1 else ""
+            return f"{_LEADER_LABEL[metric]} pada {period}: {lead['member']} dengan {_fmt_metric(metric, lead)}{_fmt_extra(metric, lead)}.{runner}"
+        lines = [f"{i}. {r['member']} — {_fmt_metric(metric, r)}{_fmt_extra(metric, r)}" for i, r in enumerate(ranking[:plan["n"]], start=1)]
+        return f"Top {len(lines)} {label} pada {period}:\n" + "\n".join(lines)
+    if op == "avg":
+        if metric == "pace":
+            return (f"Pace rata-rata klub pada {period}: {totals['pace'] or '-'} (tertimbang jarak, "
+                    f"{totals['km']:.2f} km dari {totals['runs']} aktivitas, {agg['members_active']} member aktif).")
+        avg = agg["averages"]
+        per_member = {"km": f"{avg['km_per_member']:.2f} km", "runs": f"{avg['runs_per_member']:.2f} aktivitas",
+                      "elev_m": f"{avg['elev_m_per_member']:.0f} m",
+                      "time_s": format_duration(totals["time_s"] / agg["members_active"]) or "0:00"}[metric]
+        return (f"Rata-rata {label} per member aktif pada {period}: {per_member} "
+                f"({agg['members_active']} member aktif; rata-rata {avg['km_per_run']:.2f} km per aktivitas).")
+    detail = {"km": f"{totals['km']:.2f} km", "runs": f"{totals['runs']} aktivitas", "members": f"{agg['members_active']} member aktif",
+              "elev_m": f"elevasi {totals['elev_m']:.0f} m"}
+    detail.pop(metric, None)
+    return f"Total {label} klub pada {period}: {_fmt_metric(metric, totals)} ({', '.join(detail.values())})."
+
+
+def _format_member_aggregate(plan: Dict[str, Any], row: Dict[str, Any], period: str) -> Optional[str]:
+    name, metric = row["member"], plan["metric"]
+    if not row["runs"]:
+        return f"{name} belum punya aktivitas tercatat pada {period}."
+    if plan["op"] == "avg":
+        runs = row["runs"]
+        if metric == "km":
+            return f"Rata-rata jarak {name} pada {period}: {row['km'] / runs:.2f} km per aktivitas ({runs} aktivitas, total {row['km']:.2f} km)."
+        if metric == "pace":
+            return f"Pace rata-rata {name} pada {period}: {row['pace'] or '-'} dari {runs} aktivitas ({row['km']:.2f} km)."
+        if metric == "elev_m":
+            return f"Rata-rata elevasi {name} pada {period}: {row['elev_m'] / runs:.0f} m per aktivitas ({runs} aktivitas, total {row['elev_m']:.0f} m)."
+        if metric == "time_s":
+            return (f"Rata-rata waktu lari {name} pada {period}: {format_duration(row['time_s'] / runs) or '0:00'} per aktivitas "
+                    f"({runs} aktivitas, total {format_duration(row['time_s']) or '0:00'}).")
+        # "rata-rata berapa kali lari" tanpa satuan waktu tidak terdefinisi -> jalur biasa
+        return None
+    if metric == "runs":
+        return f"{name} lari {row['runs']} kali pada {period} (total {row['km']:.2f} km)."
+    if metric == "pace":
+        return f"Pace rata-rata {name} pada {period}: {row['pace'] or '-'} dari {row['runs']} aktivitas ({row['km']:.2f} km)."
+    return f"Total {_METRIC_LABEL[metric]} {name} pada {period}: {_fmt_metric(metric, row)} (dari {row['runs']} aktivitas)."
+
+
+def answer_club_aggregate(query: str, member: Optional[str], date_range: Optional[DateRange] = None,
+                          names: Optional[Iterable[str]] = None) -> Optional[Tuple[str, str]]:
+    """
+    Jawab pertanyaan agregat ("total km klub bulan ini", "top 5 minggu ini", "rata-rata pace Yoga",
+    "siapa paling banyak elevasi tahun ini") langsung dari rollup member x hari: exact, tanpa LLM.
+    Tanpa nama/kata "klub" dan tanpa member -> agregat klub. None -> bukan pertanyaan agregat / rollup belum ada.
+    `names`: nama member yang dikenal; query yang menyebut dua member atau lebih -> None (jalur perbandingan).
+    """
+    plan = _detect_aggregate(query)
+    if plan is None:
+        return None
+    if names is not None and _mentions_several_members(query, names):
+        return None
+    if not plan["club"] and not member:
+        plan["club"] = True
+    if not plan["club"] and _detect_stats_kind(query) == "longest":
+        # "terjauh <nama>" = satu aktivitas terpanjang, bukan jumlah
+        return None
+    # leader (n=1) ikut ambil peringkat 2 untuk "Berikutnya: ..."
+    top_n = max(plan["n"], 2) if plan["n"] else None
+    agg = club_aggregate(date_range, rank_by=plan["metric"], top_n=top_n, member=None if plan["club"] else member)
+    if agg is None:
+        return None
+    period = date_range.describe() if date_range else "all‑time"
+    if plan["club"]:
+        return (_format_aggregate_answer(plan, agg, period), "analytics")
+    if agg["member"] is None:
+        return None
+    text = _format_member_aggregate(plan, agg["member"], period)
+    return (text, "analytics") if text else None
 
 
 def _build_prompts(query: str, ctx: str) -> Tuple[str, str]:
@@ -203,56 +459,18 @@ def _build_guarded_prompt(query: str, ctx: str, facts: str) -> Tuple[str, str]:
     return system_prompt, user_prompt
 
 
-def _call_openai(prompt: Tuple[str, str], model: str) -> Optional[str]:
-    try:
-        import os
-        from openai import OpenAI
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            return None
-        client = OpenAI(api_key=api_key)
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "system", "content": prompt[0]}, {"role": "user", "content": prompt[1]}],
-            temperature=0.2,
-        )
-        return resp.choices[0].message.content.strip()
-    except Exception as e:
-        logger.warning(f"OpenAI call failed: {e}")
-        return None
-
-
-def _call_groq(prompt: Tuple[str, str], model: str) -> Optional[str]:
-    try:
-        import os
-        from groq import Groq
-        api_key = os.getenv("GROQ_API_KEY")
-        if not api_key:
-            return None
-        client = Groq(api_key=api_key)
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "system", "content": prompt[0]}, {"role": "user", "content": prompt[1]}],
-            temperature=0.2,
-        )
-        return resp.choices[0].message.content.strip()
-    except Exception as e:
-        logger.warning(f"Groq call failed: {e}")
-        return None
-
-
-def answer_with_llm(query: str, contexts: List[str]) -> Tuple[str, str]:
+def _plan_answer(query: str, contexts: List[str], date_range: Optional[DateRange] = None) -> Dict[str, Any]:
     """
-    Jawab berbasis konteks. Jika LLM tersedia, biarkan LLM menyusun jawaban natural
-    dengan guardrails: hanya pakai data dari konteks + fakta yang dihitung. Fallback
-    deterministik jika LLM tidak tersedia.
-
-    Return: (answer, provider)
+    Tahap deterministik (CPU) sebelum LLM: deteksi intent, sempitkan konteks,
+    hitung fakta, dan siapkan prompt kalau provider LLM aktif.
+    Periode: `date_range` dari pipeline (query + filter sesi), atau dideteksi dari query.
+    Kalau `answer` terisi, jawaban sudah final tanpa perlu LLM/fallback.
     """
     intent = _detect_intent(query)
 
     # Untuk compare: jangan sempitkan konteks. Selain itu, fokuskan ke member yang disebut.
     narrowed_contexts = contexts
+    narrowed_refs: List[Tuple[int, str]] = list(enumerate(contexts, start=1))
     if intent != "compare":
         m = None
         try:
@@ -263,16 +481,39 @@ def answer_with_llm(query: str, contexts: List[str]) -> Tuple[str, str]:
             name, idx = m
             if 1 <= idx <= len(contexts):
                 narrowed_contexts = [contexts[idx - 1]]
+                narrowed_refs = [(idx, contexts[idx - 1])]
+
+    plan: Dict[str, Any] = {"intent": intent, "narrowed": narrowed_contexts, "month": None, "date_range": None, "prompt": None, "answer": None}
 
-    ctx_text = _join_context(narrowed_contexts)
-    if not ctx_text:
-        return ("Maaf, aku tidak menemukan data relevan di basis data. Coba refresh dulu ya.", "none")
+    month = _detect_month(query)
+    year = _detect_year(query)
+    rng = date_range or detect_date_range(query)
+    plan["month"] = month
+    plan["date_range"] = rng
+
+    if _detect_stats_kind(query):
+        target = _detect_member_from_query_or_ctx(query, contexts)
+        stats_answer = answer_member_stats(query, target[0]) if target else None
+        if stats_answer:
+            plan["intent"] = "stats"
+            plan["answer"] = stats_answer
+            return plan
+
+    if _detect_aggregate(query):
+        target = _detect_member_from_query_or_ctx(query, contexts)
+        agg_answer = answer_club_aggregate(query, target[0] if target else None, rng, names=_extract_member_names_from_ctx(contexts).values())
+        if agg_answer:
+            plan["intent"] = "analytics"
+            plan["answer"] = agg_answer
+            return plan
+
+    if not any(c for c in narrowed_contexts):
+        plan["answer"] = ("Maaf, aku tidak menemukan data relevan di basis data. Coba refresh dulu ya.", "none")
+        return plan
 
     provider = getattr(settings, "LLM_PROVIDER", "none").lower()
 
     # ===== Deterministic calculations (as facts) =====
-    month = _detect_month(query)
-    year = _detect_year(query)  # belum dipakai secara khusus pada parsing, tapi tetap dideteksi
 
     facts_lines: List[str] = []
     if intent in ("total", "compare"):
@@ -288,8 +529,8 @@ def answer_with_llm(query: str, contexts: List[str]) -> Tuple[str, str]:
 
         for (member, idx) in targets:
             text = contexts[idx - 1] if 1 <= idx <= len(contexts) else contexts[0]
-            total_km, n = _sum_km_from_ctx_text(text, month=month)
-            tag = f"bulan {_MONTHS_ID.get(month)}" if month else "semua"
+            total_km, n = _sum_km_from_ctx_text(text, month=month, date_range=rng)
+            tag = rng.describe() if rng else (f"bulan {_MONTHS_ID.get(month)}" if month else "semua")
             facts_lines.append(f"- {member}: total {total_km:.2f} km ({tag}), {n} aktivitas. Rujukan: [{idx}]")
 
     if intent == "threshold":
@@ -298,8 +539,8 @@ def answer_with_llm(query: str, contexts: List[str]) -> Tuple[str, str]:
         if one and thr is not None:
             member, idx = one
             text = contexts[idx - 1] if 1 <= idx <= len(contexts) else contexts[0]
-            ok, example = _any_run_ge_km(text, thr, month=month)
-            tag = f" di bulan {_MONTHS_ID.get(month)}" if month else ""
+            ok, example = _any_run_ge_km(text, thr, month=month, date_range=rng)
+            tag = f" di {rng.describe()}" if rng else (f" di bulan {_MONTHS_ID.get(month)}" if month else "")
             if ok:
                 facts_lines.append(f"- {member} pernah ≥ {thr:.2f} km{tag}. Contoh: {example} (rujukan [{idx}])")
             else:
@@ -307,27 +548,51 @@ def answer_with_llm(query: str, contexts: List[str]) -> Tuple[str, str]:
 
     facts_text = "\n".join(facts_lines) if facts_lines else "(tidak ada fakta hitungan yang relevan)"
 
-    # ===== Use LLM when available =====
+    # ===== Prompt untuk LLM (kalau tersedia) =====
     if provider in ("groq", "openai"):
+        plan["provider"] = provider
+        # konteks dipadatkan sesuai budget token: baris relevan utuh, sisanya ringkasan per bulan
+        ctx_text = pack_context(
+            narrowed_refs,
+            intent=intent,
+            month=month,
+            year=year,
+            date_range=rng,
+            threshold=_detect_threshold_km(query) if intent == "threshold" else None,
+        )
         if intent in ("total", "compare", "threshold") and facts_text:
-            prompt = _build_guarded_prompt(query, ctx_text, facts_text)
-            out = _call_groq(prompt, getattr(settings, "GROQ_MODEL", "llama-3.1-8b-instant")) if provider == "groq" else _call_openai(prompt, getattr(settings, "OPENAI_MODEL", "gpt-4o-mini"))
-            if out:
-                return (out, f"{provider}:{getattr(settings, 'GROQ_MODEL' if provider=='groq' else 'OPENAI_MODEL', '')}")
+            plan["prompt"] = _build_guarded_prompt(query, ctx_text, facts_text)
         else:
-            prompt = _build_prompts(query, ctx_text)
-            out = _call_groq(prompt, getattr(settings, "GROQ_MODEL", "llama-3.1-8b-instant")) if provider == "groq" else _call_openai(prompt, getattr(settings, "OPENAI_MODEL", "gpt-4o-mini"))
-            if out:
-                return (out, f"{provider}:{getattr(settings, 'GROQ_MODEL' if provider=='groq' else 'OPENAI_MODEL', '')}")
+            plan["prompt"] = _build_prompts(query, ctx_text)
+    return plan
+
+
+def _call_llm(plan: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+    if not plan.get("prompt"):
+        return None
+    return complete_chat(plan["prompt"], plan["provider"])
+
+
+async def _call_llm_async(plan: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+    if not plan.get("prompt"):
+        return None
+    return await acomplete_chat(plan["prompt"], plan["provider"])
+
+
+def _fallback_answer(query: str, contexts: List[str], plan: Dict[str, Any]) -> Tuple[str, str]:
+    """Jawaban deterministik kalau LLM tidak aktif / gagal."""
+    intent = plan["intent"]
+    month = plan["month"]
+    rng = plan.get("date_range")
+    narrowed_contexts = plan["narrowed"]
 
-    # ===== Fallback deterministic answers =====
     if intent == "threshold":
         one = _detect_member_from_query_or_ctx(query, contexts)
         thr = _detect_threshold_km(query)
         if one and thr is not None:
             member, idx = one
             text = contexts[idx - 1] if 1 <= idx <= len(contexts) else contexts[0]
-            ok, example = _any_run_ge_km(text, thr, month=month)
+            ok, example = _any_run_ge_km(text, thr, month=month, date_range=rng)
             if ok:
                 ex = f" Contoh: {example}" if example else ""
                 return (f"Ya, {member} pernah ≥ {thr:.2f} km.{ex} Rujukan: [{idx}]", "calc")
@@ -339,25 +604,25 @@ def answer_with_llm(query: str, contexts: List[str]) -> Tuple[str, str]:
         if one:
             member, idx = one
             text = contexts[idx - 1] if 1 <= idx <= len(contexts) else contexts[0]
-            total_km, n = _sum_km_from_ctx_text(text, month=month)
-            tag = f"bulan {_MONTHS_ID.get(month)}" if month else "semua di konteks"
+            total_km, n = _sum_km_from_ctx_text(text, month=month, date_range=rng)
+            tag = rng.describe() if rng else (f"bulan {_MONTHS_ID.get(month)}" if month else "semua di konteks")
             return (f"Total jarak lari {member} pada {tag}: {total_km:.2f} km (dari {n} aktivitas). Rujukan: [{idx}]", "calc")
 
     if intent == "compare":
         duo = _detect_two_members_from_query(query, contexts)
         if duo and len(duo) >= 2:
             (m1, i1), (m2, i2) = duo[0], duo[1]
-            t1, n1 = _sum_km_from_ctx_text(contexts[i1 - 1], month=month)
-            t2, n2 = _sum_km_from_ctx_text(contexts[i2 - 1], month=month)
+            t1, n1 = _sum_km_from_ctx_text(contexts[i1 - 1], month=month, date_range=rng)
+            t2, n2 = _sum_km_from_ctx_text(contexts[i2 - 1], month=month, date_range=rng)
             if n1 + n2 > 0:
                 who = m1 if t1 >= t2 else m2
                 diff = round(abs(t1 - t2), 2)
-                per = f"bulan {_MONTHS_ID.get(month)}" if month else "periode yang ada di konteks"
+                per = rng.describe() if rng else (f"bulan {_MONTHS_ID.get(month)}" if month else "periode yang ada di konteks")
                 return (f"Perbandingan {per}: {m1} {t1:.2f} km (rujukan [{i1}]) vs {m2} {t2:.2f} km (rujukan [{i2}]). Lebih jauh: {who} (+{diff:.2f} km).", "calc")
         else:
-            # Jika user minta 'leader/siapa paling jauh' tanpa menyebut dua nama, gunakan leaderboard all‑time
-            scope = "all"
-            board = compute_leaderboard(scope=scope)
+            # Jika user minta 'leader/siapa paling jauh' tanpa menyebut dua nama, gunakan leaderboard
+            # periode yang diminta ("minggu lalu"), atau all‑time kalau tanpa periode
+            board = compute_leaderboard(date_range=rng)
             if board:
                 top = board[0]
                 # Cari rujukan indeks untuk top (ambil pertama yang cocok di contexts)
@@ -368,7 +633,8 @@ def answer_with_llm(query: str, contexts: List[str]) -> Tuple[str, str]:
                         ref_idx = idx
                         break
                 ref_txt = f" (rujukan [{ref_idx}])" if ref_idx else ""
-                return (f"Leader (all‑time) berdasarkan total jarak: {top['member']} {top['total_km']:.2f} km dengan {top['activities']} aktivitas{ref_txt}.", "calc")
+                period = rng.describe() if rng else "all‑time"
+                return (f"Leader ({period}) berdasarkan total jarak: {top['member']} {top['total_km']:.2f} km dengan {top['activities']} aktivitas{ref_txt}.", "calc")
 
     # Generic fallback
     preview = (narrowed_contexts[0] if narrowed_contexts else "")[:220].replace("\n", " ")
@@ -378,3 +644,60 @@ def answer_with_llm(query: str, contexts: List[str]) -> Tuple[str, str]:
         "Mau aku bantu ringkas aktivitas member tertentu atau cari rekap terbaru?"
     )
     return (answer, "fallback")
+
+
+def answer_with_llm(query: str, contexts: List[str], date_range: Optional[DateRange] = None) -> Tuple[str, str]:
+    """
+    Jawab berbasis konteks. Jika LLM tersedia, biarkan LLM menyusun jawaban natural
+    dengan guardrails: hanya pakai data dari konteks + fakta yang dihitung. Fallback
+    deterministik jika LLM tidak tersedia.
+
+    Return: (answer, provider)
+    """
+    plan = _plan_answer(query, contexts, date_range)
+    if plan["answer"]:
+        return plan["answer"]
+    out = _call_llm(plan)
+    if out:
+        return out
+    return _fallback_answer(query, contexts, plan)
+
+
+async def answer_with_llm_async(query: str, contexts: List[str], allow_llm: bool = True, date_range: Optional[DateRange] = None,
+                                admit: Optional[Callable[[], Optional[str]]] = None) -> Tuple[str, str]:
+    """
+    Versi async answer_with_llm: tahap deterministik di pool CPU,
+    panggilan LLM native async dibatasi LLM_MAX_CONCURRENCY.
+    Antrian slot LLM punya batas panjang dan deadline; kalau lewat, jawab deterministik.
+    `allow_llm=False` -> langsung calc/fallback.
+    `admit` (admission control) baru dipanggil kalau jawaban memang butuh LLM; return alasan shed atau None.
+    """
+    with stage("answer_plan"):
+        plan = await run_cpu(_plan_answer, query, contexts, date_range)
+    if plan["answer"]:
+        return plan["answer"]
+    # breaker open / tanpa API key -> langsung ke jawaban calc/fallback, tanpa antri slot
+    if allow_llm and plan["prompt"] and llm_available(plan["provider"]):
+        # token bucket hanya dipotong di jalur LLM (jawaban calc/shortcut/cache gratis)
+        shed = admit() if admit else None
+        if shed:
+            mark_shed(shed)
+            allow_llm = False
+    if allow_llm and plan["prompt"] and llm_available(plan["provider"]):
+        try:
+            queued_at = time.perf_counter()
+            async with llm_limiter.slot(timeout=settings.LLM_QUEUE_TIMEOUT_SECONDS, max_queue=settings.LLM_QUEUE_MAX):
+                record_stage("llm_queue", (time.perf_counter() - queued_at) * 1000)
+                with stage("llm"):
+                    out = await _call_llm_async(plan)
+            if out:
+                return out
+        except LimiterRejected as e:
+            admission.record_shed(e.reason)
+            mark_shed(e.reason)
+            logger.warning(f"Antrian LLM menolak request ({e.reason}), jawab tanpa LLM.")
+    # fallback compare bisa scan seluruh koleksi (leaderboard) -> pool I/O
+    with stage("fallback"):
+        if plan["intent"] == "compare":
+            return await run_io(_fallback_answer, query, contexts, plan)
+        return await run_cpu(_fallback_answer, query, contexts, plan)
@@ -0,0 +1,56 @@
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.services.rag.answerer import _detect_intent, _detect_month, _detect_threshold_km, _detect_year
+from app.services.rag.context_packer import _select_lines, split_member_doc
+from app.services.rag.date_range import resolve_date_range
+
+
+# ==================================================
+# COMPACT CONTEXTS (id + cuplikan, bukan dokumen utuh)
+# ==================================================
+def _doc_id(header: str, fallback: str) -> str:
+    # header dokumen: "<Nama> melakukan beberapa aktivitas lari:" ; doc_id == member_name
+    name = header.split(" melakukan", 1)[0].strip()
+    return name or fallback
+
+
+def compact_contexts(query: str, contexts: List[str], month: Optional[int] = None, year: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Ganti teks dokumen penuh dengan {ref, id, snippet, matched}:
+    - `ref` sama dengan nomor rujukan [n] di jawaban
+    - `snippet` berisi beberapa baris aktivitas yang paling relevan (periode/ambang km dari query)
+    """
+    intent = _detect_intent(query)
+    month = _detect_month(query) or month
+    year = _detect_year(query) or year
+    threshold = _detect_threshold_km(query) if intent == "threshold" else None
+    date_range = resolve_date_range(query, month, year)
+    max_lines = max(1, int(settings.COMPACT_SNIPPET_LINES))
+    max_chars = max(40, int(settings.COMPACT_SNIPPET_MAX_CHARS))
+
+    out: List[Dict[str, Any]] = []
+    for i, text in enumerate(contexts or []):
+        header, acts = split_member_doc(text)
+        relevant, _ = _select_lines(acts, intent, month, year, threshold, date_range)
+        lines = [a["line"] for a in relevant[:max_lines]]
+        snippet = " | ".join(lines) if lines else header
+        if len(snippet) > max_chars:
+            snippet = snippet[: max_chars - 1].rstrip() + "…"
+        out.append({
+            "ref": i + 1,
+            "id": _doc_id(header, f"doc-{i + 1}"),
+            "snippet": snippet,
+            "matched": len(relevant),
+        })
+    return out
+
+
+def compact_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Versi ringkas satu hasil /ask (dict baru; hasil asli tidak diubah karena bisa berasal dari cache)."""
+    if not isinstance(result.get("contexts"), list):
+        return result
+    filters = result.get("filters") or {}
+    return {
+        **result,
+        "contexts": compact_contexts(result.get("query") or "", result["contexts"], filters.get("month"), filters.get("year")),
+    }
@@ -0,0 +1,194 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from collections import OrderedDict
+from datetime import date
+from functools import lru_cache
+from app.core.config import settings
+from app.core.logger import logger
+import hashlib
+import os
+import re
+
+
+_DATE_RX = re.compile(r"(20\d{2})-(\d{2})-(\d{2})\s*:")
+_KM_RX = re.compile(r"sejauh\s+([0-9]+(?:[.,][0-9]+)?)\s*km", re.IGNORECASE)
+# pemisah baris aktivitas: " - " yang langsung diikuti tanggal (nama member / judul aktivitas boleh berisi " - ")
+_ACTIVITY_SPLIT_RX = re.compile(r"\s+-\s+(?=20\d{2}-\d{2}-\d{2}\s*:)")
+# file encoding tiktoken publik; tiktoken menyimpannya di cache dengan nama sha1(url)
+_TIKTOKEN_URL = "https://openaipublic.blob.core.windows.net/encodings/{name}.tiktoken"
+
+
+# ==================================================
+# TOKENIZER
+# ==================================================
+def _tiktoken_cached(name: str, cache_dir: str) -> bool:
+    return os.path.isfile(os.path.join(cache_dir, hashlib.sha1(_TIKTOKEN_URL.format(name=name).encode()).hexdigest()))
+
+
+@lru_cache(maxsize=1)
+def _get_token_counter() -> Callable[[str], int]:
+    """
+    Penghitung token: tiktoken (encoding LLM_TOKENIZER) kalau terpasang dan file encoding-nya
+    sudah ada di TIKTOKEN_CACHE_DIR, lalu tokenizer model embedding, terakhir perkiraan ~4 karakter/token.
+    tiktoken mengunduh file encoding saat pertama dipakai; tanpa LLM_TOKENIZER_DOWNLOAD, file yang
+    belum ada tidak diunduh (deployment offline tidak tertahan di warmup).
+    """
+    # TIKTOKEN_CACHE_DIR dari env (mis. image Docker) didahulukan; tiktoken membaca env yang sama
+    cache_dir = os.environ.get("TIKTOKEN_CACHE_DIR") or (os.path.abspath(settings.TIKTOKEN_CACHE_DIR) if (settings.TIKTOKEN_CACHE_DIR or "").strip() else "")
+    if cache_dir:
+        os.environ["TIKTOKEN_CACHE_DIR"] = cache_dir
+    try:
+        import tiktoken
+
+        if not settings.LLM_TOKENIZER_DOWNLOAD and not (cache_dir and _tiktoken_cached(settings.LLM_TOKENIZER, cache_dir)):
+            raise FileNotFoundError(f"file encoding '{settings.LLM_TOKENIZER}' belum ada di {cache_dir or '(TIKTOKEN_CACHE_DIR kosong)'}")
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        enc = tiktoken.get_encoding(settings.LLM_TOKENIZER)
+        return lambda text: len(enc.encode(text, disallowed_special=()))
+    except Exception as e:
+        logger.info(f"tiktoken tidak dipakai ({e}), coba tokenizer model embedding.")
+    try:
+        from app.services.chroma.embeddings import get_model
+        tok = getattr(get_model(), "tokenizer", None)
+        if tok is not None:
+            return lambda text: len(tok.encode(text, add_special_tokens=False))
+    except Exception:
+        pass
+    logger.warning("Tokenizer tidak tersedia, pakai perkiraan 4 karakter/token.")
+    return lambda text: max(1, len(text) // 4)
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    return _get_token_counter()(text)
+
+
+# ==================================================
+# PARSING DOKUMEN MEMBER
+# ==================================================
+def _parse_activity(line: str) -> Dict[str, Any]:
+    act: Dict[str, Any] = {"line": line.strip(), "date": None, "km": None}
+    dm = _DATE_RX.search(line)
+    if dm:
+        try:
+            act["date"] = date(int(dm.group(1)), int(dm.group(2)), int(dm.group(3)))
+        except ValueError:
+            pass
+    km = _KM_RX.search(line)
+    if km:
+        act["km"] = float(km.group(1).replace(",", "."))
+    return act
+
+
+def activity_lines(text: str) -> List[str]:
+    """Dokumen per-member -> [header, baris aktivitas...]; dipisah di " - " sebelum tanggal "YYYY-MM-DD:"."""
+    return _ACTIVITY_SPLIT_RX.split(text or "")
+
+
+def split_member_doc(text: str) -> Tuple[str, List[Dict[str, Any]]]:
+    """Pecah dokumen per-member jadi (header, daftar aktivitas)."""
+    parts = activity_lines(text)
+    header = parts[0].strip()
+    return header, [_parse_activity(p) for p in parts[1:] if p.strip()]
+
+
+def _in_period(act: Dict[str, Any], month: Optional[int], year: Optional[int], date_range=None) -> bool:
+    d = act["date"]
+    if date_range is not None:
+        # rentang tanggal ("minggu lalu", "sejak agustus") menggantikan filter bulan/tahun
+        return date_range.contains(d)
+    if d is None:
+        return month is None and year is None
+    if month and d.month != month:
+        return False
+    if year and d.year != year:
+        return False
+    return True
+
+
+def _month_summaries(acts: List[Dict[str, Any]]) -> List[str]:
+    """Ringkas aktivitas jadi total per bulan (terbaru dulu)."""
+    buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+    for act in sorted(acts, key=lambda a: a["date"] or date.min, reverse=True):
+        key = act["date"].strftime("%Y-%m") if act["date"] else "tanpa tanggal"
+        bucket = buckets.setdefault(key, [0, 0.0])
+        bucket[0] += 1
+        bucket[1] += act["km"] or 0.0
+    return [f"ringkasan {key}: {n} aktivitas, {km:.2f} km" for key, (n, km) in buckets.items()]
+
+
+# ==================================================
+# PACKER
+# ==================================================
+def _select_lines(acts: List[Dict[str, Any]], intent: str, month: Optional[int], year: Optional[int], threshold: Optional[float],
+                  date_range=None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Return (baris relevan urut prioritas, sisa baris untuk diringkas)."""
+    newest_first = sorted(acts, key=lambda a: a["date"] or date.min, reverse=True)
+    relevant: List[Dict[str, Any]] = []
+    if intent == "threshold" and threshold is not None:
+        relevant = [a for a in newest_first if a["km"] is not None and a["km"] >= threshold and _in_period(a, month, year, date_range)]
+    picked = {id(a) for a in relevant}
+    relevant += [a for a in newest_first if _in_period(a, month, year, date_range) and id(a) not in picked]
+    picked = {id(a) for a in relevant}
+    rest = [a for a in newest_first if id(a) not in picked]
+    return relevant, rest
+
+
+def _pack_one(ref: int, text: str, share: int, intent: str, month: Optional[int], year: Optional[int], threshold: Optional[float],
+              date_range=None) -> Tuple[str, int]:
+    header, acts = split_member_doc(text)
+    out = f"[{ref}] {header}"
+    used = count_tokens(out)
+    relevant, rest = _select_lines(acts, intent, month, year, threshold, date_range)
+
+    pieces = [(act, f" - {act['line']}") for act in relevant]
+    costs = [count_tokens(piece) for _, piece in pieces]
+    # sisakan ruang untuk ringkasan kalau ada baris yang tidak akan ikut utuh
+    reserve = share // 4 if (rest or used + sum(costs) > share) else 0
+
+    overflow: List[Dict[str, Any]] = []
+    for (act, piece), cost in zip(pieces, costs):
+        if overflow or used + cost > share - reserve:
+            overflow.append(act)
+            continue
+        out += piece
+        used += cost
+
+    # sisa (di luar periode / tidak muat) diringkas per bulan
+    for summary in _month_summaries(overflow + rest):
+        piece = f" - {summary}"
+        cost = count_tokens(piece)
+        if used + cost > share:
+            break
+        out += piece
+        used += cost
+    return out, used
+
+
+def pack_context(
+    contexts: List[Tuple[int, str]],
+    intent: str = "generic",
+    month: Optional[int] = None,
+    year: Optional[int] = None,
+    threshold: Optional[float] = None,
+    budget: Optional[int] = None,
+    date_range=None,
+) -> str:
+    """
+    Susun konteks prompt dalam batas token (LLM_CONTEXT_TOKEN_BUDGET):
+    - baris aktivitas yang cocok periode/intent diambil utuh (terbaru dulu);
+      periode = `date_range` (DateRange) kalau ada, selain itu bulan/tahun
+    - sisanya diringkas jadi total per bulan
+    `contexts`: list (nomor rujukan, teks dokumen) supaya [nomor] tetap konsisten dengan fakta.
+    """
+    if not contexts:
+        return ""
+    remaining = int(budget or settings.LLM_CONTEXT_TOKEN_BUDGET)
+    blocks: List[str] = []
+    for n, (ref, text) in enumerate(contexts):
+        share = max(1, remaining // (len(contexts) - n))
+        block, used = _pack_one(ref, text, share, intent, month, year, threshold, date_range)
+        blocks.append(block)
+        remaining = max(0, remaining - used)
+    return "\n".join(blocks)
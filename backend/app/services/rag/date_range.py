@@ -0,0 +1,368 @@
+from typing import Any, Dict, Iterator, NamedTuple, Optional, Tuple
+from calendar import monthrange
+from datetime import date, datetime, timedelta
+from app.core.config import settings
+from app.core.logger import logger
+from app.core.tenant import tenant_state
+import re
+
+
+# ==================================================
+# NAMA BULAN (dipakai juga oleh answerer)
+# ==================================================
+MONTHS_ID = {
+    1: "januari", 2: "februari", 3: "maret", 4: "april",
+    5: "mei", 6: "juni", 7: "juli", 8: "agustus",
+    9: "september", 10: "oktober", 11: "november", 12: "desember",
+}
+# nama lengkap: aman dicari di teks bebas
+MONTHS_REV = {v: k for k, v in MONTHS_ID.items()}
+MONTHS_REV.update({
+    "sept": 9, "january": 1, "february": 2, "march": 3, "june": 6, "july": 7,
+    "august": 8, "october": 10, "december": 12,
+})
+# singkatan + "may" bentrok dengan kata biasa ("may i know ..."): di teks bebas hanya diterima
+# setelah "bulan"/"month" atau tepat sebelum tahun ("mar 2025")
+MONTH_ALIASES = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6, "jul": 7,
+    "agu": 8, "agt": 8, "ags": 8, "sep": 9, "okt": 10, "nov": 11, "des": 12,
+}
+_MONTHS_ALL = {**MONTHS_REV, **MONTH_ALIASES}
+
+
+class DateRange(NamedTuple):
+    """Rentang tanggal inklusif hasil parsing query (start <= end)."""
+    start: date
+    end: date
+    label: str
+
+    def contains(self, d: Optional[date]) -> bool:
+        return d is not None and self.start <= d <= self.end
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"start": self.start.isoformat(), "end": self.end.isoformat(), "label": self.label}
+
+    def describe(self) -> str:
+        return f"{self.label} ({self.start.isoformat()} s/d {self.end.isoformat()})"
+
+
+# ==================================================
+# HELPER KALENDER
+# ==================================================
+def _add_months(d: date, months: int) -> date:
+    total = d.year * 12 + (d.month - 1) + months
+    y, m = divmod(total, 12)
+    return date(y, m + 1, min(d.day, monthrange(y, m + 1)[1]))
+
+
+def month_range(year: int, month: int, label: Optional[str] = None) -> DateRange:
+    return DateRange(date(year, month, 1), date(year, month, monthrange(year, month)[1]), label or f"{MONTHS_ID[month]} {year}")
+
+
+def year_range(year: int, label: Optional[str] = None) -> DateRange:
+    return DateRange(date(year, 1, 1), date(year, 12, 31), label or f"tahun {year}")
+
+
+def week_range(iso_year: int, iso_week: int, label: Optional[str] = None) -> DateRange:
+    start = date.fromisocalendar(iso_year, iso_week, 1)
+    return DateRange(start, start + timedelta(days=6), label or f"minggu ke-{iso_week} {iso_year}")
+
+
+def period_range(month: Optional[int], year: Optional[int], today: Optional[date] = None) -> Optional[DateRange]:
+    """Filter bulan/tahun lama -> rentang. Bulan tanpa tahun = kemunculan terakhir bulan itu (tidak di masa depan)."""
+    today = today or date.today()
+    if month and year:
+        return month_range(year, month)
+    if month:
+        return month_range(today.year if month <= today.month else today.year - 1, month)
+    if year:
+        return year_range(year)
+    return None
+
+
+def scope_range(scope: str, year: Optional[int] = None, month: Optional[int] = None, week: Optional[int] = None, today: Optional[date] = None) -> Optional[DateRange]:
+    """Scope leaderboard (all | year | month | week) -> rentang; `all` = tanpa batas (None)."""
+    today = today or date.today()
+    scope = (scope or "all").lower()
+    y = year or today.year
+    if scope == "year":
+        return year_range(y)
+    if scope == "month":
+        return month_range(y, month or today.month)
+    if scope == "week":
+        iso = today.isocalendar()
+        return week_range(y if year else iso[0], week or iso[1])
+    return None
+
+
+# ==================================================
+# PARSER CEPAT (regex precompiled) + fallback dateparser
+# ==================================================
+_UNIT = r"(hari|minggu|pekan|bulan|tahun|days?|weeks?|months?|years?)"
+_MONTH_NAMES = "|".join(sorted(_MONTHS_ALL, key=len, reverse=True))
+_MONTH_FULL = "|".join(sorted(MONTHS_REV, key=len, reverse=True))
+_MONTH_ALIAS = "|".join(sorted(MONTH_ALIASES, key=len, reverse=True))
+
+_RX_LAST_N = re.compile(rf"\b(\d{{1,3}})\s*{_UNIT}\s+(?:terakhir|belakangan|ke\s*belakang)\b|\blast\s+(\d{{1,3}})\s*{_UNIT}\b")
+_RX_N_AGO = re.compile(rf"\b(\d{{1,3}})\s*{_UNIT}\s+(?:yang\s+)?(?:lalu|ago)\b")
+_RX_FIXED = re.compile(
+    r"\b(hari\s+ini|today|kemarin|yesterday"
+    r"|(?:minggu|pekan)\s+(?:ini|lalu|kemarin)|this\s+week|last\s+week"
+    r"|bulan\s+(?:ini|lalu|kemarin)|this\s+month|last\s+month"
+    r"|tahun\s+(?:ini|lalu|kemarin)|this\s+year|last\s+year)\b"
+)
+_RX_BETWEEN = re.compile(r"\b(?:dari|antara|mulai|from|between)\s+(?:tanggal\s+|tgl\s+)?(.+?)\s+(?:sampai|hingga|s/d|sd|dan|to|until|-)\s+(?:tanggal\s+|tgl\s+)?(.+?)(?=$|[?!,;]|\s+(?:siapa|berapa|apa|apakah|yang|who|how)\b)")
+_RX_SINCE = re.compile(r"\b(?:sejak|mulai|semenjak|since)\s+(?:tanggal\s+|tgl\s+)?(.+?)(?=$|[?!,;]|\s+(?:siapa|berapa|apa|apakah|yang|sampai|hingga|who|how)\b)")
+_RX_ISO = re.compile(r"^(20\d{2})-(\d{1,2})-(\d{1,2})$")
+_RX_DMY = re.compile(r"^(\d{1,2})[/.-](\d{1,2})[/.-](20\d{2})$")
+_RX_DAY_MONTH = re.compile(rf"^(\d{{1,2}})\s+({_MONTH_NAMES})(?:\s+(20\d{{2}}))?$")
+_RX_MONTH_YEAR = re.compile(rf"^(?:bulan\s+)?({_MONTH_NAMES})(?:\s+(20\d{{2}}))?$")
+_RX_YEAR = re.compile(r"^(?:tahun\s+)?(20\d{2})$")
+_RX_MONTH_ANY = re.compile(
+    rf"\b(?:bulan|bln)\s*(1[0-2]|0?[1-9])\b"
+    rf"|\b({_MONTH_FULL})\b(?:\s+(20\d{{2}}))?"
+    rf"|\b(?:bulan|bln|month(?:\s+of)?)\s+({_MONTH_ALIAS})\b(?:\s+(20\d{{2}}))?"
+    rf"|\b({_MONTH_ALIAS})\s+(20\d{{2}})\b"
+)
+_RX_YEAR_ANY = re.compile(r"\b(20\d{2})\b")
+_RX_NOT_DATE = re.compile(r"^\d+$|\d\s*(?:k|km|kilometer)\b")
+
+
+def month_in_text(text: str) -> Optional[Tuple[int, Optional[int]]]:
+    """(bulan, tahun atau None) pertama yang disebut di teks bebas (lowercase); singkatan butuh penanda."""
+    m = _RX_MONTH_ANY.search(text)
+    if not m:
+        return None
+    if m.group(1):
+        return int(m.group(1)), None
+    for name_group in (2, 4, 6):
+        if m.group(name_group):
+            year = m.group(name_group + 1)
+            return _MONTHS_ALL[m.group(name_group)], int(year) if year else None
+    return None
+
+
+def _unit_key(unit: str) -> str:
+    unit = unit.rstrip("s")
+    return {"day": "hari", "week": "minggu", "pekan": "minggu", "month": "bulan", "year": "tahun"}.get(unit, unit)
+
+
+def _last_n(n: int, unit: str, today: date) -> DateRange:
+    unit = _unit_key(unit)
+    n = max(1, n)
+    if unit == "hari":
+        start = today - timedelta(days=n - 1)
+    elif unit == "minggu":
+        start = today - timedelta(days=7 * n - 1)
+    elif unit == "bulan":
+        start = _add_months(today, -n) + timedelta(days=1)
+    else:
+        start = _add_months(today, -12 * n) + timedelta(days=1)
+    return DateRange(start, today, f"{n} {unit} terakhir")
+
+
+def _n_ago(n: int, unit: str, today: date) -> DateRange:
+    unit = _unit_key(unit)
+    label = f"{n} {unit} lalu"
+    if unit == "hari":
+        d = today - timedelta(days=n)
+        return DateRange(d, d, label)
+    if unit == "minggu":
+        iso = (today - timedelta(days=7 * n)).isocalendar()
+        return week_range(iso[0], iso[1], label)
+    if unit == "bulan":
+        d = _add_months(today.replace(day=1), -n)
+        return month_range(d.year, d.month, label)
+    return year_range(today.year - n, label)
+
+
+def _fixed(phrase: str, today: date) -> DateRange:
+    phrase = re.sub(r"\s+", " ", phrase)
+    if phrase in ("hari ini", "today"):
+        return DateRange(today, today, "hari ini")
+    if phrase in ("kemarin", "yesterday"):
+        d = today - timedelta(days=1)
+        return DateRange(d, d, "kemarin")
+    word = phrase.split()[-1]
+    previous = word in ("lalu", "kemarin") or phrase.startswith("last")
+    if "minggu" in phrase or "pekan" in phrase or "week" in phrase:
+        ref = today - timedelta(days=7) if previous else today
+        iso = ref.isocalendar()
+        return week_range(iso[0], iso[1], "minggu lalu" if previous else "minggu ini")
+    if "bulan" in phrase or "month" in phrase:
+        ref = _add_months(today.replace(day=1), -1) if previous else today
+        return month_range(ref.year, ref.month, "bulan lalu" if previous else "bulan ini")
+    return year_range(today.year - 1 if previous else today.year, "tahun lalu" if previous else "tahun ini")
+
+
+def _dateparser_point(text: str, today: date) -> Optional[date]:
+    """Fallback untuk frasa tanggal di luar pola cepat (import dateparser ditunda sampai dibutuhkan)."""
+    if not settings.DATE_PARSER_FALLBACK:
+        return None
+    try:
+        import dateparser
+
+        parsed = dateparser.parse(
+            text,
+            languages=["id", "en"],
+            settings={"RELATIVE_BASE": datetime.combine(today, datetime.min.time()), "PREFER_DATES_FROM": "past", "DATE_ORDER": "DMY"},
+        )
+        return parsed.date() if parsed else None
+    except Exception as e:
+        logger.warning(f"dateparser gagal untuk '{text}': {e}")
+        return None
+
+
+def _parse_point(text: str, today: date, end: bool = False) -> Optional[date]:
+    """
+    Satu titik tanggal dari potongan teks ("agustus", "17 agustus 2025", "2025-08-01", "2024").
+    Bulan/tahun tanpa hari -> awal periode (atau akhir periode kalau `end`).
+    """
+    text = text.strip().rstrip(".?!")
+    if not text:
+        return None
+    m = _RX_ISO.match(text)
+    if m:
+        return date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+    m = _RX_DMY.match(text)
+    if m:
+        return date(int(m.group(3)), int(m.group(2)), int(m.group(1)))
+    m = _RX_DAY_MONTH.match(text)
+    if m:
+        month = _MONTHS_ALL[m.group(2)]
+        year = int(m.group(3)) if m.group(3) else (today.year if (month, int(m.group(1))) <= (today.month, today.day) else today.year - 1)
+        return date(year, month, int(m.group(1)))
+    m = _RX_MONTH_YEAR.match(text)
+    if m:
+        rng = period_range(_MONTHS_ALL[m.group(1)], int(m.group(2)) if m.group(2) else None, today)
+        return rng.end if end else rng.start
+    m = _RX_YEAR.match(text)
+    if m:
+        rng = year_range(int(m.group(1)))
+        return rng.end if end else rng.start
+    # angka polos / jarak ("10", "5 km") bukan tanggal; jangan biarkan dateparser menebak
+    if _RX_NOT_DATE.search(text):
+        return None
+    return _dateparser_point(text, today)
+
+
+def _parse_span(text: str, today: date, end: bool = False) -> Optional[date]:
+    """Coba potongan terpanjang dulu (maks 4 kata) supaya 'agustus 2025 siapa...' tetap terbaca."""
+    words = text.split()
+    for n in range(min(4, len(words)), 0, -1):
+        try:
+            point = _parse_point(" ".join(words[:n]), today, end=end)
+        except ValueError:
+            point = None
+        if point:
+            return point
+    return None
+
+
+def _matches(rx: "re.Pattern[str]", text: str) -> Iterator["re.Match[str]"]:
+    """Semua match termasuk yang tumpang tindih (mulai dari tiap posisi kata kunci)."""
+    pos = 0
+    while True:
+        m = rx.search(text, pos)
+        if not m:
+            return
+        yield m
+        pos = m.start() + 1
+
+
+def detect_date_range(query: str, today: Optional[date] = None) -> Optional[DateRange]:
+    """
+    Rentang tanggal dari query (Indonesia/Inggris), urutan prioritas:
+    1. rentang eksplisit: "dari 1 agustus sampai 15 september", "antara juli dan agustus"
+    2. "sejak agustus", "mulai 2025-07-01" -> sampai hari ini
+    3. relatif: "3 bulan terakhir", "2 minggu lalu", "minggu lalu", "bulan ini", "tahun lalu", "kemarin"
+    4. absolut: "agustus 2025", "bulan 9", "tahun 2024"
+    Pola umum lewat regex precompiled; titik tanggal yang tidak dikenal baru dilempar ke dateparser.
+    """
+    q = re.sub(r"\s+", " ", (query or "").lower()).strip()
+    if not q:
+        return None
+    today = today or date.today()
+
+    # "lebih dari 20 km dari januari sampai maret": kata kunci pertama bukan tanggal -> coba posisi berikutnya
+    for m in _matches(_RX_BETWEEN, q):
+        start, end = _parse_span(m.group(1), today), _parse_span(m.group(2), today, end=True)
+        if start and end and start <= end:
+            return DateRange(start, end, f"{start.isoformat()} s/d {end.isoformat()}")
+    for m in _matches(_RX_SINCE, q):
+        start = _parse_span(m.group(1), today)
+        if start and start <= today:
+            return DateRange(start, today, f"sejak {m.group(1).strip()}")
+
+    m = _RX_LAST_N.search(q)
+    if m:
+        n, unit = (m.group(1), m.group(2)) if m.group(1) else (m.group(3), m.group(4))
+        return _last_n(int(n), unit, today)
+    m = _RX_N_AGO.search(q)
+    if m:
+        return _n_ago(int(m.group(1)), m.group(2), today)
+    m = _RX_FIXED.search(q)
+    if m:
+        return _fixed(m.group(1), today)
+
+    found = month_in_text(q)
+    if found:
+        month, year = found
+        if year is None:
+            ym = _RX_YEAR_ANY.search(q)
+            year = int(ym.group(1)) if ym else None
+        return period_range(month, year, today)
+    m = _RX_YEAR_ANY.search(q)
+    if m:
+        return year_range(int(m.group(1)))
+    return None
+
+
+def resolve_date_range(query: str, month: Optional[int] = None, year: Optional[int] = None, today: Optional[date] = None) -> Optional[DateRange]:
+    """Rentang dari query; kalau query tidak menyebut periode, pakai filter bulan/tahun (param / memori sesi)."""
+    return detect_date_range(query, today) or period_range(month, year, today)
+
+
+# ==================================================
+# PUSHDOWN KE METADATA DOKUMEN
+# ==================================================
+# versi skema metadata dokumen member; v2 = ada first_date/last_date (int YYYYMMDD)
+DOC_META_VERSION = 2
+
+
+def date_key(d: date) -> int:
+    """Tanggal -> int YYYYMMDD (filter numerik $gte/$lte didukung Chroma dan index NumPy)."""
+    return d.year * 10000 + d.month * 100 + d.day
+
+
+def date_range_where(rng: Optional[DateRange]) -> Optional[dict]:
+    """Filter metadata dokumen member yang punya aktivitas overlap dengan rentang (first_date..last_date)."""
+    if rng is None:
+        return None
+    return {"$and": [{"first_date": {"$lte": date_key(rng.end)}}, {"last_date": {"$gte": date_key(rng.start)}}]}
+
+
+def _dates_indexed() -> bool:
+    """Koleksi aktif sudah punya metadata tanggal (sync/reindex v2)? Di-cache per versi data klub."""
+    from app.services.chroma.db_client import get_active_collection_name
+    from app.services.chroma.manager import get_data_version
+    from app.services.gsheet.state_store import get_state_store
+
+    slot = tenant_state().setdefault("doc_dates", {"version": None, "ready": False})
+    version = get_data_version()
+    if slot["version"] != version:
+        meta = get_state_store().get_meta(get_active_collection_name())
+        slot.update({"version": version, "ready": int(meta.get("doc_meta_version") or 0) >= DOC_META_VERSION})
+    return slot["ready"]
+
+
+def pushdown_where(rng: Optional[DateRange]) -> Optional[dict]:
+    """Filter rentang untuk store; None kalau tanpa rentang atau koleksi belum di-sync ulang dengan metadata tanggal."""
+    if rng is None:
+        return None
+    try:
+        return date_range_where(rng) if _dates_indexed() else None
+    except Exception as e:
+        logger.warning(f"Cek metadata tanggal gagal, tanpa pushdown: {e}")
+        return None
+
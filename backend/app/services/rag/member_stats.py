@@ -0,0 +1,441 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from datetime import date, timedelta
+from app.core.logger import logger
+from app.services.rag.date_range import DateRange
+import numpy as np
+import re
+
+
+# ==================================================
+# ROLLUP STATISTIK PER MEMBER (dihitung saat sync, dibaca O(1))
+# ==================================================
+# PB dihitung dari pace rata-rata aktivitas yang jaraknya >= jarak band (estimasi waktu = pace x jarak band)
+DISTANCE_BANDS: List[Tuple[str, float]] = [("5k", 5.0), ("10k", 10.0), ("21k", 21.0975), ("42k", 42.195)]
+_BAND_BUCKETS: List[Tuple[str, float]] = [("<5k", 5.0), ("5-10k", 10.0), ("10-21k", 21.0975), ("21-42k", 42.195), ("42k+", float("inf"))]
+# histogram pace per 30 detik, 4:00 .. 8:00 /km
+_PACE_EDGES = list(range(240, 481, 30))
+_FASTEST_MIN_KM = 1.0
+# naikkan kalau bentuk rollup berubah -> semua member dihitung ulang di sync berikutnya
+ROLLUP_VERSION = 2
+
+_PACE_RX = re.compile(r"(\d{1,2}):(\d{2})")
+_DATE_RX = re.compile(r"(20\d{2})-(\d{2})-(\d{2})")
+
+
+def _to_float(value: Any) -> Optional[float]:
+    try:
+        return float(str(value).strip().replace(",", "."))
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_date(value: Any) -> Optional[date]:
+    m = _DATE_RX.search(str(value or ""))
+    if not m:
+        return None
+    try:
+        return date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+    except ValueError:
+        return None
+
+
+def _pace_seconds(value: Any) -> Optional[int]:
+    """'5:33 /km' -> 333."""
+    m = _PACE_RX.search(str(value or ""))
+    return int(m.group(1)) * 60 + int(m.group(2)) if m else None
+
+
+def _duration_seconds(value: Any) -> Optional[int]:
+    """'1:14:10' / '49:44' -> detik."""
+    parts = str(value or "").strip().split(":")
+    try:
+        nums = [int(p) for p in parts]
+    except ValueError:
+        return None
+    if len(nums) == 3:
+        return nums[0] * 3600 + nums[1] * 60 + nums[2]
+    if len(nums) == 2:
+        return nums[0] * 60 + nums[1]
+    return None
+
+
+def format_pace(seconds: Optional[float]) -> Optional[str]:
+    if not seconds:
+        return None
+    s = int(round(seconds))
+    return f"{s // 60}:{s % 60:02d} /km"
+
+
+def format_duration(seconds: Optional[float]) -> Optional[str]:
+    if seconds is None:
+        return None
+    s = int(round(seconds))
+    h, rem = divmod(s, 3600)
+    return f"{h}:{rem // 60:02d}:{rem % 60:02d}" if h else f"{rem // 60}:{rem % 60:02d}"
+
+
+def _week_key(d: date) -> str:
+    iso = d.isocalendar()
+    return f"{iso[0]}-W{iso[1]:02d}"
+
+
+def _month_key(d: date) -> str:
+    return f"{d.year}-{d.month:02d}"
+
+
+def _activity(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    d = _to_date(row.get("date"))
+    km = _to_float(row.get("distance_km"))
+    if d is None or km is None or km <= 0:
+        return None
+    secs = _duration_seconds(row.get("moving_time"))
+    pace = _pace_seconds(row.get("avg_pace")) or (secs / km if secs else None)
+    return {
+        "date": d,
+        "km": km,
+        "time_s": secs if secs is not None else (pace * km if pace else None),
+        "pace_s": pace,
+        "elevation_m": _to_float(row.get("elevation_gain_m")) or 0.0,
+        "activity": str(row.get("activity_name") or "").strip(),
+    }
+
+
+def _ref(act: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "date": act["date"].isoformat(),
+        "km": round(act["km"], 2),
+        "activity": act["activity"],
+        "pace": format_pace(act["pace_s"]),
+        "pace_s": round(act["pace_s"]) if act["pace_s"] else None,
+    }
+
+
+def _streaks(keys: List[date], step: timedelta) -> Dict[str, Any]:
+    """Streak beruntun (hari / awal minggu) dari tanggal unik terurut: terpanjang + yang berakhir di aktivitas terakhir."""
+    longest = run = 0
+    prev: Optional[date] = None
+    for k in keys:
+        run = run + 1 if prev is not None and k - prev == step else 1
+        longest = max(longest, run)
+        prev = k
+    return {"last": run, "end": prev.isoformat() if prev else None, "longest": longest}
+
+
+def _series(acts: List[Dict[str, Any]], key_fn) -> Dict[str, Dict[str, Any]]:
+    out: Dict[str, Dict[str, Any]] = {}
+    for act in acts:
+        slot = out.setdefault(key_fn(act["date"]), {"km": 0.0, "runs": 0, "time_s": 0, "elev_m": 0.0})
+        slot["km"] = round(slot["km"] + act["km"], 2)
+        slot["runs"] += 1
+        slot["time_s"] += int(act["time_s"] or 0)
+        slot["elev_m"] = round(slot["elev_m"] + act["elevation_m"], 1)
+    return dict(sorted(out.items()))
+
+
+def _percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    idx = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[idx]
+
+
+def _pace_distribution(acts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    paces = sorted(a["pace_s"] for a in acts if a["pace_s"])
+    labels = [f"<{format_pace(_PACE_EDGES[0])[:-4]}"]
+    labels += [f"{format_pace(lo)[:-4]}-{format_pace(hi)[:-4]}" for lo, hi in zip(_PACE_EDGES, _PACE_EDGES[1:])]
+    labels += [f">={format_pace(_PACE_EDGES[-1])[:-4]}"]
+    buckets = dict.fromkeys(labels, 0)
+    for p in paces:
+        pos = sum(1 for edge in _PACE_EDGES if p >= edge)
+        buckets[labels[pos]] += 1
+    return {
+        "buckets": buckets,
+        "p10": format_pace(_percentile(paces, 0.1)),
+        "p50": format_pace(_percentile(paces, 0.5)),
+        "p90": format_pace(_percentile(paces, 0.9)),
+    }
+
+
+def compute_member_rollup(member: str, rows: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Rollup satu member dari baris sheet mentah (date, activity_name, distance_km, avg_pace, moving_time, elevation_gain_m)."""
+    acts = sorted((a for a in (_activity(r) for r in rows) if a), key=lambda a: a["date"])
+    total_km = sum(a["km"] for a in acts)
+    timed = [a for a in acts if a["time_s"]]
+    timed_km = sum(a["km"] for a in timed)
+    total_time = sum(a["time_s"] for a in timed)
+
+    pbs: Dict[str, Any] = {}
+    for band, km in DISTANCE_BANDS:
+        eligible = [a for a in acts if a["km"] >= km and a["pace_s"]]
+        if eligible:
+            best = min(eligible, key=lambda a: a["pace_s"])
+            pbs[band] = {**_ref(best), "est_time": format_duration(best["pace_s"] * km)}
+
+    bands = dict.fromkeys((b for b, _ in _BAND_BUCKETS), 0)
+    for a in acts:
+        bands[next(b for b, upper in _BAND_BUCKETS if a["km"] < upper)] += 1
+
+    days = sorted({a["date"] for a in acts})
+    weeks = sorted({d - timedelta(days=d.weekday()) for d in days})
+    fastest = [a for a in acts if a["km"] >= _FASTEST_MIN_KM and a["pace_s"]]
+    return {
+        "member": member,
+        "activities": len(acts),
+        "total_km": round(total_km, 2),
+        "total_time_s": int(total_time),
+        "total_elevation_m": round(sum(a["elevation_m"] for a in acts), 1),
+        "first_date": acts[0]["date"].isoformat() if acts else None,
+        "last_date": acts[-1]["date"].isoformat() if acts else None,
+        "avg_km": round(total_km / len(acts), 2) if acts else None,
+        # pace rata-rata tertimbang jarak (total waktu / total km)
+        "avg_pace": format_pace(total_time / timed_km) if timed_km else None,
+        "longest": _ref(max(acts, key=lambda a: a["km"])) if acts else None,
+        "fastest": _ref(min(fastest, key=lambda a: a["pace_s"])) if fastest else None,
+        "pbs": pbs,
+        "distance_bands": bands,
+        "pace_distribution": _pace_distribution(acts),
+        "streaks": {"days": _streaks(days, timedelta(days=1)), "weeks": _streaks(weeks, timedelta(weeks=1))},
+        "weekly": _series(acts, _week_key),
+        "monthly": _series(acts, _month_key),
+        # seri harian: dasar agregat klub untuk rentang tanggal apa pun (club_aggregate)
+        "daily": _series(acts, date.isoformat),
+    }
+
+
+def build_member_rollups(df, names: Optional[set] = None) -> List[Dict[str, Any]]:
+    """Rollup per member dari DataFrame sheet; `names` -> hanya member itu (sync inkremental)."""
+    out = []
+    for name, group in df.groupby("member_name"):
+        member = str(name).strip()
+        if names is not None and member not in names:
+            continue
+        out.append({"member_name": member, "stats": compute_member_rollup(member, group.to_dict("records"))})
+    return out
+
+
+# ==================================================
+# BACA ROLLUP (endpoint /strava/member, intent stats)
+# ==================================================
+def _store_and_collection():
+    from app.services.chroma.db_client import get_active_collection_name
+    from app.services.gsheet.state_store import get_state_store
+
+    return get_state_store(), get_active_collection_name()
+
+
+def get_member_rollup(name: str) -> Optional[Dict[str, Any]]:
+    """Rollup tersimpan (lookup primary key); nama tidak peka huruf besar, fallback ke nama yang mengandung `name`."""
+    key = (name or "").strip().lower()
+    if not key:
+        return None
+    store, collection = _store_and_collection()
+    rollup = store.get_rollup(collection, key)
+    if rollup is not None:
+        return rollup
+    matches = [k for k in store.rollup_members(collection) if key in k]
+    return store.get_rollup(collection, matches[0]) if len(matches) == 1 else None
+
+
+def _current_streaks(streaks: Dict[str, Any], today: date) -> Dict[str, Any]:
+    """Streak berjalan: masih dihitung kalau aktivitas terakhir kemarin/hari ini (hari) atau minggu lalu/ini (minggu)."""
+    out = {}
+    this_week = today - timedelta(days=today.weekday())
+    for unit, grace in (("days", today - timedelta(days=1)), ("weeks", this_week - timedelta(weeks=1))):
+        s = streaks.get(unit) or {}
+        end = date.fromisoformat(s["end"]) if s.get("end") else None
+        out[unit] = {
+            "current": s.get("last", 0) if end and end >= grace else 0,
+            "longest": s.get("longest", 0),
+            "last_active": s.get("end"),
+        }
+    return out
+
+
+def _recent_weeks(weekly: Dict[str, Dict[str, Any]], today: date, n: int = 4) -> Dict[str, Any]:
+    keys = [_week_key(today - timedelta(weeks=i)) for i in range(n)]
+    km = sum(weekly.get(k, {}).get("km", 0.0) for k in keys)
+    return {
+        "this_week_km": round(weekly.get(keys[0], {}).get("km", 0.0), 2),
+        f"avg_km_last_{n}_weeks": round(km / n, 2),
+        "best_week": max(({"week": k, **v} for k, v in weekly.items()), key=lambda w: w["km"], default=None),
+    }
+
+
+def member_stats(name: str, today: Optional[date] = None) -> Optional[Dict[str, Any]]:
+    """Ringkasan statistik member (tanpa seri lengkap) + streak berjalan dan volume mingguan relatif hari ini."""
+    rollup = get_member_rollup(name)
+    if rollup is None:
+        return None
+    today = today or date.today()
+    summary = {k: v for k, v in rollup.items() if k not in ("weekly", "monthly", "daily", "streaks")}
+    summary["streaks"] = _current_streaks(rollup.get("streaks") or {}, today)
+    summary["weekly_volume"] = _recent_weeks(rollup.get("weekly") or {}, today)
+    return summary
+
+
+def _period_start(key: str, interval: str) -> date:
+    if interval == "week":
+        y, w = key.split("-W")
+        return date.fromisocalendar(int(y), int(w), 1)
+    y, m = key.split("-")
+    return date(int(y), int(m), 1)
+
+
+def _next_period(d: date, interval: str) -> date:
+    if interval == "week":
+        return d + timedelta(weeks=1)
+    return date(d.year + (d.month == 12), d.month % 12 + 1, 1)
+
+
+def member_timeseries(name: str, interval: str = "week", date_range: Optional[DateRange] = None) -> Optional[Dict[str, Any]]:
+    """Seri km/aktivitas/waktu per minggu (ISO) atau bulan; periode tanpa aktivitas diisi nol."""
+    rollup = get_member_rollup(name)
+    if rollup is None:
+        return None
+    interval = "month" if interval == "month" else "week"
+    series = rollup.get("monthly" if interval == "month" else "weekly") or {}
+    key_fn = _month_key if interval == "month" else _week_key
+    points: List[Dict[str, Any]] = []
+    if series:
+        cur = _period_start(next(iter(series)), interval)
+        last = _period_start(next(reversed(series)), interval)
+        if date_range is not None:
+            cur = max(cur, _period_start(key_fn(date_range.start), interval))
+            last = min(last, date_range.end)
+        while cur <= last:
+            key = key_fn(cur)
+            slot = series.get(key) or {"km": 0.0, "runs": 0, "time_s": 0, "elev_m": 0.0}
+            points.append({
+                "period": key,
+                "start": cur.isoformat(),
+                **slot,
+                "pace": format_pace(slot["time_s"] / slot["km"]) if slot["km"] and slot["time_s"] else None,
+            })
+            cur = _next_period(cur, interval)
+    return {"member": rollup["member"], "interval": interval, "points": points}
+
+
+def rollup_docs(member_docs: List[Dict[str, Any]], df, known: Dict[str, str], hash_fn) -> List[Dict[str, Any]]:
+    """
+    Rollup yang perlu dihitung ulang: member yang hash kontennya beda dari rollup tersimpan
+    (atau belum punya rollup). Return baris untuk state_store.put_rollups.
+    """
+    hashes = {d["member_name"]: f"{hash_fn(d['text'])}:r{ROLLUP_VERSION}" for d in member_docs}
+    changed = {name for name, h in hashes.items() if known.get(name.lower()) != h}
+    if not changed:
+        return []
+    rollups = build_member_rollups(df, changed)
+    logger.info(f"Rollup statistik dihitung ulang untuk {len(rollups)} member.")
+    return [{**r, "content_hash": hashes[r["member_name"]]} for r in rollups]
+
+
+# ==================================================
+# AGREGAT KLUB (member x periode, dari seri harian rollup)
+# ==================================================
+CLUB_METRICS = ("km", "runs", "time_s", "elev_m")
+# ranking pace hanya untuk member dengan volume cukup di periode itu
+PACE_RANK_MIN_KM = 5.0
+
+
+def _load_club_table(rollups: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Seri harian semua member -> array datar terurut tanggal (ordinal). Agregat rentang mana pun
+    = potong lewat searchsorted + np.bincount per member, O(hari-aktif di rentang).
+    None kalau ada rollup versi lama tanpa seri harian (belum /strava/refresh).
+    """
+    members: List[str] = []
+    rows: List[Tuple[int, int, float, float, float, float]] = []
+    for r in rollups:
+        daily = (r.get("stats") or {}).get("daily")
+        if daily is None:
+            return None
+        idx = len(members)
+        members.append(r["stats"].get("member") or r["member_name"])
+        for day, slot in daily.items():
+            rows.append((date.fromisoformat(day).toordinal(), idx, slot["km"], slot["runs"], slot["time_s"], slot.get("elev_m", 0.0)))
+    rows.sort()
+    arr = np.asarray(rows, dtype=np.float64).reshape(-1, 6)
+    table: Dict[str, Any] = {"members": members, "day": arr[:, 0].astype(np.int64), "member": arr[:, 1].astype(np.int64)}
+    for i, metric in enumerate(CLUB_METRICS, start=2):
+        table[metric] = np.ascontiguousarray(arr[:, i])
+    return table
+
+
+def club_table() -> Optional[Dict[str, Any]]:
+    """Tabel agregat klub aktif, di-cache per klub sampai rollup berubah (sync di worker mana pun)."""
+    from app.core.tenant import tenant_state
+    from app.services.chroma.manager import get_data_version
+
+    store, collection = _store_and_collection()
+    sig = (collection, store.rollup_signature(collection), get_data_version())
+    slot = tenant_state().setdefault("club_table", {"sig": None, "table": None})
+    if slot["sig"] != sig:
+        table = _load_club_table(store.rollups(collection)) if sig[1][0] else None
+        slot["sig"], slot["table"] = sig, table
+    return slot["table"]
+
+
+def _agg_row(member: str, km: float, runs: float, time_s: float, elev_m: float) -> Dict[str, Any]:
+    return {
+        "member": member,
+        "km": round(float(km), 2),
+        "runs": int(runs),
+        "time_s": int(time_s),
+        "elev_m": round(float(elev_m), 1),
+        "pace": format_pace(time_s / km) if km and time_s else None,
+        "pace_s": round(time_s / km) if km and time_s else None,
+    }
+
+
+def club_aggregate(date_range: Optional[DateRange] = None, rank_by: str = "km", top_n: Optional[int] = None,
+                   member: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Agregat klub di rentang `date_range` (None = all-time) dari rollup, tanpa scan koleksi:
+    total (sum) + rata-rata per member aktif, ranking member per `rank_by` (km | runs | time_s | elev_m | pace;
+    pace = tercepat dulu, minimal PACE_RANK_MIN_KM), dan baris `member` kalau diminta.
+    None -> rollup belum tersedia (pemanggil fallback ke jalur lama).
+    """
+    table = club_table()
+    if table is None:
+        return None
+    days, members = table["day"], table["members"]
+    lo, hi = 0, len(days)
+    if date_range is not None:
+        lo = int(np.searchsorted(days, date_range.start.toordinal(), side="left"))
+        hi = int(np.searchsorted(days, date_range.end.toordinal(), side="right"))
+    idx = table["member"][lo:hi]
+    sums = {m: np.bincount(idx, weights=table[m][lo:hi], minlength=len(members)) for m in CLUB_METRICS}
+    rows = [_agg_row(members[i], *(sums[m][i] for m in CLUB_METRICS)) for i in np.nonzero(sums["runs"])[0]]
+
+    if rank_by == "pace":
+        ranking = sorted((r for r in rows if r["pace_s"] and r["km"] >= PACE_RANK_MIN_KM), key=lambda r: (r["pace_s"], -r["km"]))
+    else:
+        ranking = sorted(rows, key=lambda r: (-r.get(rank_by, r["km"]), r["member"]))
+    totals = _agg_row("club", *(float(sums[m].sum()) for m in CLUB_METRICS))
+    active = len(rows)
+    averages = {
+        "km_per_member": round(totals["km"] / active, 2) if active else 0.0,
+        "runs_per_member": round(totals["runs"] / active, 2) if active else 0.0,
+        "elev_m_per_member": round(totals["elev_m"] / active, 1) if active else 0.0,
+        "km_per_run": round(totals["km"] / totals["runs"], 2) if totals["runs"] else 0.0,
+    }
+    found = None
+    if member:
+        key = member.strip().lower()
+        exact = [r for r in rows if r["member"].lower() == key]
+        partial = [r for r in rows if key in r["member"].lower()]
+        found = exact[0] if exact else (partial[0] if len(partial) == 1 else None)
+        if found is None and any(key == m.lower() or key in m.lower() for m in members):
+            # member ada tapi tidak aktif di periode ini
+            name = next(m for m in members if key == m.lower() or key in m.lower())
+            found = _agg_row(name, 0, 0, 0, 0)
+    return {
+        "period": date_range.as_dict() if date_range else None,
+        "members_total": len(members),
+        "members_active": active,
+        "totals": totals,
+        "averages": averages,
+        "rank_by": rank_by,
+        "ranking": ranking[:top_n] if top_n else ranking,
+        "member": found,
+    }
@@ -1,61 +1,55 @@
 from typing import Dict, Any, List, Optional
 from datetime import date
 import re
-from app.services.chroma.db_client import get_collection
+from app.core.logger import logger
+from app.services.chroma.manager import iter_documents
+from app.services.rag.date_range import DateRange, pushdown_where, scope_range
+from app.services.rag.member_stats import club_aggregate
 
+_ACTIVITY_RX = re.compile(r"(20\d{2})-(\d{2})-(\d{2}).*?sejauh\s+([0-9]+(?:[.,][0-9]+)?)\s*km", re.IGNORECASE)
 
-def compute_leaderboard(scope: str = "all", year: Optional[int] = None, month: Optional[int] = None, week: Optional[int] = None) -> List[Dict[str, Any]]:
+
+def _board_from_rollups(rng: Optional[DateRange]) -> Optional[List[Dict[str, Any]]]:
+    """Leaderboard dari rollup member x hari (tanpa scan koleksi); None -> rollup belum ada, pakai scan."""
+    try:
+        agg = club_aggregate(rng)
+    except Exception as e:
+        logger.warning(f"Agregat rollup gagal, fallback scan koleksi: {e}")
+        return None
+    if agg is None:
+        return None
+    return [{"member": r["member"], "total_km": r["km"], "activities": r["runs"]} for r in agg["ranking"]]
+
+
+def compute_leaderboard(scope: str = "all", year: Optional[int] = None, month: Optional[int] = None, week: Optional[int] = None,
+                        date_range: Optional[DateRange] = None) -> List[Dict[str, Any]]:
     """
-    Hitung total km per member dari seluruh koleksi dokumen (per-member text).
-    scope: "all" | "year" | "month" | "week" (ISO week)
+    Hitung total km per member: dari rollup member x hari kalau tersedia, selain itu scan
+    seluruh koleksi dokumen (per-member text).
+    scope: "all" | "year" | "month" | "week" (ISO week), atau `date_range` (mis. "3 bulan terakhir")
+    yang menggantikan scope. Dokumen member tanpa aktivitas di rentang dilewati di store (metadata tanggal).
     Return list urut desc: {member, total_km, activities}
     """
-    scope = (scope or "all").lower()
-    today = date.today()
-    y = year or today.year
-    m = month or today.month
-    w = week
-
-    col = get_collection()
-    # ChromaDB: do not include "ids" explicitly; ids are always returned
-    got = col.get(include=["documents", "metadatas"], limit=100000)
-    docs: List[str] = got.get("documents") or []
-    ids: List[str] = got.get("ids") or []
-    metas: List[dict] = got.get("metadatas") or []
+    rng = date_range or scope_range(scope, year, month, week, date.today())
+    board = _board_from_rollups(rng)
+    if board is not None:
+        return board
 
     totals: Dict[str, Dict[str, Any]] = {}
-    rx = re.compile(r"(20\d{2})-(\d{2})-(\d{2}).*?sejauh\s+([0-9]+(?:[.,][0-9]+)?)\s*km", re.IGNORECASE)
-
-    for i, text in enumerate(docs):
+    # scan per halaman (SCAN_PAGE_SIZE) supaya memori tidak tumbuh dengan ukuran koleksi
+    for doc_id, text, md in iter_documents("documents", where=pushdown_where(rng)):
         if not text:
             continue
-        member = None
-        md = metas[i] if i < len(metas) else {}
-        if isinstance(md, dict) and md.get("member_name"):
-            member = str(md["member_name"]).strip()
-        if not member:
-            member = ids[i] if i < len(ids) else f"member-{i}"
+        member = str(md.get("member_name") or "").strip() or doc_id
 
-        for match in rx.finditer(text):
+        for match in _ACTIVITY_RX.finditer(text):
             yy, mm, dd, km = match.groups()
             try:
                 dt = date(int(yy), int(mm), int(dd))
                 val = float(km.replace(",", "."))
             except Exception:
                 continue
-
-            ok = False
-            if scope == "all":
-                ok = True
-            elif scope == "year":
-                ok = (dt.year == y)
-            elif scope == "month":
-                ok = (dt.year == y and dt.month == m)
-            elif scope == "week":
-                iso = dt.isocalendar()
-                ok = (iso[0] == y and (w or iso[1]) == iso[1])
-
-            if not ok:
+            if rng is not None and not rng.contains(dt):
                 continue
 
             if member not in totals:
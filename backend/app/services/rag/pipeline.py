@@ -1,71 +1,409 @@
-from typing import Dict, Any, Optional, Set, List
+from typing import Callable, Dict, Any, Optional, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+from app.core.config import settings
+from app.core.admission import current_shed_reason, mark_shed
+from app.core.executors import run_io
+from app.core.singleflight import normalize_query_key, single_flight
 from app.core.logger import logger
+from app.core.timing import stage
 from app.core.utils import timer
-from app.services.rag.retriever import retrieve_context
-from app.services.rag.answerer import answer_with_llm, _detect_month, _detect_year, _detect_member_from_query_or_ctx
-from app.services.chroma.db_client import get_collection
+from app.services.rag.retriever import (
+    retrieve_contexts_batch,
+    retrieve_contexts_batch_async,
+    _collect_member_names,
+    _detect_member_in_query,
+    _normalize_query,
+    _prepare_query,
+    _prepare_query_async,
+    _search_context,
+)
+from app.services.rag.answerer import (
+    answer_with_llm,
+    answer_with_llm_async,
+    answer_club_aggregate,
+    answer_member_stats,
+    _detect_aggregate,
+    _detect_intent,
+    _detect_stats_kind,
+    _detect_month,
+    _detect_year,
+    _detect_member_from_query_or_ctx,
+    _detect_threshold_km,
+    _member_mentions,
+)
+from app.services.rag.date_range import DateRange, resolve_date_range
+from app.services.rag.semantic_cache import get_semantic_cache, make_cache_key
+from app.services.chroma.manager import get_data_version
 from app.core.memory import get_session, update_session
 
 
+def _override_member_from_query(query: str, eff_member: Optional[str]) -> Optional[str]:
+    """
+    Kalau query jelas menyebut member lain, pakai member itu untuk giliran ini.
+    Dua member atau lebih -> lepas filter member (biasanya perbandingan).
+    """
+    try:
+        names = _collect_member_names()
+        qlow = (query or "").lower()
+        detected_list: List[str] = [n for n in names if n and n.lower() in qlow]
+        if len(detected_list) >= 2:
+            return None
+        if len(detected_list) == 1:
+            detected = detected_list[0]
+            if not eff_member or detected.lower() != str(eff_member).lower():
+                return detected
+    except Exception:
+        pass
+    return eff_member
+
+
+def _backfill_filters(query: str, member: str, month: int, year: int, session_id: str) -> Tuple[Optional[str], Optional[int], Optional[int]]:
+    # memory backfill
+    sess = get_session(session_id)
+    eff_member = member or sess.get("member")
+    eff_month = month or sess.get("month")
+    eff_year = year or sess.get("year")
+
+    # If query clearly mentions another member, override memory for this turn
+    eff_member = _override_member_from_query(query, eff_member)
+    return eff_member, eff_month, eff_year
+
+
+def _finalize(query: str, ctx: List[str], answer: str, provider: str, eff_member, eff_month, eff_year, date_range: Optional[DateRange] = None) -> Dict[str, Any]:
+    """Susun response + filter hasil deteksi (memori sesi di-update terpisah lewat _remember)."""
+    detected_member, detected_month, detected_year = eff_member, eff_month, eff_year
+    try:
+        target = _detect_member_from_query_or_ctx(query, ctx)
+        detected_member = target[0] if target else eff_member
+        detected_month = _detect_month(query) or eff_month
+        detected_year = _detect_year(query) or eff_year
+    except Exception:
+        pass
+    return {
+        "status": "ok",
+        "query": query,
+        # kembalikan filter yang sudah terselesaikan (post-detection)
+        "filters": {
+            "member": detected_member,
+            "month": detected_month,
+            "year": detected_year,
+            "period": date_range.as_dict() if date_range else None,
+        },
+        "provider": provider,
+        "contexts": ctx,
+        "answer": answer,
+    }
+
+
+def _remember(session_id: str, query: str, result: Dict[str, Any]) -> None:
+    """Update memori sesi dari filter hasil (per request, juga untuk hasil cache / coalescing)."""
+    try:
+        f = result.get("filters") or {}
+        update_session(session_id, member=f.get("member"), month=f.get("month"), year=f.get("year"), last_query=query)
+    except Exception:
+        pass
+
+
+def _search_or_empty(q_embs: list, top_k: int, target_member: Optional[str], date_range: Optional[DateRange] = None) -> List[str]:
+    if not q_embs:
+        return []
+    try:
+        return _search_context(q_embs, top_k, target_member, date_range)
+    except Exception as e:
+        logger.exception(f"retrieve_context error: {e}")
+        return []
+
+
+def _stats_shortcut(query: str, eff_member: Optional[str]) -> Optional[Tuple[str, str, str]]:
+    """
+    Pertanyaan statistik personal (PB, terjauh, pace rata-rata, streak, volume mingguan) dijawab
+    langsung dari rollup member (lookup O(1)) tanpa embedding, vector search, maupun LLM.
+    Return (answer, provider, member) atau None -> jalur RAG biasa.
+    """
+    if not _detect_stats_kind(query):
+        return None
+    try:
+        in_query = _detect_member_in_query(_normalize_query(query), _collect_member_names())
+        member = in_query or eff_member
+        out = answer_member_stats(query, member, explicit=bool(in_query))
+        return (out[0], out[1], member) if out else None
+    except Exception as e:
+        logger.exception(f"stats shortcut error: {e}")
+        return None
+
+
+def _analytics_shortcut(query: str, eff_member: Optional[str], date_range: Optional[DateRange]) -> Optional[Tuple[str, str, Optional[str]]]:
+    """
+    Pertanyaan agregat (total/rata-rata/top-N/siapa paling ... per periode, klub atau satu member)
+    dijawab exact dari rollup member x hari tanpa embedding, vector search, maupun LLM.
+    Return (answer, provider, member) atau None -> jalur RAG biasa.
+    """
+    plan = _detect_aggregate(query)
+    if plan is None:
+        return None
+    try:
+        member = _detect_member_in_query(_normalize_query(query), _collect_member_names()) or eff_member
+        out = answer_club_aggregate(query, member, date_range, names=_collect_member_names())
+        # jawaban level klub tidak mengikat member ke sesi
+        return (out[0], out[1], None if plan["club"] else member) if out else None
+    except Exception as e:
+        logger.exception(f"analytics shortcut error: {e}")
+        return None
+
+
+def _members_in_query(query: str) -> Tuple[str, ...]:
+    """
+    Semua member yang namanya (atau salah satu bagian nama >= 3 huruf) disebut di query.
+    Lebih longgar dari deteksi target (satu member): dipakai key cache supaya
+    "bandingkan Yoga dan Budi" dan "bandingkan Yoga dan Andi" tidak berbagi jawaban.
+    """
+    return tuple(sorted(_member_mentions(_normalize_query(query), _collect_member_names())))
+
+
+def _semantic_cache_key(query: str, target_member: Optional[str], eff_member, eff_month, eff_year, date_range: Optional[DateRange] = None) -> Tuple:
+    intent = _detect_intent(query)
+    agg = _detect_aggregate(query)
+    return make_cache_key(
+        target_member or eff_member,
+        _detect_month(query) or eff_month,
+        _detect_year(query) or eff_year,
+        intent,
+        _detect_threshold_km(query) if intent == "threshold" else None,
+        get_data_version(),
+        # "minggu lalu" vs "3 bulan terakhir": bulan/tahun sama (None), rentang beda
+        period=(date_range.start, date_range.end) if date_range else None,
+        members=_members_in_query(query),
+        top_n=agg["n"] if agg and agg["op"] == "top" else None,
+    )
+
+
+def _cache_lookup(query: str, q_embs: list, target_member, eff_member, eff_month, eff_year, date_range: Optional[DateRange] = None) -> Tuple[Optional[Dict[str, Any]], Optional[Tuple]]:
+    """Return (hasil cache atau None, key untuk disimpan nanti)."""
+    cache = get_semantic_cache()
+    if cache is None or not q_embs:
+        return None, None
+    key = _semantic_cache_key(query, target_member, eff_member, eff_month, eff_year, date_range)
+    hit = cache.lookup(q_embs[0], key)
+    if hit is None:
+        return None, key
+    hit["query"] = query
+    hit["cache"] = "semantic"
+    logger.info(f"semantic cache hit (similarity={hit.get('cache_similarity')})")
+    return hit, key
+
+
+def _cache_store(q_embs: list, key: Optional[Tuple], result: Dict[str, Any]) -> None:
+    cache = get_semantic_cache()
+    if cache is None or key is None or not q_embs or not result.get("contexts"):
+        return
+    cache.store(q_embs[0], key, result)
+
+
 @timer
 def rag_answer(query: str, top_k: int = 5, member: str = None, month: int = None, year: int = None, session_id: str = None) -> Dict[str, Any]:
     """
     Pipeline lengkap:
+    - pertanyaan statistik personal (PB, streak, ...) -> langsung dari rollup member
+    - resolve periode (query relatif "minggu lalu" / bulan-tahun) -> filter tanggal di retrieval & jawaban
     - retrieve konteks dari Chroma
+    - cek semantic cache (pertanyaan mirip + member/bulan/tahun sama -> jawaban lama)
     - jawab pakai LLM (opsional), fallback kalau tidak ada API key
     """
     try:
-        # memory backfill
-        sess = get_session(session_id)
-        eff_member = member or sess.get("member")
-        eff_month = month or sess.get("month")
-        eff_year = year or sess.get("year")
-
-        # If query clearly mentions another member, override memory for this turn
-        try:
-            # Collect known member names from collection
-            names: Set[str] = set()
-            col = get_collection()
-            # ChromaDB: do not include "ids" explicitly; ids are always returned
-            meta = col.get(where={}, include=["metadatas"], limit=10000)
-            for md in (meta.get("metadatas") or []):
-                if isinstance(md, dict) and md.get("member_name"):
-                    names.add(str(md["member_name"]))
-            for _id in (meta.get("ids") or []):
-                if _id:
-                    names.add(str(_id))
-            qlow = (query or "").lower()
-            detected_list: List[str] = [n for n in names if n and n.lower() in qlow]
-            if len(detected_list) >= 2:
-                eff_member = None
-            elif len(detected_list) == 1:
-                detected = detected_list[0]
-                if not eff_member or detected.lower() != str(eff_member).lower():
-                    eff_member = detected
-        except Exception:
-            pass
-
-        ctx = retrieve_context(query, top_k=top_k, member=eff_member)
-        answer, provider = answer_with_llm(query, ctx)
-
-        # update memory from result
-        try:
-            target = _detect_member_from_query_or_ctx(query, ctx)
-            detected_member = target[0] if target else eff_member
-            detected_month = _detect_month(query) or eff_month
-            detected_year = _detect_year(query) or eff_year
-            update_session(session_id, member=detected_member, month=detected_month, year=detected_year, last_query=query)
-        except Exception:
-            pass
-        return {
-            "status": "ok",
-            "query": query,
-            # kembalikan filter yang sudah terselesaikan (post-detection)
-            "filters": {"member": detected_member if 'detected_member' in locals() else eff_member, "month": detected_month if 'detected_month' in locals() else eff_month, "year": detected_year if 'detected_year' in locals() else eff_year},
-            "provider": provider,
-            "contexts": ctx,
-            "answer": answer,
-        }
+        eff_member, eff_month, eff_year = _backfill_filters(query, member, month, year, session_id)
+        stats = _stats_shortcut(query, eff_member)
+        if stats is not None:
+            result = _finalize(query, [], stats[0], stats[1], stats[2], eff_month, eff_year)
+            _remember(session_id, query, result)
+            return result
+        date_range = resolve_date_range(query, eff_month, eff_year)
+        agg = _analytics_shortcut(query, eff_member, date_range)
+        if agg is not None:
+            result = _finalize(query, [], agg[0], agg[1], agg[2], eff_month, eff_year, date_range)
+            _remember(session_id, query, result)
+            return result
+        q, target_member, q_embs = _prepare_query(query, eff_member)
+        hit, key = _cache_lookup(query, q_embs, target_member, eff_member, eff_month, eff_year, date_range)
+        if hit is not None:
+            _remember(session_id, query, hit)
+            return hit
+        ctx = _search_or_empty(q_embs, top_k, target_member, date_range)
+        answer, provider = answer_with_llm(query, ctx, date_range=date_range)
+        result = _finalize(query, ctx, answer, provider, eff_member, eff_month, eff_year, date_range)
+        _remember(session_id, query, result)
+        _cache_store(q_embs, key, result)
+        return result
+    except Exception as e:
+        logger.exception(f"rag_answer error: {e}")
+        return {"status": "error", "query": query, "message": str(e)}
+
+
+@timer
+async def rag_answer_async(query: str, top_k: int = 5, member: str = None, month: int = None, year: int = None, session_id: str = None,
+                           admit: Optional[Callable[[], Optional[str]]] = None) -> Dict[str, Any]:
+    """
+    Versi async rag_answer (dipakai router; CPU/IO/LLM di jalur masing-masing).
+    `admit`: admission control, dipanggil hanya kalau jawaban butuh LLM; shed -> jawaban deterministik.
+    """
+    try:
+        mark_shed(None)
+        with stage("memory"):
+            eff_member, eff_month, eff_year = await run_io(_backfill_filters, query, member, month, year, session_id)
+        # pertanyaan identik (setelah backfill filter) yang sedang diproses request lain -> tunggu hasilnya
+        # (follower tidak memotong token: hanya leader yang memanggil LLM)
+        key = (normalize_query_key(query), top_k, eff_member, eff_month, eff_year, get_data_version())
+        result = await single_flight.do(
+            "answer", key, lambda: _answer_shared(query, top_k, eff_member, eff_month, eff_year, admit)
+        )
+        result["query"] = query
+        _remember(session_id, query, result)
+        return result
     except Exception as e:
         logger.exception(f"rag_answer error: {e}")
         return {"status": "error", "query": query, "message": str(e)}
+
+
+async def _answer_shared(query: str, top_k: int, eff_member, eff_month, eff_year, admit: Optional[Callable[[], Optional[str]]]) -> Dict[str, Any]:
+    """Bagian rag_answer_async yang tidak bergantung sesi (bisa dibagi ke request identik)."""
+    with stage("stats"):
+        stats = await run_io(_stats_shortcut, query, eff_member)
+    if stats is not None:
+        return _finalize(query, [], stats[0], stats[1], stats[2], eff_month, eff_year)
+    date_range = resolve_date_range(query, eff_month, eff_year)
+    with stage("analytics"):
+        agg = await run_io(_analytics_shortcut, query, eff_member, date_range)
+    if agg is not None:
+        return _finalize(query, [], agg[0], agg[1], agg[2], eff_month, eff_year, date_range)
+    q, target_member, q_embs = await _prepare_query_async(query, eff_member)
+    with stage("cache"):
+        hit, key = _cache_lookup(query, q_embs, target_member, eff_member, eff_month, eff_year, date_range)
+    if hit is not None:
+        return hit
+    with stage("search"):
+        ctx = await run_io(_search_or_empty, q_embs, top_k, target_member, date_range)
+    answer, provider = await answer_with_llm_async(query, ctx, date_range=date_range, admit=admit)
+    result = _finalize(query, ctx, answer, provider, eff_member, eff_month, eff_year, date_range)
+    shed = current_shed_reason()
+    if shed:
+        # jawaban darurat tidak disimpan ke cache supaya request berikutnya dapat jawaban LLM
+        result["admission"] = {"shed": True, "reason": shed}
+        return result
+    _cache_store(q_embs, key, result)
+    return result
+
+
+# ==================================================
+# BATCH
+# ==================================================
+def _prepare_batch(items: List[Dict[str, Any]], session_id: str) -> Tuple[List[str], List[Optional[str]], List[int], List[Dict[str, Any]], List[Optional[DateRange]]]:
+    sess = get_session(session_id)
+    queries: List[str] = []
+    members: List[Optional[str]] = []
+    top_ks: List[int] = []
+    filters: List[Dict[str, Any]] = []
+    ranges: List[Optional[DateRange]] = []
+    for item in items:
+        query = item.get("query") or ""
+        eff_member = _override_member_from_query(query, item.get("member") or sess.get("member"))
+        eff_month = item.get("month") or sess.get("month")
+        eff_year = item.get("year") or sess.get("year")
+        queries.append(query)
+        members.append(eff_member)
+        top_ks.append(int(item.get("top_k") or 5))
+        rng = resolve_date_range(query, eff_month, eff_year)
+        ranges.append(rng)
+        filters.append({"member": eff_member, "month": eff_month, "year": eff_year, "period": rng.as_dict() if rng else None})
+    return queries, members, top_ks, filters, ranges
+
+
+def _batch_results(queries: List[str], contexts: List[List[str]], filters: List[Dict[str, Any]], answers: Optional[List[Optional[tuple]]],
+                   sheds: Optional[List[Optional[str]]] = None) -> List[Dict[str, Any]]:
+    results: List[Dict[str, Any]] = []
+    for i, query in enumerate(queries):
+        out: Dict[str, Any] = {
+            "status": "ok" if contexts[i] else "not_found",
+            "query": query,
+            "filters": filters[i],
+            "contexts": contexts[i],
+        }
+        if answers is not None:
+            if answers[i] is None:
+                out.update({"status": "error", "message": "Gagal menyusun jawaban."})
+            else:
+                target = _detect_member_from_query_or_ctx(query, contexts[i])
+                out["filters"] = {
+                    "member": target[0] if target else filters[i]["member"],
+                    "month": _detect_month(query) or filters[i]["month"],
+                    "year": _detect_year(query) or filters[i]["year"],
+                    "period": filters[i]["period"],
+                }
+                out["answer"], out["provider"] = answers[i]
+                out["status"] = "ok"
+                if sheds and sheds[i]:
+                    out["admission"] = {"shed": True, "reason": sheds[i]}
+        results.append(out)
+    return results
+
+
+def _batch_concurrency(n: int) -> int:
+    workers = max(1, int(getattr(settings, "LLM_BATCH_CONCURRENCY", 4) or 1))
+    return max(1, min(workers, n))
+
+
+@timer
+def rag_answer_batch(items: List[Dict[str, Any]], with_answer: bool = False, session_id: str = None) -> List[Dict[str, Any]]:
+    """
+    Pipeline batch untuk banyak pertanyaan sekaligus (job analitik, bot rekap mingguan):
+    - retrieval batch (satu encode + satu multi-query search)
+    - answerer per item; panggilan LLM jalan paralel dibatasi LLM_BATCH_CONCURRENCY
+    Memori sesi hanya dibaca (backfill), tidak diupdate per item.
+    """
+    queries, members, top_ks, filters, ranges = _prepare_batch(items, session_id)
+    contexts = retrieve_contexts_batch(queries, members=members, top_ks=top_ks, ranges=ranges)
+
+    answers: Optional[List[Optional[tuple]]] = None
+    if with_answer:
+        def _answer(i: int):
+            try:
+                return answer_with_llm(queries[i], contexts[i], date_range=ranges[i])
+            except Exception as e:
+                logger.exception(f"rag_answer_batch item {i} error: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=_batch_concurrency(len(items))) as pool:
+            answers = list(pool.map(_answer, range(len(items))))
+
+    return _batch_results(queries, contexts, filters, answers)
+
+
+@timer
+async def rag_answer_batch_async(items: List[Dict[str, Any]], with_answer: bool = False, session_id: str = None,
+                                 admit: Optional[Callable[[], Optional[str]]] = None) -> List[Dict[str, Any]]:
+    """
+    Versi async rag_answer_batch; LLM fan-out lewat asyncio dengan batas LLM_BATCH_CONCURRENCY.
+    `admit` dipanggil per item yang butuh LLM: item di atas jatah dijawab deterministik.
+    """
+    queries, members, top_ks, filters, ranges = await run_io(_prepare_batch, items, session_id)
+    contexts = await retrieve_contexts_batch_async(queries, members=members, top_ks=top_ks, ranges=ranges)
+
+    answers: Optional[List[Optional[tuple]]] = None
+    sheds: List[Optional[str]] = [None] * len(items)
+    if with_answer:
+        sem = asyncio.Semaphore(_batch_concurrency(len(items)))
+
+        async def _answer(i: int):
+            async with sem:
+                try:
+                    # tiap item task sendiri (gather) -> shed reason tidak bocor antar item
+                    mark_shed(None)
+                    out = await answer_with_llm_async(queries[i], contexts[i], date_range=ranges[i], admit=admit)
+                    sheds[i] = current_shed_reason()
+                    return out
+                except Exception as e:
+                    logger.exception(f"rag_answer_batch item {i} error: {e}")
+                    return None
+
+        answers = list(await asyncio.gather(*(_answer(i) for i in range(len(items)))))
+
+    return _batch_results(queries, contexts, filters, answers, sheds)
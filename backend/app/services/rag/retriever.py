@@ -1,8 +1,14 @@
-from typing import List, Optional, Set
+from typing import Dict, List, Optional, Set, Tuple
+from app.core.executors import run_cpu, run_io
 from app.core.logger import logger
+from app.core.tenant import tenant_state
+from app.core.timing import stage
 from app.core.utils import clean_text
 from app.services.chroma.db_client import get_collection
 from app.services.chroma.embeddings import embed_texts
+from app.services.chroma.manager import get_data_version, iter_documents
+from app.services.chroma.numpy_index import get_index
+from app.services.rag.date_range import DateRange, pushdown_where, resolve_date_range
 import re
 
 
@@ -34,17 +40,27 @@ def _normalize_query(q: str) -> str:
 
 
 def _collect_member_names() -> Set[str]:
+    """Nama member dari koleksi klub aktif; di-cache (per klub) sampai versi data berubah."""
+    cache = tenant_state().setdefault("member_names", {"version": None, "names": set()})
+    version = get_data_version()
+    if cache["version"] == version and cache["names"]:
+        return set(cache["names"])
+    names = _scan_member_names()
+    if names:
+        cache["version"] = version
+        cache["names"] = set(names)
+    return names
+
+
+def _scan_member_names() -> Set[str]:
     try:
-        collection = get_collection()
-        # ChromaDB: do not include "ids" explicitly; ids are always returned
-        data = collection.get(where={}, include=["metadatas"], limit=10000)
         names: Set[str] = set()
-        # from metadatas
-        for md in (data.get("metadatas") or []):
-            if isinstance(md, dict) and md.get("member_name"):
+        # proyeksi metadata saja, per halaman (ids selalu ikut)
+        for _id, _, md in iter_documents("metadatas"):
+            # from metadatas
+            if md.get("member_name"):
                 names.add(str(md["member_name"]))
-        # also consider ids (doc_id == member_name in our index)
-        for _id in (data.get("ids") or []):
+            # also consider ids (doc_id == member_name in our index)
             if _id:
                 names.add(str(_id))
         return names
@@ -76,91 +92,280 @@ def _detect_member_in_query(query: str, member_names: Set[str]) -> Optional[str]
     return best if best_score > 0 else None
 
 
+def _vector_query(collection, q_embs: list, n_results: int, where: Optional[dict] = None) -> dict:
+    """Query vektor lewat index NumPy kalau aktif, selain itu lewat Chroma."""
+    index = get_index()
+    if index is not None:
+        return index.query(q_embs, n_results=n_results, where=where)
+    return collection.query(
+        query_embeddings=q_embs,
+        n_results=n_results,
+        **({"where": where} if where else {}),
+    )
+
+
+def _get_by_ids(collection, ids: List[str]) -> dict:
+    index = get_index()
+    if index is not None:
+        return index.get(ids=ids)
+    return collection.get(ids=ids, include=["documents"], limit=len(ids))
+
+
+def _resolve_target_member(q: str, member: Optional[str], member_names: Set[str]) -> Optional[str]:
+    """Member eksplisit (param) didahulukan, lalu deteksi dari query."""
+    target_member = None
+    if member:
+        mnorm = member.strip().lower()
+        # exact match by available names (ids/metadatas)
+        for name in member_names:
+            if name.lower() == mnorm:
+                target_member = name
+                break
+        if not target_member:
+            target_member = _detect_member_in_query(member, member_names)
+    if not target_member:
+        target_member = _detect_member_in_query(q, member_names)
+    return target_member
+
+
+def _plan_query(query: str, member: Optional[str], member_names: Set[str]) -> Tuple[str, Optional[str], str]:
+    """Normalisasi + deteksi member (CPU). Return: (q, target_member, q_for_embed)."""
+    q = _normalize_query(query)
+    if not q:
+        return ("", None, "")
+    target_member = _resolve_target_member(q, member, member_names)
+    q_for_embed = f"{q} {target_member}" if target_member else q
+    return (q, target_member, q_for_embed)
+
+
+def _search_context(q_embs: list, top_k: int, target_member: Optional[str], date_range: Optional[DateRange] = None) -> List[str]:
+    """
+    Bagian I/O retrieval: buka koleksi, vector search, ambil dokumen member.
+    `date_range` -> hanya dokumen member yang punya aktivitas di rentang itu (filter metadata di store).
+    """
+    collection = get_collection()
+    # kalau koleksi masih kosong, .count() bisa nol
+    try:
+        if collection.count() == 0:
+            logger.warning("Koleksi Chroma kosong.")
+            return []
+    except Exception:
+        # beberapa versi Chroma punya behavior berbeda
+        logger.warning("Tidak bisa membaca jumlah dokumen koleksi.")
+
+    # Name-aware retrieval: if query mentions a member, include ONLY that member's doc to avoid mixing.
+    # Tanpa vector search: dokumen member diambil langsung per id, juga kalau member tidak punya aktivitas
+    # di `date_range` (answerer yang menjawab "belum ada aktivitas di periode itu").
+    if target_member:
+        # First, try to fetch by ID (since our doc_id equals member_name)
+        got = _get_by_ids(collection, [target_member])
+        docs = (got.get("documents") or [])
+        if not docs:
+            # Fallback to a filtered semantic query (in case of collection backend specifics)
+            try:
+                filtered = _vector_query(collection, q_embs, max(1, top_k), {"member_name": {"$eq": target_member}})
+                docs = filtered.get("documents", [[]])
+                docs = docs[0] if docs else []
+            except Exception:
+                docs = []
+        docs = [d for d in docs if d][: max(1, top_k)]
+    else:
+        # Operator-style where (Chroma v1+): overlap rentang tanggal (first_date/last_date)
+        results = _vector_query(collection, q_embs, max(1, top_k), pushdown_where(date_range))
+        docs = results.get("documents", [[]])
+        docs = docs[0] if docs else []
+        docs = [d for d in docs if d]
+
+    logger.info(f"retrieve_context: ditemukan {len(docs)} dokumen.")
+    return docs
+
+
+def _prepare_query(query: str, member: Optional[str] = None) -> Tuple[str, Optional[str], list]:
+    """
+    Tahap awal retrieval: normalisasi, deteksi member, embedding query.
+    Return: (q, target_member, q_embs); q kosong / q_embs kosong = tidak bisa lanjut.
+    """
+    # Detect target member early (explicit param takes precedence)
+    member_names = _collect_member_names()
+    q, target_member, q_for_embed = _plan_query(query, member, member_names)
+    if not q:
+        logger.warning("Query kosong saat retrieve_context.")
+        return ("", None, [])
+
+    q_embs = embed_texts([q_for_embed])
+    if not q_embs:
+        logger.error("Gagal membuat embedding untuk query.")
+    return (q, target_member, q_embs)
+
+
+async def _prepare_query_async(query: str, member: Optional[str] = None) -> Tuple[str, Optional[str], list]:
+    """Versi async _prepare_query (nama member via pool I/O, parsing & embedding via pool CPU)."""
+    with stage("plan"):
+        member_names = await run_io(_collect_member_names)
+        q, target_member, q_for_embed = await run_cpu(_plan_query, query, member, member_names)
+    if not q:
+        logger.warning("Query kosong saat retrieve_context.")
+        return ("", None, [])
+
+    with stage("embed"):
+        q_embs = await run_cpu(embed_texts, [q_for_embed])
+    if not q_embs:
+        logger.error("Gagal membuat embedding untuk query.")
+    return (q, target_member, q_embs)
+
+
 def retrieve_context(query: str, top_k: int = 5, member: Optional[str] = None, month: Optional[int] = None, year: Optional[int] = None) -> List[str]:
     """
     Ambil dokumen paling relevan dari Chroma berdasarkan query.
+    Periode di query ("minggu lalu", "sejak agustus") atau month/year jadi filter rentang tanggal.
     Aman untuk kondisi:
     - collection kosong
     - embedding gagal
     - hasil kosong
     """
     try:
-        q = _normalize_query(query)
-        if not q:
-            logger.warning("Query kosong saat retrieve_context.")
+        q, target_member, q_embs = _prepare_query(query, member)
+        if not q or not q_embs:
             return []
+        return _search_context(q_embs, top_k, target_member, resolve_date_range(query, month, year))
+
+    except Exception as e:
+        logger.exception(f"retrieve_context error: {e}")
+        return []
 
-        # Detect target member early (explicit param takes precedence)
-        member_names = _collect_member_names()
-        target_member = None
-        if member:
-            mnorm = member.strip().lower()
-            # exact match by available names (ids/metadatas)
-            for name in member_names:
-                if name.lower() == mnorm:
-                    target_member = name
-                    break
-            if not target_member:
-                target_member = _detect_member_in_query(member, member_names)
-        if not target_member:
-            target_member = _detect_member_in_query(q, member_names)
-        q_for_embed = f"{q} {target_member}" if target_member else q
 
-        q_embs = embed_texts([q_for_embed])
-        if not q_embs:
-            logger.error("Gagal membuat embedding untuk query.")
+async def retrieve_context_async(query: str, top_k: int = 5, member: Optional[str] = None, month: Optional[int] = None, year: Optional[int] = None) -> List[str]:
+    """
+    Versi async retrieve_context: parsing & embedding di pool CPU,
+    akses koleksi di pool I/O, supaya tidak saling rebutan thread.
+    """
+    try:
+        q, target_member, q_embs = await _prepare_query_async(query, member)
+        if not q or not q_embs:
             return []
+        date_range = resolve_date_range(query, month, year)
+        with stage("search"):
+            return await run_io(_search_context, q_embs, top_k, target_member, date_range)
 
-        collection = get_collection()
-        # kalau koleksi masih kosong, .count() bisa nol
-        try:
-            if collection.count() == 0:
-                logger.warning("Koleksi Chroma kosong.")
-                return []
-        except Exception:
-            # beberapa versi Chroma punya behavior berbeda
-            logger.warning("Tidak bisa membaca jumlah dokumen koleksi.")
-
-        # Build operator-style where (Chroma v1+). Note: per-member index only has member_name metadata.
-        where = None
-        if target_member:
-            where = {"member_name": {"$eq": target_member}}
-
-        results = collection.query(
-            query_embeddings=q_embs,
-            n_results=max(1, top_k),
-            **({"where": where} if where else {}),
-        )
+    except Exception as e:
+        logger.exception(f"retrieve_context error: {e}")
+        return []
+
+
+# ==================================================
+# BATCH RETRIEVAL
+# ==================================================
+def _plan_batch(queries: List[str], members: List[Optional[str]], member_names: Set[str]) -> Tuple[List[int], List[Optional[str]], List[str]]:
+    """Normalisasi + deteksi member untuk seluruh batch (CPU). Return: (active, targets, to_embed)."""
+    targets: List[Optional[str]] = [None] * len(queries)
+    active: List[int] = []
+    to_embed: List[str] = []
+    for i, (query, member) in enumerate(zip(queries, members)):
+        q, target, q_for_embed = _plan_query(query, member, member_names)
+        if not q:
+            continue
+        targets[i] = target
+        active.append(i)
+        to_embed.append(q_for_embed)
+    return active, targets, to_embed
 
-        docs = results.get("documents", [[]])
-        docs = docs[0] if docs else []
-        docs = [d for d in docs if d]
 
-        # Name-aware retrieval: if query mentions a member, include ONLY that member's doc to avoid mixing
-        if target_member:
-            # First, try to fetch by ID (since our doc_id equals member_name)
-            got = collection.get(ids=[target_member], include=["documents"], limit=1)
-            docs2 = (got.get("documents") or [])
-            if not docs2:
-                # Fallback to a filtered semantic query (in case of collection backend specifics)
-                try:
-                    filtered = collection.query(
-                        query_embeddings=q_embs,
-                        n_results=max(1, top_k),
-                        where={"member_name": {"$eq": target_member}},
-                    )
-                    docs2 = filtered.get("documents", [[]])
-                    docs2 = docs2[0] if docs2 else []
-                    docs2 = [d for d in docs2 if d]
-                except Exception:
-                    docs2 = []
-
-            # Use only the member-specific docs to keep context focused
-            docs = [d for d in docs2 if d][: max(1, top_k)]
-
-        logger.info(f"retrieve_context: ditemukan {len(docs)} dokumen.")
-        return docs
+def _search_batch(active: List[int], targets: List[Optional[str]], embs: list, top_ks: List[int], n: int,
+                  ranges: Optional[List[Optional[DateRange]]] = None) -> List[List[str]]:
+    """Bagian I/O retrieval batch: satu get-by-ids + satu multi-query search per rentang tanggal."""
+    results: List[List[str]] = [[] for _ in range(n)]
+    emb_by_item = {i: embs[j] for j, i in enumerate(active)}
+
+    collection = get_collection()
+    try:
+        if collection.count() == 0:
+            logger.warning("Koleksi Chroma kosong.")
+            return results
+    except Exception:
+        logger.warning("Tidak bisa membaca jumlah dokumen koleksi.")
+
+    # Query yang menyebut member: ambil dokumen by id (doc_id == member_name) sekali jalan
+    targeted = [i for i in active if targets[i]]
+    if targeted:
+        wanted = sorted({targets[i] for i in targeted})
+        got = _get_by_ids(collection, wanted)
+        by_id = {doc_id: doc for doc_id, doc in zip(got.get("ids") or [], got.get("documents") or []) if doc}
+        for i in targeted:
+            doc = by_id.get(targets[i])
+            if doc:
+                results[i] = [doc]
+                continue
+            try:
+                filtered = _vector_query(collection, [emb_by_item[i]], max(1, top_ks[i]), {"member_name": {"$eq": targets[i]}})
+                docs = filtered.get("documents", [[]])
+                results[i] = [d for d in (docs[0] if docs else []) if d][: max(1, top_ks[i])]
+            except Exception:
+                results[i] = []
+
+    # Sisanya: satu multi-query search per rentang tanggal (biasanya satu grup), lalu potong per top_k
+    groups: Dict[Optional[tuple], List[int]] = {}
+    for i in active:
+        if not targets[i]:
+            rng = ranges[i] if ranges else None
+            groups.setdefault((rng.start, rng.end) if rng else None, []).append(i)
+    for items in groups.values():
+        n_results = max(1, max(top_ks[i] for i in items))
+        where = pushdown_where(ranges[items[0]]) if ranges else None
+        res = _vector_query(collection, [emb_by_item[i] for i in items], n_results, where)
+        all_docs = res.get("documents") or []
+        for j, i in enumerate(items):
+            docs = all_docs[j] if j < len(all_docs) else []
+            results[i] = [d for d in docs if d][: max(1, top_ks[i])]
+
+    logger.info(f"retrieve_contexts_batch: {n} query diproses.")
+    return results
+
+
+def retrieve_contexts_batch(queries: List[str], top_k: int = 5, members: Optional[List[Optional[str]]] = None, top_ks: Optional[List[int]] = None,
+                            ranges: Optional[List[Optional[DateRange]]] = None) -> List[List[str]]:
+    """
+    Versi batch dari retrieve_context untuk banyak pertanyaan sekaligus:
+    - scan nama member sekali
+    - satu panggilan encode untuk semua query
+    - satu multi-query vector search untuk query tanpa target member (per rentang tanggal `ranges`)
+    - satu get-by-ids untuk query yang menyebut member
+    Return: list konteks, sejajar dengan `queries`.
+    """
+    n = len(queries)
+    members = members or [None] * n
+    top_ks = top_ks or [top_k] * n
+    try:
+        active, targets, to_embed = _plan_batch(queries, members, _collect_member_names())
+        if not active:
+            return [[] for _ in range(n)]
+        embs = embed_texts(to_embed)
+        if not embs or len(embs) != len(active):
+            logger.error("Gagal membuat embedding batch untuk query.")
+            return [[] for _ in range(n)]
+        return _search_batch(active, targets, embs, top_ks, n, ranges)
 
     except Exception as e:
-        logger.exception(f"retrieve_context error: {e}")
-        return []
+        logger.exception(f"retrieve_contexts_batch error: {e}")
+        return [[] for _ in range(n)]
+
+
+async def retrieve_contexts_batch_async(queries: List[str], top_k: int = 5, members: Optional[List[Optional[str]]] = None, top_ks: Optional[List[int]] = None,
+                                        ranges: Optional[List[Optional[DateRange]]] = None) -> List[List[str]]:
+    """Versi async retrieve_contexts_batch (CPU dan I/O di pool terpisah)."""
+    n = len(queries)
+    members = members or [None] * n
+    top_ks = top_ks or [top_k] * n
+    try:
+        member_names = await run_io(_collect_member_names)
+        active, targets, to_embed = await run_cpu(_plan_batch, queries, members, member_names)
+        if not active:
+            return [[] for _ in range(n)]
+        embs = await run_cpu(embed_texts, to_embed)
+        if not embs or len(embs) != len(active):
+            logger.error("Gagal membuat embedding batch untuk query.")
+            return [[] for _ in range(n)]
+        return await run_io(_search_batch, active, targets, embs, top_ks, n, ranges)
+
+    except Exception as e:
+        logger.exception(f"retrieve_contexts_batch error: {e}")
+        return [[] for _ in range(n)]
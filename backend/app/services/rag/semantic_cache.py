@@ -0,0 +1,133 @@
+from typing import Any, Dict, Hashable, Optional, Tuple
+from collections import OrderedDict
+from app.core.config import settings
+from app.core.tenant import tenant_state
+import numpy as np
+import threading
+import copy
+
+
+# ==================================================
+# SEMANTIC ANSWER CACHE
+# ==================================================
+class SemanticCache:
+    """
+    Cache jawaban berbasis kemiripan embedding query.
+    - hit kalau cosine >= threshold DAN key (member/bulan/tahun/intent, versi data) sama persis
+    - embedding disimpan di matrix float32 prealokasi -> cek cosine satu kali dot product
+    - eviction LRU; entri versi data lama otomatis tidak pernah cocok
+    """
+
+    def __init__(self, max_entries: int, threshold: float):
+        self.max_entries = max(1, int(max_entries))
+        self.threshold = float(threshold)
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None
+        self._keys = np.empty(self.max_entries, dtype=object)
+        self._key_hash = np.zeros(self.max_entries, dtype=np.int64)
+        self._valid = np.zeros(self.max_entries, dtype=bool)
+        self._values: Dict[int, Dict[str, Any]] = {}
+        self._lru: "OrderedDict[int, None]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _ensure_matrix(self, dim: int) -> None:
+        if self._matrix is None or self._matrix.shape[1] != dim:
+            self._matrix = np.zeros((self.max_entries, dim), dtype=np.float32)
+            self._valid[:] = False
+            self._values.clear()
+            self._lru.clear()
+
+    @staticmethod
+    def _normalize(emb) -> np.ndarray:
+        v = np.asarray(emb, dtype=np.float32).ravel()
+        n = float(np.linalg.norm(v))
+        return v / n if n else v
+
+    def lookup(self, emb, key: Hashable) -> Optional[Dict[str, Any]]:
+        v = self._normalize(emb)
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != v.shape[0] or not self._valid.any():
+                self.misses += 1
+                return None
+            # filter key lewat hash (vektor), lalu cek kesamaan key asli di slot terpilih
+            mask = self._valid & (self._key_hash == hash(key))
+            if not mask.any():
+                self.misses += 1
+                return None
+            scores = np.where(mask, self._matrix @ v, -np.inf)
+            slot = int(np.argmax(scores))
+            if scores[slot] < self.threshold or self._keys[slot] != key:
+                self.misses += 1
+                return None
+            self._lru.move_to_end(slot)
+            self.hits += 1
+            value = copy.deepcopy(self._values[slot])
+            value["cache_similarity"] = round(float(scores[slot]), 4)
+            return value
+
+    def store(self, emb, key: Hashable, value: Dict[str, Any]) -> None:
+        v = self._normalize(emb)
+        with self._lock:
+            self._ensure_matrix(v.shape[0])
+            free = np.flatnonzero(~self._valid)
+            if free.size:
+                slot = int(free[0])
+            else:
+                slot, _ = self._lru.popitem(last=False)  # evict LRU
+            self._matrix[slot] = v
+            self._keys[slot] = key
+            self._key_hash[slot] = hash(key)
+            self._valid[slot] = True
+            self._values[slot] = copy.deepcopy(value)
+            self._lru[slot] = None
+            self._lru.move_to_end(slot)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._valid[:] = False
+            self._values.clear()
+            self._lru.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": int(self._valid.sum()),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+_CACHE_LOCK = threading.Lock()
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """Instance per klub (ikut LRU state klub); None kalau SEMANTIC_CACHE_ENABLED=false."""
+    if not settings.SEMANTIC_CACHE_ENABLED:
+        return None
+    state = tenant_state()
+    cache = state.get("semantic_cache")
+    if cache is None:
+        with _CACHE_LOCK:
+            cache = state.get("semantic_cache")
+            if cache is None:
+                cache = SemanticCache(settings.SEMANTIC_CACHE_MAX_ENTRIES, settings.SEMANTIC_CACHE_THRESHOLD)
+                state["semantic_cache"] = cache
+    return cache
+
+
+def make_cache_key(member: Optional[str], month: Optional[int], year: Optional[int], intent: str, threshold_km: Optional[float], version: int,
+                   period: Optional[Tuple] = None, members: Tuple[str, ...] = (), top_n: Optional[int] = None) -> Tuple:
+    """
+    Key yang harus sama persis: member/bulan/tahun/rentang tanggal + intent & ambang km (beda angka = beda jawaban).
+    `members`: semua member yang disebut di query (perbandingan dua nama), `top_n`: N pada "top N".
+    """
+    return ((member or "").strip().lower(), month, year, period, intent, threshold_km, version,
+            tuple(sorted({m.strip().lower() for m in members})), top_n)
+
+
+def semantic_cache_stats(club: Optional[str] = None) -> Dict[str, Any]:
+    cache = tenant_state(club).get("semantic_cache")
+    return cache.stats() if cache is not None else {"enabled": False}
@@ -0,0 +1,112 @@
+from typing import Any, Callable, Dict, List, Tuple
+import time
+from app.core.config import settings
+from app.core.executors import run_cpu, run_io
+from app.core.logger import logger
+from app.core.utils import now_str
+
+
+# ==================================================
+# KOMPONEN WARMUP
+# ==================================================
+def _import_artifact() -> Dict[str, Any]:
+    # sebelum komponen lain: koleksi/index/nama member yang di-warm sudah berasal dari artifact
+    from app.services.chroma.artifact import import_on_startup
+    return import_on_startup()
+
+
+def _warm_embedding_model() -> Dict[str, Any]:
+    # model dimuat lazy; di sini dipaksa + encode pertama membayar alokasi/JIT sekali, bukan di request user
+    from app.services.chroma.embeddings import embed_texts, get_model
+    if get_model() is None:
+        raise RuntimeError("Model embedding gagal dimuat.")
+    embs = embed_texts(["warmup: total lari bulan ini", "siapa paling jauh minggu ini"])
+    if not embs:
+        raise RuntimeError("Warmup encode gagal.")
+    return {"model": settings.EMBEDDING_MODEL, "dim": len(embs[0])}
+
+
+def _warm_collection() -> Dict[str, Any]:
+    from app.services.chroma.db_client import get_collection, get_active_collection_name
+    return {"collection": get_active_collection_name(), "documents": get_collection().count()}
+
+
+def _warm_member_names() -> Dict[str, Any]:
+    from app.services.rag.retriever import _collect_member_names
+    return {"members": len(_collect_member_names())}
+
+
+def _warm_numpy_index() -> Dict[str, Any]:
+    from app.services.chroma.numpy_index import get_index
+    index = get_index()
+    return {"enabled": index is not None, "documents": index.size if index is not None else 0}
+
+
+def _warm_tokenizer() -> Dict[str, Any]:
+    from app.services.rag.context_packer import count_tokens
+    return {"tokens": count_tokens("warmup tokenizer")}
+
+
+# (nama, fungsi, pool, wajib) — komponen wajib yang gagal membuat instance tidak ready
+_COMPONENTS: List[Tuple[str, Callable[[], Dict[str, Any]], str, bool]] = [
+    ("artifact", _import_artifact, "io", False),
+    ("embedding_model", _warm_embedding_model, "cpu", True),
+    ("collection", _warm_collection, "io", True),
+    ("member_names", _warm_member_names, "io", False),
+    ("numpy_index", _warm_numpy_index, "io", False),
+    ("tokenizer", _warm_tokenizer, "cpu", False),
+]
+
+
+def register_warmup(name: str, func: Callable[[], Dict[str, Any]], pool: str = "io", required: bool = False) -> None:
+    """Tambah komponen warmup (mis. cache agregat) — dijalankan berurutan setelah komponen bawaan."""
+    _COMPONENTS.append((name, func, pool, required))
+
+
+# ==================================================
+# STATE + RUNNER
+# ==================================================
+_STATE: Dict[str, Any] = {"ready": False, "state": "pending", "components": {}}
+
+
+def warmup_state() -> Dict[str, Any]:
+    return {**_STATE, "components": dict(_STATE["components"])}
+
+
+def is_ready() -> bool:
+    return bool(_STATE["ready"])
+
+
+async def run_warmup() -> Dict[str, Any]:
+    """
+    Jalankan semua komponen warmup (berurutan; embedding dulu karena komponen lain bergantung padanya).
+    Setiap komponen dicatat status dan durasinya; ready = semua komponen wajib sukses.
+    """
+    if not settings.WARMUP_ENABLED:
+        _STATE.update({"ready": True, "state": "skipped", "finished_at": now_str()})
+        return warmup_state()
+
+    _STATE.update({"ready": False, "state": "running", "started_at": now_str(), "components": {}})
+    total_start = time.perf_counter()
+    failed_required: List[str] = []
+    for name, func, pool, required in list(_COMPONENTS):
+        start = time.perf_counter()
+        try:
+            runner = run_cpu if pool == "cpu" else run_io
+            detail = await runner(func)
+            _STATE["components"][name] = {"status": "ok", "ms": round((time.perf_counter() - start) * 1000, 1), **(detail or {})}
+        except Exception as e:
+            logger.exception(f"Warmup '{name}' gagal: {e}")
+            _STATE["components"][name] = {"status": "error", "ms": round((time.perf_counter() - start) * 1000, 1), "error": str(e)}
+            if required:
+                failed_required.append(name)
+
+    _STATE["total_ms"] = round((time.perf_counter() - total_start) * 1000, 1)
+    _STATE["finished_at"] = now_str()
+    _STATE["ready"] = not failed_required
+    _STATE["state"] = "ready" if not failed_required else "failed"
+    if failed_required:
+        logger.error(f"Warmup gagal untuk komponen wajib: {failed_required}")
+    else:
+        logger.info(f"Warmup selesai dalam {_STATE['total_ms']} ms, instance siap menerima traffic.")
+    return warmup_state()
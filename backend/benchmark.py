@@ -0,0 +1,295 @@
+"""
+Benchmark mikro komponen backend (tanpa server / LLM).
+
+Subcommand:
+- `quantization`: recall@k vs latency index NumPy untuk first-pass none / int8 / binary
+  (+ rerank exact dari float32 memmap) pada embedding sintetis berkelompok, atau
+  embedding koleksi klub yang sudah ada (`--collection`).
+- `importtime`: biaya import entry point (`python -X importtime`, proses baru per run) +
+  cek budget (ms) dan modul berat yang tidak boleh ikut terimpor; exit 1 kalau dilanggar.
+
+Contoh:
+    python benchmark.py quantization --docs 20000 --dim 384 --queries 200 --k 5 --factors 4,8,16
+    python benchmark.py quantization --collection --club default --out quant.json
+    python benchmark.py importtime --repeat 5 --budget-ms 1500
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+import numpy as np
+
+
+# ==================================================
+# DATA EMBEDDING
+# ==================================================
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+
+def synthetic_embeddings(n: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    """Vektor ternormalisasi berkelompok (mirip dokumen member: banyak yang mirip satu sama lain)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, clusters), dim)).astype(np.float32)
+    labels = rng.integers(0, len(centers), size=n)
+    return _normalize(centers[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32))
+
+
+def collection_embeddings(club: str) -> np.ndarray:
+    from app.core.tenant import use_club
+    from app.services.chroma.manager import scan_collection
+
+    with use_club(club):
+        blocks = [np.asarray(page["embeddings"], dtype=np.float32) for page in scan_collection("embeddings") if len(page["ids"])]
+    if not blocks:
+        raise SystemExit(f"Koleksi klub '{club}' kosong.")
+    return _normalize(np.concatenate(blocks))
+
+
+def make_queries(matrix: np.ndarray, n: int, noise: float, seed: int) -> np.ndarray:
+    """Query = dokumen acak + noise (parafrase), jadi jawaban benar tidak selalu dokumen asalnya."""
+    rng = np.random.default_rng(seed + 1)
+    picks = rng.integers(0, len(matrix), size=n)
+    # noise per dimensi / sqrt(dim) -> norma vektor noise ~= `noise`
+    jitter = rng.standard_normal((n, matrix.shape[1])).astype(np.float32) * (noise / np.sqrt(matrix.shape[1]))
+    return _normalize(matrix[picks] + jitter)
+
+
+# ==================================================
+# QUANTIZATION: recall@k vs latency
+# ==================================================
+def _pcts(values: List[float]) -> Dict[str, float]:
+    arr = np.asarray(values, dtype=np.float64)
+    return {"p50": round(float(np.percentile(arr, 50)), 3), "p95": round(float(np.percentile(arr, 95)), 3), "mean": round(float(arr.mean()), 3)}
+
+
+def bench_quantization(matrix: np.ndarray, queries: np.ndarray, k: int, modes: List[str], factors: List[int]) -> List[Dict[str, Any]]:
+    from app.services.chroma.numpy_index import NumpyIndex
+
+    truth = [set(np.argsort(-(matrix @ q))[:k].tolist()) for q in queries]
+    ids = [str(i) for i in range(len(matrix))]
+    empty = [""] * len(ids)
+    metas = [{} for _ in ids]
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_quant_") as tmp:
+        # float32 dari disk (memmap) seperti index tersimpan di NUMPY_INDEX_DIR
+        path = os.path.join(tmp, "embeddings.npy")
+        np.save(path, matrix)
+        mapped = np.load(path, mmap_mode="r")
+        for mode in modes:
+            for factor in (factors if mode != "none" else [1]):
+                start = time.perf_counter()
+                index = NumpyIndex(ids, empty, metas, mapped, quantization=mode, rerank_factor=factor)
+                build_ms = (time.perf_counter() - start) * 1000
+                index.query([queries[0]], n_results=k)  # warm (page cache, BLAS)
+                latencies, recalls = [], []
+                for q, expected in zip(queries, truth):
+                    t0 = time.perf_counter()
+                    got = index.query([q], n_results=k)["ids"][0]
+                    latencies.append((time.perf_counter() - t0) * 1000)
+                    recalls.append(len(expected & {int(i) for i in got}) / max(1, len(expected)))
+                mem = index.memory_bytes()
+                results.append({
+                    "mode": mode,
+                    "rerank_factor": factor if mode != "none" else None,
+                    "recall_at_k": round(float(np.mean(recalls)), 4),
+                    "latency_ms": _pcts(latencies),
+                    "build_ms": round(build_ms, 1),
+                    # mode none: seluruh matrix float32 dipindai tiap query -> praktis harus resident
+                    "resident_mb": round((mem["resident"] or mem["float32"]) / 1e6, 2),
+                    "float32_mb": round(mem["float32"] / 1e6, 2),
+                })
+    return results
+
+
+def _print_quantization(report: Dict[str, Any]) -> None:
+    print(f"docs={report['docs']} dim={report['dim']} queries={report['queries']} k={report['k']}")
+    print(f"{'mode':<8}{'factor':>7}{'recall@k':>10}{'p50 ms':>9}{'p95 ms':>9}{'RAM MB':>9}")
+    for r in report["results"]:
+        factor = "-" if r["rerank_factor"] is None else r["rerank_factor"]
+        print(f"{r['mode']:<8}{factor:>7}{r['recall_at_k']:>10.4f}{r['latency_ms']['p50']:>9.3f}{r['latency_ms']['p95']:>9.3f}{r['resident_mb']:>9.2f}")
+
+
+def run_quantization(args) -> Dict[str, Any]:
+    matrix = collection_embeddings(args.club) if args.collection else synthetic_embeddings(args.docs, args.dim, args.clusters, args.seed)
+    queries = make_queries(matrix, args.queries, args.noise, args.seed)
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    factors = [int(f) for f in args.factors.split(",") if f.strip()]
+    return {
+        "benchmark": "quantization",
+        "docs": int(matrix.shape[0]),
+        "dim": int(matrix.shape[1]),
+        "queries": len(queries),
+        "k": args.k,
+        "results": bench_quantization(matrix, queries, args.k, modes, factors),
+    }
+
+
+# ==================================================
+# IMPORT TIME: biaya import entry point
+# ==================================================
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+IMPORT_TARGETS = {
+    "api": "app.main",
+    "reset_db": "reset_db",
+    "sync": "app.services.gsheet.sync",
+    "config": "app.core.config",
+}
+# diimpor lazy (saat dipakai); ikut terimpor di entry point = regresi
+FORBIDDEN_MODULES = "sentence_transformers,torch,pandas,gspread,oauth2client,chromadb"
+
+
+def _parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """Baris `import time: self | cumulative | modul` -> [{"module", "self_us", "cumulative_us", "depth"}]."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # header kolom
+        name = parts[2].rstrip()
+        rows.append({
+            "module": name.strip(),
+            "self_us": int(parts[0]),
+            "cumulative_us": int(parts[1]),
+            # indentasi 2 spasi per level import bersarang
+            "depth": (len(name) - len(name.lstrip(" "))) // 2,
+        })
+    return rows
+
+
+def measure_import(module: str) -> Dict[str, Any]:
+    """
+    Import `module` di proses Python baru dengan cwd folder kosong sementara:
+    file/folder yang muncul di cwd (logs/, db/, cache/) = efek samping saat import.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in (BACKEND_DIR, os.environ.get("PYTHONPATH", "")) if p))
+    with tempfile.TemporaryDirectory(prefix="bench_import_") as cwd:
+        start = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=cwd, env=env, capture_output=True, text=True,
+        )
+        wall_ms = (time.perf_counter() - start) * 1000
+        created = sorted(os.listdir(cwd))
+    if proc.returncode != 0:
+        raise SystemExit(f"Import {module} gagal:\n{proc.stderr[-2000:]}")
+    rows = _parse_importtime(proc.stderr)
+    total = next((r["cumulative_us"] for r in rows if r["module"] == module and r["depth"] == 0), 0)
+    return {"wall_ms": wall_ms, "import_ms": total / 1000, "rows": rows, "created": created}
+
+
+def bench_importtime(targets: Dict[str, str], repeat: int, budget_ms: float, forbidden: List[str], top: int) -> List[Dict[str, Any]]:
+    results = []
+    for label, module in targets.items():
+        runs = [measure_import(module) for _ in range(max(1, repeat))]
+        # run tercepat = paling sedikit gangguan (page cache, CPU lain); modul sama di semua run
+        best = min(runs, key=lambda r: r["import_ms"])
+        imported = {r["module"] for r in best["rows"]}
+        heavy = sorted(m for m in forbidden if m in imported)
+        import_ms = [r["import_ms"] for r in runs]
+        results.append({
+            "target": label,
+            "module": module,
+            "import_ms": _pcts(import_ms),
+            "best_ms": round(best["import_ms"], 1),
+            "wall_ms": _pcts([r["wall_ms"] for r in runs]),
+            "modules": len(best["rows"]),
+            "slowest": [
+                {"module": r["module"], "cumulative_ms": round(r["cumulative_us"] / 1000, 1)}
+                # modul pihak ketiga langsung di bawah kode app (depth kecil) paling informatif
+                for r in sorted(best["rows"], key=lambda r: -r["cumulative_us"])
+                if r["module"] != module
+            ][:top],
+            "forbidden_imported": heavy,
+            "side_effects": best["created"],
+            "ok": best["import_ms"] <= budget_ms and not heavy and not best["created"],
+        })
+    return results
+
+
+def _print_importtime(report: Dict[str, Any]) -> None:
+    print(f"budget={report['budget_ms']} ms repeat={report['repeat']} python={report['python']}")
+    print(f"{'target':<10}{'best ms':>9}{'p50 ms':>9}{'wall ms':>9}{'modules':>9}  status")
+    for r in report["results"]:
+        status = "OK" if r["ok"] else "FAIL"
+        notes = []
+        if r["forbidden_imported"]:
+            notes.append("berat: " + ",".join(r["forbidden_imported"]))
+        if r["side_effects"]:
+            notes.append("efek samping: " + ",".join(r["side_effects"]))
+        print(f"{r['target']:<10}{r['best_ms']:>9.1f}{r['import_ms']['p50']:>9.1f}{r['wall_ms']['p50']:>9.1f}{r['modules']:>9}  {status} {'; '.join(notes)}")
+        for m in r["slowest"]:
+            print(f"{'':<12}{m['cumulative_ms']:>9.1f}  {m['module']}")
+
+
+def run_importtime(args) -> Dict[str, Any]:
+    names = [t.strip() for t in args.targets.split(",") if t.strip()]
+    # nama pendek dari IMPORT_TARGETS, atau nama modul langsung
+    targets = {name: IMPORT_TARGETS.get(name, name) for name in names}
+    forbidden = [m.strip() for m in args.forbid.split(",") if m.strip()]
+    results = bench_importtime(targets, args.repeat, args.budget_ms, forbidden, args.top)
+    return {
+        "benchmark": "importtime",
+        "python": sys.version.split()[0],
+        "budget_ms": args.budget_ms,
+        "repeat": args.repeat,
+        "forbidden": forbidden,
+        "results": results,
+        "ok": all(r["ok"] for r in results),
+    }
+
+
+# ==================================================
+# CLI
+# ==================================================
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark mikro komponen backend")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    quant = sub.add_parser("quantization", help="Recall@k vs latency index NumPy (none/int8/binary + rerank)")
+    quant.add_argument("--docs", type=int, default=20000, help="Jumlah dokumen sintetis")
+    quant.add_argument("--dim", type=int, default=384, help="Dimensi embedding sintetis")
+    quant.add_argument("--clusters", type=int, default=64, help="Jumlah kelompok vektor sintetis")
+    quant.add_argument("--collection", action="store_true", help="Pakai embedding koleksi klub (bukan sintetis)")
+    quant.add_argument("--club", default="default", help="Klub untuk --collection")
+    quant.add_argument("--queries", type=int, default=200)
+    quant.add_argument("--noise", type=float, default=0.3, help="Norma noise query terhadap dokumen asal (dokumen ternormalisasi)")
+    quant.add_argument("--k", type=int, default=5)
+    quant.add_argument("--modes", default="none,int8,binary")
+    quant.add_argument("--factors", default="4,8,16,32", help="Faktor rerank (kandidat = k x faktor, min 32)")
+    quant.add_argument("--seed", type=int, default=1)
+    quant.add_argument("--out", help="Tulis hasil JSON ke file")
+
+    imp = sub.add_parser("importtime", help="Biaya import entry point (python -X importtime) + budget")
+    imp.add_argument("--targets", default=",".join(IMPORT_TARGETS), help=f"Nama pendek ({', '.join(IMPORT_TARGETS)}) atau nama modul, dipisah koma")
+    imp.add_argument("--repeat", type=int, default=3, help="Jumlah proses baru per target (hasil terbaik dipakai untuk budget)")
+    imp.add_argument("--budget-ms", type=float, default=1500.0, help="Batas waktu import kumulatif per target (ms)")
+    imp.add_argument("--forbid", default=FORBIDDEN_MODULES, help="Modul yang tidak boleh ikut terimpor (koma; kosong = tanpa cek)")
+    imp.add_argument("--top", type=int, default=8, help="Jumlah modul paling lambat yang ditampilkan per target")
+    imp.add_argument("--out", help="Tulis hasil JSON ke file")
+
+    args = parser.parse_args()
+    if args.command == "quantization":
+        report = run_quantization(args)
+        _print_quantization(report)
+    elif args.command == "importtime":
+        report = run_importtime(args)
+        _print_importtime(report)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Hasil ditulis ke {args.out}", file=sys.stderr)
+    if report.get("ok") is False:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
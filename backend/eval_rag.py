@@ -0,0 +1,455 @@
+"""
+Evaluasi kualitas vs latency retrieval + jawaban pada klub sintetis berlabel.
+
+Klub sintetis (synthetic_club.py) di-ingest ke folder sementara (CHROMA_PATH/SYNC_STATE_DB
+terpisah dari data asli). Dari baris yang sama dibangkitkan set pertanyaan berbahasa
+Indonesia, masing-masing dengan label member, periode, dan angka jawaban yang dihitung
+langsung dari data. Tiap konfigurasi (model embedding x backend x kuantisasi x top_k)
+menjalankan semua pertanyaan lewat `retrieve_context` + `answer_with_llm`:
+- member_acc / period_acc: member dan rentang tanggal yang dideteksi dari query
+- recall@k: dokumen member yang diharapkan ada di konteks hasil retrieval
+- numeric_em: angka jawaban (km / jumlah aktivitas) muncul di jawaban, sama pada presisi yang ditulis
+- latency p50/p95 retrieval dan jawaban (ms)
+Delta recall/EM dihitung terhadap konfigurasi baseline (baris pertama sweep, top_k terbesar),
+jadi percepatan (top_k kecil, int8/binary, model lebih kecil) yang mengorbankan akurasi terlihat.
+
+Model embedding berbeda = koleksi berbeda (dimensi bisa beda) -> tiap model dievaluasi
+di proses baru dengan folder kerjanya sendiri; backend/kuantisasi/top_k disapu di proses yang sama.
+LLM default nonaktif (jawaban deterministik calc/analytics); `--with-llm` pakai provider dari .env/--env.
+
+Contoh:
+    python eval_rag.py --members 30 --questions 60 --top-k 1,3,5 --backends chroma,numpy --quantizations none,int8,binary
+    python eval_rag.py --models sentence-transformers/all-MiniLM-L6-v2,intfloat/multilingual-e5-small --out eval.json
+    python eval_rag.py --with-llm --env LLM_PROVIDER=openai --env OPENAI_BASE_URL=http://127.0.0.1:9100/v1 --backends numpy --quantizations none --top-k 5
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from calendar import monthrange
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from synthetic_club import generate_rows, write_csv
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MONTHS_ID = {
+    1: "januari", 2: "februari", 3: "maret", 4: "april", 5: "mei", 6: "juni",
+    7: "juli", 8: "agustus", 9: "september", 10: "oktober", 11: "november", 12: "desember",
+}
+KINDS = ("total_month", "runs_month", "total_year", "compare", "leader", "club_total")
+
+
+# ==================================================
+# SET PERTANYAAN BERLABEL (dari baris klub sintetis)
+# ==================================================
+def _month_period(year: int, month: int) -> Dict[str, str]:
+    return {"start": date(year, month, 1).isoformat(), "end": date(year, month, monthrange(year, month)[1]).isoformat()}
+
+
+def _tally(rows: List[Dict[str, Any]], prefix: str) -> Dict[str, Dict[str, float]]:
+    """{member: {"km", "runs"}} untuk baris yang tanggalnya diawali `prefix` ("2026-09" / "2026")."""
+    out: Dict[str, Dict[str, float]] = {}
+    for r in rows:
+        if str(r["date"]).startswith(prefix):
+            t = out.setdefault(r["member_name"], {"km": 0.0, "runs": 0})
+            t["km"] += float(r["distance_km"])
+            t["runs"] += 1
+    return out
+
+
+def _km(value: float) -> Dict[str, Any]:
+    return {"value": round(value, 2), "unit": "km"}
+
+
+def build_questions(rows: List[Dict[str, Any]], n: int, seed: int) -> List[Dict[str, Any]]:
+    """
+    `n` pertanyaan berlabel, jenisnya bergiliran (KINDS), periode = bulan/tahun yang punya data.
+    Label: `members` (dokumen yang harus masuk konteks), `targets` (member yang boleh terdeteksi
+    dari query; [None] = pertanyaan tingkat klub), `period`, `expected` (angka + satuan di jawaban).
+    Nama depan saja hanya dipakai kalau token itu tidak muncul di nama member lain (satu jawaban benar).
+    """
+    rnd = random.Random(seed)
+    months = sorted({str(r["date"])[:7] for r in rows})
+    token_counts: Dict[str, int] = {}
+    for name in {r["member_name"] for r in rows}:
+        for token in set(name.lower().split()):
+            token_counts[token] = token_counts.get(token, 0) + 1
+
+    questions: List[Dict[str, Any]] = []
+    attempts = 0
+    while len(questions) < n and attempts < n * 20:
+        attempts += 1
+        kind = KINDS[len(questions) % len(KINDS)]
+        ym = rnd.choice(months)
+        year, month = int(ym[:4]), int(ym[5:7])
+        label = f"{MONTHS_ID[month]} {year}"
+        period = _month_period(year, month)
+        tally = _tally(rows, ym)
+        if not tally:
+            continue
+        names = sorted(tally)
+        name = rnd.choice(names)
+        q: Dict[str, Any] = {"kind": kind, "period": period}
+
+        if kind == "total_month":
+            q.update(query=f"berapa total lari {name} bulan {label}?", members=[name], targets=[name],
+                     expected=[_km(tally[name]["km"])])
+        elif kind == "runs_month":
+            first = name.split()[0]
+            mention = first.lower() if token_counts.get(first.lower()) == 1 else name
+            q.update(query=f"berapa kali {mention} lari bulan {label}?", members=[name], targets=[name],
+                     expected=[{"value": int(tally[name]["runs"]), "unit": "runs"}])
+        elif kind == "total_year":
+            yearly = _tally(rows, str(year))
+            q.update(query=f"total jarak {name} tahun {year} berapa km?", members=[name], targets=[name],
+                     period={"start": f"{year}-01-01", "end": f"{year}-12-31"}, expected=[_km(yearly[name]["km"])])
+        elif kind == "compare":
+            if len(names) < 2:
+                continue
+            a, b = rnd.sample(names, 2)
+            q.update(query=f"bandingkan {a} dan {b} bulan {label}", members=[a, b], targets=[a, b],
+                     expected=[_km(tally[a]["km"]), _km(tally[b]["km"])])
+        elif kind == "leader":
+            ranked = sorted(names, key=lambda m: -tally[m]["km"])
+            # seri di posisi teratas -> label ambigu, lewati
+            if len(ranked) > 1 and round(tally[ranked[0]]["km"], 2) == round(tally[ranked[1]]["km"], 2):
+                continue
+            lead = ranked[0]
+            q.update(query=f"siapa yang paling jauh larinya bulan {label}?", members=[lead], targets=[None],
+                     expected=[_km(tally[lead]["km"])])
+        else:
+            q.update(query=f"total jarak klub bulan {label} berapa?", members=[], targets=[None],
+                     expected=[_km(sum(t["km"] for t in tally.values()))])
+        q["id"] = f"q{len(questions) + 1:03d}"
+        questions.append(q)
+    return questions
+
+
+# ==================================================
+# SKOR
+# ==================================================
+_DOC_MEMBER = re.compile(r"^(.+?)\s+melakukan\s+beberapa\s+aktivitas\s+lari", re.IGNORECASE)
+_NUMBER_UNIT = re.compile(r"(\d+(?:[.,]\d+)?)\s*(km|kali|aktivitas)\b", re.IGNORECASE)
+
+
+def recall_at_k(contexts: List[str], members: List[str]) -> Optional[float]:
+    """Porsi dokumen member yang diharapkan yang ada di konteks; None kalau pertanyaan tanpa dokumen target."""
+    if not members:
+        return None
+    found = {m.group(1).strip().lower() for m in (_DOC_MEMBER.match(c or "") for c in contexts) if m}
+    return sum(1 for name in members if name.lower() in found) / len(members)
+
+
+def numeric_match(answer: str, expected: List[Dict[str, Any]]) -> bool:
+    """
+    Semua angka yang diharapkan muncul di jawaban dengan satuannya (km / kali|aktivitas), sama pada
+    presisi yang ditulis jawaban: "123.4 km" cocok dengan 123.44, "123 km" tidak (km wajib berdesimal).
+    """
+    found: List[Tuple[float, int, str]] = []
+    for m in _NUMBER_UNIT.finditer(answer or ""):
+        raw = m.group(1).replace(",", ".")
+        decimals = len(raw.split(".")[1]) if "." in raw else 0
+        found.append((float(raw), decimals, "km" if m.group(2).lower() == "km" else "runs"))
+    for exp in expected:
+        value, unit = float(exp["value"]), exp["unit"]
+        ok = False
+        for got, decimals, got_unit in found:
+            if got_unit != unit or (unit == "km" and decimals == 0):
+                continue
+            if abs(got - value) <= 0.5 * 10 ** -decimals + 1e-9:
+                ok = True
+                break
+        if not ok:
+            return False
+    return True
+
+
+def _pcts(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "mean": 0.0}
+    arr = np.asarray(values, dtype=np.float64)
+    return {"p50": round(float(np.percentile(arr, 50)), 2), "p95": round(float(np.percentile(arr, 95)), 2), "mean": round(float(arr.mean()), 2)}
+
+
+def _mean(values: List[Optional[float]]) -> Optional[float]:
+    vals = [v for v in values if v is not None]
+    return round(float(np.mean(vals)), 4) if vals else None
+
+
+# ==================================================
+# SATU MODEL EMBEDDING (in-process): ingest lalu sweep backend x kuantisasi x top_k
+# ==================================================
+def _configure_env(workdir: str, source: str, model: Optional[str], args) -> None:
+    """Env diset sebelum `app.*` diimpor (settings dibaca saat import)."""
+    os.environ.update({
+        "CHROMA_PATH": os.path.join(workdir, "db"),
+        "SYNC_STATE_DB": os.path.join(workdir, "sync_state.db"),
+        "NUMPY_INDEX_DIR": os.path.join(workdir, "np_index"),
+        # cache embedding & log query di workdir: hasil evaluasi tidak ikut menulis ke ./cache dan ./logs milik server
+        "EMBEDDING_CACHE_DB": os.path.join(workdir, "embedding_cache.db"),
+        "QUERY_LOG_PATH": os.path.join(workdir, "query_log.jsonl"),
+        "SHEET_SOURCE_FILE": source,
+        "TENANTS_FILE": "",
+        "ARTIFACT_IMPORT_ON_STARTUP": "false",
+    })
+    if not args.with_llm:
+        os.environ["LLM_PROVIDER"] = "none"
+    if model:
+        os.environ["EMBEDDING_MODEL"] = model
+    for item in args.env or []:
+        key, _, value = item.partition("=")
+        os.environ[key] = value
+
+
+def _quiet_logs(level: str) -> None:
+    from app.core.logger import logger
+
+    # log per query (INFO) ke stdout menenggelamkan laporan
+    logger.remove()
+    logger.add(sys.stderr, level=level.upper())
+
+
+def _configs(backends: List[str], quantizations: List[str], top_ks: List[int]) -> List[Dict[str, Any]]:
+    out = []
+    for backend in backends:
+        for quant in (quantizations if backend == "numpy" else ["-"]):
+            for k in top_ks:
+                out.append({"backend": backend, "quantization": quant, "top_k": k})
+    return out
+
+
+def evaluate_config(questions: List[Dict[str, Any]], top_k: int, with_answer: bool) -> Dict[str, Any]:
+    from app.services.rag.answerer import answer_with_llm
+    from app.services.rag.date_range import resolve_date_range
+    from app.services.rag.retriever import _collect_member_names, _plan_query, retrieve_context
+
+    names = _collect_member_names()
+    # warm: index/koleksi/model sudah dimuat sebelum diukur
+    retrieve_context(questions[0]["query"], top_k=top_k)
+
+    retrieve_ms: List[float] = []
+    answer_ms: List[float] = []
+    recalls: List[Optional[float]] = []
+    member_ok: List[float] = []
+    period_ok: List[float] = []
+    em: List[float] = []
+    providers: Dict[str, int] = {}
+    per_kind: Dict[str, Dict[str, List[Optional[float]]]] = {}
+    misses: List[Dict[str, Any]] = []
+    for q in questions:
+        rng = resolve_date_range(q["query"])
+        period_ok.append(float(bool(rng) and rng.start.isoformat() == q["period"]["start"] and rng.end.isoformat() == q["period"]["end"]))
+        target = _plan_query(q["query"], None, names)[1]
+        member_ok.append(float((target or None) in q["targets"]))
+
+        t0 = time.perf_counter()
+        contexts = retrieve_context(q["query"], top_k=top_k)
+        retrieve_ms.append((time.perf_counter() - t0) * 1000)
+        recall = recall_at_k(contexts, q["members"])
+        recalls.append(recall)
+        kind = per_kind.setdefault(q["kind"], {"recall": [], "em": []})
+        kind["recall"].append(recall)
+
+        if with_answer:
+            t0 = time.perf_counter()
+            answer, provider = answer_with_llm(q["query"], contexts, rng)
+            answer_ms.append((time.perf_counter() - t0) * 1000)
+            providers[provider] = providers.get(provider, 0) + 1
+            hit = float(numeric_match(answer, q["expected"]))
+            em.append(hit)
+            kind["em"].append(hit)
+            if not hit and len(misses) < 5:
+                misses.append({"id": q["id"], "query": q["query"], "expected": q["expected"], "answer": answer[:240], "provider": provider})
+
+    return {
+        "top_k": top_k,
+        "questions": len(questions),
+        "recall_at_k": _mean(recalls),
+        "member_acc": _mean(member_ok),
+        "period_acc": _mean(period_ok),
+        "numeric_em": _mean(em) if with_answer else None,
+        "retrieve_ms": _pcts(retrieve_ms),
+        "answer_ms": _pcts(answer_ms) if with_answer else None,
+        "providers": providers,
+        "by_kind": {k: {"recall_at_k": _mean(v["recall"]), "numeric_em": _mean(v["em"])} for k, v in per_kind.items()},
+        "misses": misses,
+    }
+
+
+def evaluate_model(args, model: Optional[str]) -> Dict[str, Any]:
+    """Ingest klub sintetis dengan model `model` (None = EMBEDDING_MODEL dari env/.env) lalu sapu semua konfigurasi."""
+    workdir = tempfile.mkdtemp(prefix="strava-eval-")
+    try:
+        end = date.fromisoformat(args.end) if args.end else date.today()
+        rows = generate_rows(args.members, args.activities, args.days, args.seed, end=end)
+        source = write_csv(rows, os.path.join(workdir, "club.csv"))
+        questions = build_questions(rows, args.questions, args.seed)
+        _configure_env(workdir, source, model, args)
+        _quiet_logs(args.log_level)
+
+        from app.core.config import settings
+        from app.services.chroma.numpy_index import reload_index
+        from app.services.gsheet.sync import sync_gsheet_to_chroma
+
+        start = time.perf_counter()
+        ingest = sync_gsheet_to_chroma()
+        if ingest.get("status") == "error":
+            raise RuntimeError(f"Ingest klub sintetis gagal: {ingest.get('message')}")
+        ingest_ms = round((time.perf_counter() - start) * 1000, 1)
+
+        results = []
+        for cfg in _configs(args.backends, args.quantizations, args.top_k):
+            settings.RETRIEVAL_BACKEND = cfg["backend"]
+            if cfg["backend"] == "numpy" and settings.NUMPY_INDEX_QUANTIZATION != cfg["quantization"]:
+                settings.NUMPY_INDEX_QUANTIZATION = cfg["quantization"]
+                reload_index()
+            out = evaluate_config(questions, cfg["top_k"], not args.no_answer)
+            results.append({"model": settings.EMBEDDING_MODEL, **cfg, **out})
+        return {
+            "model": settings.EMBEDDING_MODEL,
+            "ingest": {"ms": ingest_ms, **{k: v for k, v in ingest.items() if k in ("updated", "skipped")}},
+            "questions": questions if args.dump_questions else len(questions),
+            "results": results,
+        }
+    finally:
+        if args.keep:
+            print(f"Folder kerja disimpan: {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _run_model_subprocess(model: str) -> Dict[str, Any]:
+    """Evaluasi satu model di proses baru (koleksi + model embedding sendiri), argumen lain sama."""
+    with tempfile.TemporaryDirectory(prefix="strava-eval-out-") as tmp:
+        out = os.path.join(tmp, "model.json")
+        argv = _strip_option(sys.argv[1:], ("--models", "--out"))
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), *argv, "--models", model, "--out", out, "--worker"], cwd=BACKEND_DIR)
+        if proc.returncode != 0 or not os.path.exists(out):
+            return {"model": model, "error": f"exit {proc.returncode}", "results": []}
+        with open(out, encoding="utf-8") as f:
+            return json.load(f)["models"][0]
+
+
+def _strip_option(argv: List[str], names: Tuple[str, ...]) -> List[str]:
+    out: List[str] = []
+    skip = False
+    for a in argv:
+        if skip:
+            skip = False
+            continue
+        if a in names:
+            skip = True
+            continue
+        if any(a.startswith(f"{n}=") for n in names):
+            continue
+        out.append(a)
+    return out
+
+
+# ==================================================
+# LAPORAN
+# ==================================================
+def _with_deltas(results: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Baseline = konfigurasi pertama dengan top_k terbesar; tiap hasil diberi selisih recall/EM terhadapnya."""
+    if not results:
+        return None
+    k_max = max(r["top_k"] for r in results)
+    base = next(r for r in results if r["top_k"] == k_max)
+    for r in results:
+        for key in ("recall_at_k", "numeric_em"):
+            if r.get(key) is not None and base.get(key) is not None:
+                r[f"{key}_delta"] = round(r[key] - base[key], 4)
+    return {k: base[k] for k in ("model", "backend", "quantization", "top_k")}
+
+
+def _fmt(value: Optional[float], width: int, delta: Optional[float] = None) -> str:
+    if value is None:
+        return f"{'-':>{width}}"
+    text = f"{value:.3f}" + (f"({delta:+.2f})" if delta else "")
+    return f"{text:>{width}}"
+
+
+def _short(model: str) -> str:
+    return model.rsplit("/", 1)[-1][:27]
+
+
+def _print_report(report: Dict[str, Any]) -> None:
+    print(f"members={report['members']} questions={report['questions']} seed={report['seed']} llm={'on' if report['with_llm'] else 'off'}")
+    if report.get("baseline"):
+        b = report["baseline"]
+        print(f"baseline: {b['model']} {b['backend']}/{b['quantization']} top_k={b['top_k']}")
+    print(f"{'model':<28}{'backend':<9}{'quant':<7}{'k':>3}{'recall@k':>16}{'EM':>16}{'member':>8}{'period':>8}{'ret p50':>9}{'ret p95':>9}{'ans p50':>9}")
+    for m in report["models"]:
+        if m.get("error"):
+            print(f"{_short(m['model']):<28}ERROR {m['error']}")
+        for r in m["results"]:
+            ans = r["answer_ms"]["p50"] if r.get("answer_ms") else None
+            print(
+                f"{_short(r['model']):<28}{r['backend']:<9}{r['quantization']:<7}{r['top_k']:>3}"
+                f"{_fmt(r['recall_at_k'], 16, r.get('recall_at_k_delta'))}{_fmt(r['numeric_em'], 16, r.get('numeric_em_delta'))}"
+                f"{_fmt(r['member_acc'], 8)}{_fmt(r['period_acc'], 8)}"
+                f"{r['retrieve_ms']['p50']:>9.2f}{r['retrieve_ms']['p95']:>9.2f}{_fmt(ans, 9)}"
+            )
+
+
+# ==================================================
+# CLI
+# ==================================================
+def main():
+    parser = argparse.ArgumentParser(description="Evaluasi kualitas vs latency retrieval + jawaban (klub sintetis berlabel)")
+    parser.add_argument("--members", type=int, default=30)
+    parser.add_argument("--activities", type=int, default=40, help="Aktivitas per member")
+    parser.add_argument("--days", type=int, default=365, help="Rentang tanggal ke belakang dari --end")
+    parser.add_argument("--end", help="Tanggal terakhir data sintetis (YYYY-MM-DD, default hari ini)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--questions", type=int, default=60, help=f"Jumlah pertanyaan berlabel (jenis bergiliran: {', '.join(KINDS)})")
+    parser.add_argument("--top-k", default="1,3,5", help="Daftar top_k (koma)")
+    parser.add_argument("--backends", default="chroma,numpy", help="Backend retrieval: chroma,numpy")
+    parser.add_argument("--quantizations", default="none,int8,binary", help="Kuantisasi index NumPy (hanya backend numpy)")
+    parser.add_argument("--models", default="", help="Model embedding (koma); kosong = EMBEDDING_MODEL aktif. >1 model -> satu proses per model")
+    parser.add_argument("--no-answer", action="store_true", help="Hanya retrieval (tanpa answer_with_llm / numeric EM)")
+    parser.add_argument("--with-llm", action="store_true", help="Pakai LLM_PROVIDER dari .env/--env (default: LLM nonaktif, jawaban deterministik)")
+    parser.add_argument("--env", action="append", help="Override env KEY=VALUE (boleh berulang)")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--dump-questions", action="store_true", help="Sertakan set pertanyaan + label di JSON hasil")
+    parser.add_argument("--keep", action="store_true", help="Jangan hapus folder kerja")
+    parser.add_argument("--out", help="Tulis hasil JSON ke file")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.top_k = sorted({int(k) for k in args.top_k.split(",") if k.strip()}, reverse=True)
+    args.backends = [b.strip().lower() for b in args.backends.split(",") if b.strip()]
+    args.quantizations = [q.strip().lower() for q in args.quantizations.split(",") if q.strip()]
+    models = [m.strip() for m in args.models.split(",") if m.strip()]
+
+    if len(models) > 1:
+        per_model = [_run_model_subprocess(m) for m in models]
+    else:
+        per_model = [evaluate_model(args, models[0] if models else None)]
+    report = {
+        "benchmark": "eval_rag",
+        "members": args.members,
+        "questions": args.questions,
+        "seed": args.seed,
+        "with_llm": args.with_llm,
+        "models": per_model,
+    }
+    if not args.worker:
+        report["baseline"] = _with_deltas([r for m in per_model for r in m["results"]])
+        _print_report(report)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        if not args.worker:
+            print(f"Hasil ditulis ke {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
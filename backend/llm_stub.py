@@ -0,0 +1,73 @@
+"""
+Stub lokal OpenAI-compatible untuk uji client LLM (timeout, retry, breaker, hedging)
+tanpa memanggil provider sungguhan.
+
+Contoh:
+    python llm_stub.py --port 9100 --latency-ms 300 --error-rate 0.1
+lalu set di .env:
+    LLM_PROVIDER=openai
+    OPENAI_API_KEY=stub
+    OPENAI_BASE_URL=http://127.0.0.1:9100/v1
+    # atau Groq: GROQ_API_KEY=stub, GROQ_BASE_URL=http://127.0.0.1:9100
+"""
+import argparse
+import asyncio
+import random
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+def create_app(latency_ms: float = 200.0, jitter_ms: float = 0.0, error_rate: float = 0.0, error_status: int = 503) -> FastAPI:
+    app = FastAPI(title="LLM Stub (OpenAI-compatible)")
+    app.state.calls = 0
+
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        delay = max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000.0
+        await asyncio.sleep(delay)
+        if error_rate and random.random() < error_rate:
+            return JSONResponse(status_code=error_status, content={"error": {"message": "stub error", "type": "server_error"}})
+
+        messages = body.get("messages") or []
+        question = messages[-1].get("content", "") if messages else ""
+        answer = f"[stub] Jawaban untuk: {question[-120:]}"
+        return {
+            "id": f"chatcmpl-stub-{app.state.calls}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    # OpenAI SDK: {base_url}/chat/completions ; Groq SDK: {base_url}/openai/v1/chat/completions
+    app.add_api_route("/v1/chat/completions", chat_completions, methods=["POST"])
+    app.add_api_route("/openai/v1/chat/completions", chat_completions, methods=["POST"])
+
+    @app.get("/stats")
+    def stats():
+        return {"calls": app.state.calls}
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Stub LLM OpenAI-compatible")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Peluang 0-1 stub membalas error")
+    parser.add_argument("--error-status", type=int, default=503)
+    args = parser.parse_args()
+
+    app = create_app(args.latency_ms, args.jitter_ms, args.error_rate, args.error_status)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+"""
+Load test end-to-end untuk /strava/ask, /strava/leaderboard dan /strava/refresh.
+
+Mode:
+- `--launch`: jalankan app + stub LLM (llm_stub.py) sendiri di port lokal, dengan
+  koleksi dari klub sintetis (synthetic_club.py) atau file lokal (`--source-file`),
+  di folder sementara (CHROMA_PATH/SYNC_STATE_DB terpisah dari data asli).
+- `--base-url`: tembak app yang sudah jalan.
+
+Traffic open-loop pada `--rps` (jadwal tetap, tidak menunggu response sebelumnya),
+dari campuran skrip (`--mix`) atau replay log query teranonimkan (`--replay`,
+direkam app dengan QUERY_LOG_ENABLED=true atau `--record` di mode launch).
+Hasil: JSON berisi p50/p95/p99, throughput, error rate per endpoint, plus
+breakdown per tahap dari header Server-Timing (embed, search, llm, ...).
+
+Contoh:
+    python loadtest.py --launch --members 50 --llm-latency-ms 300 --rps 10 --duration 30 --out report.json
+    python loadtest.py --launch --record ./logs/query_log.jsonl --rps 5 --duration 60
+    python loadtest.py --base-url http://127.0.0.1:8000 --replay ./logs/query_log.jsonl --rps 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+import httpx
+import numpy as np
+from synthetic_club import generate_rows, member_names, write_csv
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_MIX = "ask_answer=0.5,ask=0.3,leaderboard=0.18,refresh=0.02"
+
+QUERY_TEMPLATES = [
+    "berapa total lari {member} bulan ini?",
+    "siapa yang paling jauh larinya minggu ini?",
+    "bandingkan {member} dan {member2} bulan lalu",
+    "berapa kali {member} lari lebih dari 10 km?",
+    "aktivitas terakhir {member} kapan?",
+    "berapa pace rata-rata {member}?",
+    "siapa paling rajin lari tahun ini?",
+    "total jarak klub bulan ini berapa?",
+]
+
+_PLACEHOLDER = re.compile(r"\{member:[0-9a-f]+\}")
+
+
+# ==================================================
+# SUMBER REQUEST (skrip / replay)
+# ==================================================
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix: Dict[str, float] = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        if name.strip() not in {"ask", "ask_answer", "leaderboard", "refresh"}:
+            raise ValueError(f"Jenis request tidak dikenal di --mix: {name}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def scripted_requests(mix: Dict[str, float], names: List[str], sessions: int, seed: int) -> Iterator[Dict[str, Any]]:
+    """Request acak sesuai bobot `mix`; nama member dari koleksi target."""
+    rnd = random.Random(seed)
+    kinds, weights = list(mix), list(mix.values())
+    names = names or ["Member"]
+    while True:
+        kind = rnd.choices(kinds, weights)[0]
+        if kind == "refresh":
+            yield {"name": "refresh", "method": "POST", "path": "/strava/refresh", "params": {}}
+        elif kind == "leaderboard":
+            scope = rnd.choice(["week", "month", "year"])
+            yield {"name": "leaderboard", "method": "GET", "path": "/strava/leaderboard", "params": {"scope": scope}}
+        else:
+            m1, m2 = rnd.choice(names), rnd.choice(names)
+            params = {
+                "query": rnd.choice(QUERY_TEMPLATES).format(member=m1, member2=m2),
+                "session_id": f"lt-{rnd.randrange(max(1, sessions))}",
+            }
+            if kind == "ask_answer":
+                params["with_answer"] = "true"
+            yield {"name": kind, "method": "GET", "path": "/strava/ask", "params": params}
+
+
+def _request_name(path: str, params: Dict[str, Any]) -> str:
+    if path == "/strava/ask":
+        return "ask_answer" if str(params.get("with_answer", "")).lower() in ("1", "true") else "ask"
+    return path.rsplit("/", 1)[-1]
+
+
+def replay_requests(path: str, names: List[str], seed: int, loop: bool = True) -> Iterator[Dict[str, Any]]:
+    """
+    Request dari log query teranonimkan (JSONL). Placeholder `{member:<hash>}` dipetakan
+    konsisten ke nama member koleksi target; `offset` = jarak waktu dari record pertama (detik).
+    """
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if not records:
+        raise ValueError(f"Log query kosong: {path}")
+    rnd = random.Random(seed)
+    mapping: Dict[str, str] = {}
+    names = names or ["Member"]
+
+    def fill(text: str) -> str:
+        return _PLACEHOLDER.sub(lambda m: mapping.setdefault(m.group(0), rnd.choice(names)), text)
+
+    # record ditulis saat response selesai -> urutkan ulang berdasarkan waktu mulai request
+    records.sort(key=lambda r: r.get("ts", 0.0))
+    t0 = records[0].get("ts", 0.0)
+    offsets = [max(0.0, float(r.get("ts", t0)) - t0) for r in records]
+    # putaran berikutnya digeser sepanjang log + rata-rata jarak antar request
+    span = offsets[-1] + (offsets[-1] / max(1, len(records) - 1) if len(records) > 1 else 1.0)
+    rounds = 0
+    while True:
+        for rec, offset in zip(records, offsets):
+            params = {k: fill(str(v)) for k, v in (rec.get("params") or {}).items()}
+            yield {
+                "name": _request_name(rec["path"], params),
+                "method": rec.get("method", "GET"),
+                "path": rec["path"],
+                "params": params,
+                "offset": offset + rounds * span,
+            }
+        if not loop:
+            return
+        rounds += 1
+
+
+# ==================================================
+# DRIVER (open-loop)
+# ==================================================
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    stages: Dict[str, float] = {}
+    for part in (header or "").split(","):
+        name, _, rest = part.strip().partition(";")
+        match = re.search(r"dur=([0-9.]+)", rest)
+        if name and match:
+            stages[name] = float(match.group(1))
+    return stages
+
+
+async def _send(client: httpx.AsyncClient, req: Dict[str, Any], samples: List[Dict[str, Any]], scheduled: float) -> None:
+    start = time.perf_counter()
+    sample: Dict[str, Any] = {"name": req["name"], "lag_ms": (start - scheduled) * 1000}
+    try:
+        resp = await client.request(req["method"], req["path"], params=req["params"])
+        sample["status"] = resp.status_code
+        sample["stages"] = parse_server_timing(resp.headers.get("server-timing"))
+        body = resp.json() if resp.headers.get("content-type", "").startswith("application/json") else {}
+        sample["ok"] = resp.is_success and body.get("status") != "error"
+        if not sample["ok"]:
+            sample["error"] = body.get("message") or f"HTTP {resp.status_code}"
+        sample["shed"] = bool(body.get("admission"))
+        sample["cache_hit"] = body.get("cache") == "semantic"
+    except Exception as e:
+        sample.update({"status": 0, "ok": False, "error": type(e).__name__})
+    sample["latency_ms"] = (time.perf_counter() - start) * 1000
+    samples.append(sample)
+
+
+async def drive(base_url: str, requests: Iterator[Dict[str, Any]], rps: float, duration: float,
+                timeout: float, max_in_flight: int, poisson: bool, use_offsets: bool, speed: float, seed: int) -> Dict[str, Any]:
+    """Kirim request sesuai jadwal (tidak menunggu response); request di atas `max_in_flight` dihitung dropped."""
+    rnd = random.Random(seed)
+    samples: List[Dict[str, Any]] = []
+    tasks = set()
+    dropped = 0
+    limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        t0 = time.perf_counter()
+        next_at = 0.0
+        for req in requests:
+            if use_offsets:
+                next_at = req["offset"] / max(speed, 1e-6)
+            if next_at >= duration:
+                break
+            delay = t0 + next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(tasks) >= max_in_flight:
+                dropped += 1
+            else:
+                task = asyncio.create_task(_send(client, req, samples, t0 + next_at))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if not use_offsets:
+                next_at += rnd.expovariate(rps) if poisson else 1.0 / rps
+        sent_wall = time.perf_counter() - t0
+        if tasks:
+            await asyncio.wait(tasks)
+        wall = time.perf_counter() - t0
+    return {"samples": samples, "dropped": dropped, "send_seconds": sent_wall, "wall_seconds": wall}
+
+
+# ==================================================
+# REPORT
+# ==================================================
+def _pcts(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    arr = np.asarray(values, dtype=float)
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {
+        "p50": round(float(p50), 1),
+        "p95": round(float(p95), 1),
+        "p99": round(float(p99), 1),
+        "mean": round(float(arr.mean()), 1),
+        "max": round(float(arr.max()), 1),
+    }
+
+
+def _group_report(samples: List[Dict[str, Any]], wall: float) -> Dict[str, Any]:
+    errors = [s for s in samples if not s["ok"]]
+    statuses: Dict[str, int] = {}
+    for s in samples:
+        statuses[str(s["status"])] = statuses.get(str(s["status"]), 0) + 1
+    stage_values: Dict[str, List[float]] = {}
+    for s in samples:
+        for name, ms in (s.get("stages") or {}).items():
+            stage_values.setdefault(name, []).append(ms)
+    error_kinds: Dict[str, int] = {}
+    for s in errors:
+        error_kinds[s["error"]] = error_kinds.get(s["error"], 0) + 1
+    return {
+        "count": len(samples),
+        "ok": len(samples) - len(errors),
+        "errors": len(errors),
+        "error_rate": round(len(errors) / len(samples), 4) if samples else 0.0,
+        "throughput_rps": round(len(samples) / wall, 2) if wall else 0.0,
+        "status_codes": statuses,
+        "error_kinds": dict(sorted(error_kinds.items(), key=lambda kv: -kv[1])[:10]),
+        "latency_ms": _pcts([s["latency_ms"] for s in samples]),
+        "schedule_lag_ms": _pcts([s["lag_ms"] for s in samples]),
+        "stages_ms": {name: _pcts(vals) for name, vals in sorted(stage_values.items())},
+        "shed": sum(1 for s in samples if s.get("shed")),
+        "cache_hits": sum(1 for s in samples if s.get("cache_hit")),
+    }
+
+
+def build_report(run: Dict[str, Any], config: Dict[str, Any]) -> Dict[str, Any]:
+    samples, wall = run["samples"], run["wall_seconds"]
+    by_name: Dict[str, List[Dict[str, Any]]] = {}
+    for s in samples:
+        by_name.setdefault(s["name"], []).append(s)
+    return {
+        "config": config,
+        "wall_seconds": round(wall, 2),
+        "send_seconds": round(run["send_seconds"], 2),
+        "sent": len(samples) + run["dropped"],
+        "dropped_client_side": run["dropped"],
+        "overall": _group_report(samples, wall),
+        "endpoints": {name: _group_report(group, wall) for name, group in sorted(by_name.items())},
+    }
+
+
+# ==================================================
+# LAUNCH (app + stub LLM lokal)
+# ==================================================
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_http(url: str, timeout: float, proc: subprocess.Popen) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Proses berhenti sebelum siap ({url}), exit code {proc.returncode}")
+        try:
+            if httpx.get(url, timeout=2.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.3)
+    raise TimeoutError(f"Tidak siap dalam {timeout}s: {url}")
+
+
+@contextmanager
+def launch_stack(args) -> Iterator[Dict[str, Any]]:
+    """Jalankan stub LLM + app (subprocess uvicorn) dengan data di folder sementara, lalu ingest awal."""
+    workdir = tempfile.mkdtemp(prefix="strava-loadtest-")
+    procs: List[subprocess.Popen] = []
+    logs = []
+    try:
+        if args.source_file:
+            source, names = os.path.abspath(args.source_file), []
+        else:
+            source = write_csv(generate_rows(args.members, args.activities, seed=args.seed), os.path.join(workdir, "club.csv"))
+            names = member_names(args.members, args.seed)
+
+        stub_port, app_port = _free_port(), _free_port()
+        env = {
+            **os.environ,
+            "CHROMA_PATH": os.path.join(workdir, "db"),
+            "SYNC_STATE_DB": os.path.join(workdir, "sync_state.db"),
+            "NUMPY_INDEX_DIR": os.path.join(workdir, "np_index"),
+            "SHEET_SOURCE_FILE": source,
+            "LLM_PROVIDER": "openai",
+            "OPENAI_API_KEY": "stub",
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{stub_port}/v1",
+        }
+        if args.record:
+            env.update({"QUERY_LOG_ENABLED": "true", "QUERY_LOG_PATH": os.path.abspath(args.record)})
+        for item in args.env or []:
+            key, _, value = item.partition("=")
+            env[key] = value
+
+        for name, cmd in (
+            ("llm_stub", [sys.executable, "llm_stub.py", "--port", str(stub_port),
+                          "--latency-ms", str(args.llm_latency_ms), "--jitter-ms", str(args.llm_jitter_ms),
+                          "--error-rate", str(args.llm_error_rate)]),
+            ("app", [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+                     "--port", str(app_port), "--log-level", "warning"]),
+        ):
+            log = open(os.path.join(workdir, f"{name}.log"), "w")
+            logs.append(log)
+            procs.append(subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT))
+
+        base_url = f"http://127.0.0.1:{app_port}"
+        _wait_http(f"http://127.0.0.1:{stub_port}/stats", 30, procs[0])
+        _wait_http(f"{base_url}/health/ready", args.startup_timeout, procs[1])
+
+        # ingest awal (sync penuh dari file sumber) -> dicatat terpisah dari hasil load test
+        start = time.perf_counter()
+        ingest = httpx.post(f"{base_url}/strava/refresh", timeout=args.startup_timeout).json()
+        if ingest.get("status") != "ok":
+            raise RuntimeError(f"Ingest awal gagal: {ingest}")
+        ingest["ms"] = round((time.perf_counter() - start) * 1000, 1)
+        yield {"base_url": base_url, "names": names, "workdir": workdir, "ingest": ingest}
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        for log in logs:
+            log.close()
+        if args.keep:
+            print(f"Folder kerja disimpan: {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def fetch_member_names(base_url: str) -> List[str]:
+    """Nama member koleksi target (dari leaderboard tahunan) untuk mengisi query skrip/replay."""
+    try:
+        got = httpx.get(f"{base_url}/strava/leaderboard", params={"scope": "year"}, timeout=30).json()
+        return [row["member"] for row in got.get("leaderboard") or []]
+    except Exception:
+        return []
+
+
+def run(args, base_url: str, names: List[str]) -> Dict[str, Any]:
+    names = names or fetch_member_names(base_url)
+    if args.replay:
+        requests = replay_requests(args.replay, names, args.seed)
+    else:
+        requests = scripted_requests(parse_mix(args.mix), names, args.sessions, args.seed)
+    result = asyncio.run(drive(
+        base_url, requests, args.rps, args.duration, args.timeout, args.max_in_flight,
+        args.poisson, bool(args.replay and args.replay_timing), args.speed, args.seed,
+    ))
+    config = {k: v for k, v in vars(args).items() if k not in ("env", "out")}
+    report = build_report(result, config)
+    try:
+        report["server"] = httpx.get(f"{base_url}/health/metrics", timeout=10).json()
+    except Exception as e:
+        report["server"] = {"error": str(e)}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test end-to-end Strava RAG API")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--launch", action="store_true", help="Jalankan app + stub LLM lokal sendiri")
+    target.add_argument("--base-url", help="Target app yang sudah jalan, mis. http://127.0.0.1:8000")
+
+    parser.add_argument("--rps", type=float, default=5.0, help="Target request/detik (open-loop)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Lama pengiriman (detik)")
+    parser.add_argument("--poisson", action="store_true", help="Jarak antar request eksponensial (bukan rata)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Bobot jenis request: ask, ask_answer, leaderboard, refresh")
+    parser.add_argument("--sessions", type=int, default=50, help="Jumlah session_id berbeda di traffic skrip")
+    parser.add_argument("--replay", help="Replay log query JSONL (QUERY_LOG_PATH) alih-alih campuran skrip")
+    parser.add_argument("--replay-timing", action="store_true", help="Ikuti jarak waktu asli di log (lihat --speed), abaikan --rps")
+    parser.add_argument("--speed", type=float, default=1.0, help="Pengali kecepatan replay (2 = dua kali lebih rapat)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Timeout per request (detik)")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="Batas request terbuka; lebihnya dihitung dropped")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="Tulis report JSON ke file (default: stdout)")
+
+    launch = parser.add_argument_group("mode --launch")
+    launch.add_argument("--source-file", help="CSV/JSON data klub (default: klub sintetis)")
+    launch.add_argument("--members", type=int, default=30)
+    launch.add_argument("--activities", type=int, default=40, help="Aktivitas per member (klub sintetis)")
+    launch.add_argument("--llm-latency-ms", type=float, default=300.0)
+    launch.add_argument("--llm-jitter-ms", type=float, default=50.0)
+    launch.add_argument("--llm-error-rate", type=float, default=0.0)
+    launch.add_argument("--record", help="Rekam log query teranonimkan dari app ke file ini (untuk --replay nanti)")
+    launch.add_argument("--env", action="append", help="Override setting app, mis. --env ADMISSION_ENABLED=false")
+    launch.add_argument("--startup-timeout", type=float, default=300.0)
+    launch.add_argument("--keep", action="store_true", help="Jangan hapus folder kerja (db, log app/stub)")
+    args = parser.parse_args()
+
+    if args.launch:
+        with launch_stack(args) as stack:
+            report = run(args, stack["base_url"], stack["names"])
+            report["ingest"] = stack["ingest"]
+    else:
+        report = run(args, args.base_url.rstrip("/"), [])
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+        overall = report["overall"]
+        print(f"{overall['count']} request, {overall['throughput_rps']} rps, error rate {overall['error_rate']}, "
+              f"p95 {overall['latency_ms'].get('p95')} ms -> {args.out}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
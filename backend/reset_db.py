@@ -1,26 +1,70 @@
 from app.services.chroma.manager import reset_collection
-from app.core.logger import logger
+from app.services.chroma.db_client import get_active_collection_name
+from app.services.gsheet.state_store import LEGACY_HASH_PATH, get_state_store
+from app.core.logger import logger, setup_file_logging
+from app.core.tenant import DEFAULT_CLUB, current_club, known_club, normalize_club, use_club
+import argparse
 import os
 
 
-CACHE_PATH = "./cache/cache_hash.json"
-
-
-def main():
+def reset():
     try:
         logger.warning("Memulai reset koleksi ChromaDB...")
+        name = get_active_collection_name()
         reset_collection()
 
-        if os.path.exists(CACHE_PATH):
-            os.remove(CACHE_PATH)
-            logger.info("Cache hash dihapus.")
-        else:
-            logger.info("Cache hash tidak ditemukan, lewati.")
+        get_state_store().clear_collection(name)
+        logger.info(f"State sync koleksi '{name}' dihapus.")
+        if current_club() == DEFAULT_CLUB and os.path.exists(LEGACY_HASH_PATH):
+            os.remove(LEGACY_HASH_PATH)
+            logger.info("Cache hash lama dihapus.")
 
         logger.warning("Reset selesai.")
     except Exception as e:
         logger.exception(f"Gagal reset database/cache: {e}")
 
 
+def main():
+    parser = argparse.ArgumentParser(description="Reset / reindex koleksi ChromaDB")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--reindex", action="store_true", help="Bangun koleksi versi baru lalu tukar alias (tanpa downtime)")
+    mode.add_argument("--rollback", action="store_true", help="Kembalikan alias ke versi koleksi sebelumnya")
+    mode.add_argument("--gc", action="store_true", help="Hapus versi koleksi lama")
+    mode.add_argument("--export", nargs="?", const="", default=None, metavar="DIR", help="Ekspor koleksi aktif + state sync sebagai artifact berversi (default ARTIFACT_DIR)")
+    mode.add_argument("--import", dest="import_path", nargs="?", const="", default=None, metavar="PATH", help="Muat artifact (folder versi, atau folder klub -> versi terbaru)")
+    parser.add_argument("--force", action="store_true", help="--import walau store lokal sudah sama/lebih baru")
+    parser.add_argument("--keep", type=int, default=None, help="Jumlah versi lama yang disimpan saat --gc")
+    parser.add_argument("--club", default=DEFAULT_CLUB, help="ID klub (TENANTS_FILE); default klub utama")
+    args = parser.parse_args()
+    setup_file_logging()
+
+    club = normalize_club(args.club)
+    if not known_club(club):
+        parser.error(f"Klub '{club}' tidak terdaftar di TENANTS_FILE.")
+
+    with use_club(club):
+        if args.export is not None or args.import_path is not None:
+            from app.services.chroma.artifact import export_artifact, import_artifact
+            if args.export is not None:
+                result = export_artifact(args.export or None)
+            else:
+                result = import_artifact(args.import_path or None, force=args.force)
+            logger.info(f"Hasil: {result}")
+            return
+
+        if not (args.reindex or args.rollback or args.gc):
+            reset()
+            return
+
+        from app.services.chroma.reindex import reindex_collection, rollback_collection, gc_collections
+        if args.reindex:
+            result = reindex_collection()
+        elif args.rollback:
+            result = rollback_collection()
+        else:
+            result = gc_collections(args.keep)
+        logger.info(f"Hasil: {result}")
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,83 @@
+"""
+Generator data klub sintetis (kolom sama seperti tab Google Sheet) untuk
+load test / benchmark tanpa akses Google Sheet.
+
+Contoh:
+    python synthetic_club.py --members 50 --activities 40 --out ./cache/synthetic_club.csv
+lalu set di .env:
+    SHEET_SOURCE_FILE=./cache/synthetic_club.csv
+"""
+import argparse
+import csv
+import os
+import random
+from datetime import date, timedelta
+from typing import Any, Dict, List
+
+COLUMNS = ["member_name", "date", "activity_name", "distance_km", "avg_pace", "moving_time", "elevation_gain_m"]
+
+_FIRST = ["Yoga", "Lussy", "Budi", "Rina", "Agus", "Dewi", "Eko", "Fitri", "Hendra", "Indah",
+          "Joko", "Kartika", "Lukman", "Maya", "Nanda", "Putri", "Rizky", "Sari", "Taufik", "Wulan"]
+_LAST = ["Setiyawan", "Ana", "Santoso", "Wati", "Salim", "Lestari", "Prasetyo", "Handayani",
+         "Gunawan", "Permata", "Susilo", "Rahma", "Hakim", "Sari", "Pratama", "Utami"]
+_ACTIVITIES = ["Lari Pagi", "Lari Sore", "Easy Run", "Long Run", "Tempo Run", "Interval", "Recovery Run"]
+
+
+def member_names(n: int, seed: int = 1) -> List[str]:
+    """Nama unik dan deterministik (nama depan + belakang, diberi nomor kalau kombinasi habis)."""
+    rnd = random.Random(seed)
+    combos = [f"{f} {l}" for f in _FIRST for l in _LAST]
+    rnd.shuffle(combos)
+    names = combos[:n]
+    names += [f"Runner {i + 1}" for i in range(n - len(names))]
+    return names
+
+
+def generate_rows(members: int = 20, activities: int = 30, days: int = 365, seed: int = 1, end: date = None) -> List[Dict[str, Any]]:
+    """Baris aktivitas acak: `activities` per member, tersebar di `days` hari terakhir sampai `end`."""
+    rnd = random.Random(seed)
+    end = end or date.today()
+    rows: List[Dict[str, Any]] = []
+    for name in member_names(members, seed):
+        for _ in range(activities):
+            km = round(rnd.uniform(2, 22), 2)
+            pace_s = rnd.randint(290, 480)
+            moving = int(km * pace_s)
+            rows.append({
+                "member_name": name,
+                "date": (end - timedelta(days=rnd.randint(0, max(0, days - 1)))).isoformat(),
+                "activity_name": rnd.choice(_ACTIVITIES),
+                "distance_km": km,
+                "avg_pace": f"{pace_s // 60}:{pace_s % 60:02d} /km",
+                "moving_time": f"{moving // 3600}:{(moving % 3600) // 60:02d}:{moving % 60:02d}",
+                "elevation_gain_m": rnd.randint(0, 150),
+            })
+    rows.sort(key=lambda r: (r["member_name"], r["date"]))
+    return rows
+
+
+def write_csv(rows: List[Dict[str, Any]], path: str) -> str:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generator data klub Strava sintetis (CSV)")
+    parser.add_argument("--members", type=int, default=20)
+    parser.add_argument("--activities", type=int, default=30, help="Aktivitas per member")
+    parser.add_argument("--days", type=int, default=365, help="Rentang tanggal ke belakang dari hari ini")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="./cache/synthetic_club.csv")
+    args = parser.parse_args()
+
+    rows = generate_rows(args.members, args.activities, args.days, args.seed)
+    write_csv(rows, args.out)
+    print(f"{len(rows)} baris ({args.members} member) ditulis ke {args.out}")
+
+
+if __name__ == "__main__":
+    main()